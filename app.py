@@ -4,11 +4,12 @@ from dotenv import load_dotenv
 import os
 from db import (
     init_db, add_patient, get_patients, get_patient_by_id,
-    add_encounter, get_encounters, add_document, get_documents,
+    add_encounter, get_encounters, add_document, get_documents, get_document_texts,
     add_ai_log, get_ai_logs, add_ai_conversation_entry, get_ai_conversation_history,
     get_encounter_counts_by_type, get_patient_age_distribution, get_recent_patient_activity
 )
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor # For running the report queries side by side
 import shutil # For file operations
 from PIL import Image # For image processing
 import pytesseract # For OCR (if Tesseract is installed and path configured)
@@ -48,11 +49,40 @@ section = st.sidebar.radio(
     ]
 )
 
+# --- Cached Readers ---
+# Every widget interaction reruns the script; these reads are served from cache within the TTL
+# and dropped explicitly after the writes that change them.
+@st.cache_data(ttl=60, show_spinner=False)
+def _cached_get_patients():
+    return get_patients()
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _cached_encounter_counts():
+    return get_encounter_counts_by_type()
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _cached_age_distribution():
+    return get_patient_age_distribution()
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _cached_recent_activity(limit):
+    return get_recent_patient_activity(limit=limit)
+
+def invalidate_patients():
+    """Drop cached patient reads after a patient is registered."""
+    _cached_get_patients.clear()
+    _cached_age_distribution.clear()
+
+def invalidate_encounters():
+    """Drop cached encounter aggregates after an encounter is added."""
+    _cached_encounter_counts.clear()
+    _cached_recent_activity.clear()
+
 # --- Helper Function for Patient Selection (to avoid repetition) ---
 def get_selected_patient(key_prefix):
     """Helper to get selected patient and their ID for various sections."""
-    patients = get_patients()
-    patient_options = {f"{row['name']} (ID: {row['id']})": row['id'] for _, row in patients.iterrows()}
+    patients = _cached_get_patients()
+    patient_options = {f"{name} (ID: {pid})": pid for name, pid in zip(patients['name'].tolist(), patients['id'].tolist())}
 
     if not patient_options:
         st.info("No patients registered yet. Please register a patient in 'Patient Management' first.")
@@ -64,7 +94,7 @@ def get_selected_patient(key_prefix):
         key=f"{key_prefix}_patient_select"
     )
     patient_id = patient_options[selected_display]
-    patient_info = get_patient_by_id(patient_id) # This returns a Series or None
+    patient_info = get_patient_by_id(patient_id) # This returns a dict or None
     return patient_id, patient_info, patients # Return patients df too for consistency
 
 # --- Section: Patient Management ---
@@ -82,11 +112,12 @@ if section == "Patient Management":
 
             if submit_patient and name:
                 add_patient(name, dob, gender, contact, address)
+                invalidate_patients()
                 st.success(f"Patient '{name}' registered successfully.")
                 st.rerun() # Rerun to update the patient list immediately
 
     st.subheader("All Patients")
-    patients_df = get_patients()
+    patients_df = _cached_get_patients()
     if not patients_df.empty:
         st.dataframe(patients_df, use_container_width=True)
     else:
@@ -124,8 +155,12 @@ elif section == "Patient Timeline":
                 if not consults.empty:
                     # Create display options for selectbox, including a snippet of notes
                     consult_options = {
-                        f"{row['date'].strftime('%Y-%m-%d')} - {row['notes'][:70]}...": row['id']
-                        for _, row in consults.iterrows()
+                        f"{date} - {notes}...": cid
+                        for date, notes, cid in zip(
+                            pd.to_datetime(consults['date']).dt.strftime('%Y-%m-%d').tolist(),
+                            consults['notes'].str[:70].tolist(),
+                            consults['id'].tolist()
+                        )
                     }
                     selected_consult_display = st.selectbox(
                         "Select Previous Consultation to Follow Up",
@@ -158,6 +193,7 @@ elif section == "Patient Timeline":
                     st.success("Follow-up added.")
                 else:
                     st.warning("Please select a consultation to follow up, or switch to 'New Consultation'.")
+                invalidate_encounters()
                 st.rerun() # Rerun to update the encounter list
 
         st.subheader("Patient Encounters")
@@ -190,8 +226,12 @@ elif section == "AI Tools (Document Analysis & Chat)":
         selected_consult_id = None
         if not consults.empty:
             consult_options = {
-                f"{row['date'].strftime('%Y-%m-%d')} - {row['notes'][:50]}...": row['id']
-                for _, row in consults.iterrows()
+                f"{date} - {notes}...": cid
+                for date, notes, cid in zip(
+                    pd.to_datetime(consults['date']).dt.strftime('%Y-%m-%d').tolist(),
+                    consults['notes'].str[:50].tolist(),
+                    consults['id'].tolist()
+                )
             }
             selected_consult_display = st.selectbox(
                 "Select Consultation this upload/scan pertains to",
@@ -247,11 +287,15 @@ elif section == "AI Tools (Document Analysis & Chat)":
             # Get all previous uploads and their extracted text for RAG
             previous_uploads_text = []
             docs_df = get_documents(patient_id)
-            for _, doc_row in docs_df.iterrows():
+            doc_texts = get_document_texts(docs_df['id'].tolist())
+            upload_times = pd.to_datetime(docs_df['upload_time']).dt.strftime('%Y-%m-%d %H:%M').tolist()
+            for doc_id, doc_type, doc_path, upload_time in zip(
+                docs_df['id'].tolist(), docs_df['type'].tolist(), docs_df['file_path'].tolist(), upload_times
+            ):
                 # Exclude the current upload if it's already processed
-                if file_path_saved and os.path.abspath(doc_row['file_path']) == os.path.abspath(file_path_saved):
+                if file_path_saved and os.path.abspath(doc_path) == os.path.abspath(file_path_saved):
                     continue
-                previous_uploads_text.append(f"Previous Document (Type: {doc_row['type']}, Upload Time: {doc_row['upload_time'].strftime('%Y-%m-%d %H:%M')}, File: {os.path.basename(doc_row['file_path'])}):\n{doc_row['text_content']}")
+                previous_uploads_text.append(f"Previous Document (Type: {doc_type}, Upload Time: {upload_time}, File: {os.path.basename(doc_path)}):\n{doc_texts.get(doc_id)}")
             uploads_context = "\n\n".join(previous_uploads_text) if previous_uploads_text else "No previous documents."
 
             current_report_content = file_text_extracted or report_text_input
@@ -414,22 +458,28 @@ elif section == "Reports & Analytics":
     st.header("Clinical Reports & Analytics")
     st.write("Gain insights into patient data and encounter trends.")
 
+    # The three report queries are independent; each runs on its own DuckDB cursor, so fetch them concurrently
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        encounter_counts_future = pool.submit(_cached_encounter_counts)
+        age_distribution_future = pool.submit(_cached_age_distribution)
+        recent_activity_future = pool.submit(_cached_recent_activity, 10)
+        encounter_counts_df = encounter_counts_future.result()
+        age_distribution_df = age_distribution_future.result()
+        recent_activity_df = recent_activity_future.result()
+
     st.subheader("Encounter Type Distribution")
-    encounter_counts_df = get_encounter_counts_by_type()
     if not encounter_counts_df.empty:
         st.bar_chart(encounter_counts_df.set_index('type'), use_container_width=True)
     else:
         st.info("No encounter data to display charts.")
 
     st.subheader("Patient Age Distribution")
-    age_distribution_df = get_patient_age_distribution()
     if not age_distribution_df.empty:
         st.bar_chart(age_distribution_df.set_index('age_group'), use_container_width=True)
     else:
         st.info("No patient age data to display charts.")
 
     st.subheader("Recent Patient Activity (Last 10 Encounters)")
-    recent_activity_df = get_recent_patient_activity(limit=10)
     if not recent_activity_df.empty:
         # Format date for better display
         recent_activity_df['encounter_date'] = recent_activity_df['encounter_date'].dt.strftime('%Y-%m-%d')
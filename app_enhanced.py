@@ -1,22 +1,26 @@
 import streamlit as st
-import openai
 from dotenv import load_dotenv
 import os
 import pandas as pd
-from datetime import datetime, timedelta
-import plotly.express as px
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
+import numpy as np
+from datetime import datetime, timedelta, date
 import base64
 import mimetypes
 import PyPDF2
 from PIL import Image
 import io
+import hashlib
+import html
+import json
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 # Import custom modules
 from auth import (
     login_user, register_user, logout, get_current_user, require_auth,
-    require_role, get_user_role, log_audit_event, get_audit_logs
+    require_role, get_user_role, log_audit_event, get_audit_logs,
+    flush_audit_log, AUDIT_FILE
 )
 from ui_components import (
     set_custom_theme, modern_metric_card, patient_summary_card,
@@ -25,12 +29,13 @@ from ui_components import (
 )
 from db import (
     init_db, add_patient_enhanced, update_patient, get_patients, get_patient_by_id,
-    add_encounter, get_encounters, add_document, get_documents,
+    add_encounter, get_encounters, add_document, get_documents, get_document_text, get_document_texts,
+    get_patient_bundle,
     add_ai_log, get_ai_logs, add_ai_conversation_entry, get_ai_conversation_history,
     get_encounter_counts_by_type, get_patient_age_distribution, get_recent_patient_activity,
     add_medication, get_medications, add_prescription, get_prescriptions,
-    check_medication_interactions, add_appointment, get_appointments, update_appointment_status,
-    add_lab_result, get_lab_results, add_allergy, get_allergies, add_immunization,
+    check_medication_interactions, add_appointment, get_appointments,
+    update_appointment_status_bulk, add_lab_result, get_lab_results, add_allergy, get_allergies, add_immunization,
     get_immunizations, get_prescription_analytics, get_appointment_analytics
 )
 
@@ -39,14 +44,206 @@ load_dotenv()
 openai_api_key = os.getenv("OPENAI_API_KEY")
 
 # Initialize OpenAI client
-if openai_api_key:
-    client = openai.OpenAI(api_key=openai_api_key)
-else:
-    client = None
+# Streamlit re-executes this module on every rerun, so the client and its
+# pooled HTTP connections are built once per process via cache_resource.
+@st.cache_resource
+def get_openai_client():
+    """Return the shared OpenAI client, or None when no API key is configured."""
+    if not openai_api_key:
+        return None
+    # Imported here so pages that never call the model don't pay for the SDK import
+    import httpx
+    import openai
+
+    # A persistent, pooled HTTP client keeps TLS connections alive between the
+    # many sequential analysis calls a session makes.
+    http_client = httpx.Client(
+        limits=httpx.Limits(max_keepalive_connections=20, max_connections=50, keepalive_expiry=60.0),
+        http2=True,
+        timeout=httpx.Timeout(60.0, connect=5.0)
+    )
+    return openai.OpenAI(api_key=openai_api_key, http_client=http_client)
+
+@st.cache_resource
+def get_ai_request_executor():
+    """Worker pool for OpenAI requests, so identical in-flight calls can share one future."""
+    return ThreadPoolExecutor(max_workers=8)
+
+ai_request_executor = get_ai_request_executor()
 
 # Initialize database
 init_db()
 
+# Cached data loaders: every widget interaction reruns the whole script, so
+# read-mostly queries are served from cache and cleared after each write.
+@st.cache_data(ttl=60, show_spinner=False)
+def _cached_get_patients():
+    df = get_patients()
+    # Birthday-aware age for every patient in one vectorised pass
+    dob = pd.to_datetime(df['dob'])
+    today = pd.Timestamp(date.today())
+    before_birthday = (dob.dt.month > today.month) | ((dob.dt.month == today.month) & (dob.dt.day > today.day))
+    df['age'] = (today.year - dob.dt.year - before_birthday.astype(int)).astype('Int64')
+    return df
+
+@st.cache_data(ttl=60)
+def _cached_get_appointments(patient_id=None, provider_id=None, status=None):
+    df = get_appointments(patient_id, provider_id, status)
+    # Parse once here so "today" filters are a single datetime64 comparison
+    df['appointment_dt'] = pd.to_datetime(df['appointment_date'])
+    df['appointment_day'] = df['appointment_dt'].values.astype('datetime64[D]')
+    df['time_str'] = df['appointment_dt'].dt.strftime('%I:%M %p')
+    return df
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _cached_get_medications():
+    return get_medications()
+
+@st.cache_data(ttl=60)
+def _cached_get_prescriptions(patient_id, status=None):
+    return get_prescriptions(patient_id, status)
+
+@st.cache_data(ttl=60)
+def _cached_get_lab_results(patient_id):
+    """Lab results plus positional indices per category, cached together so they always match."""
+    df = get_lab_results(patient_id)
+    return df, df.groupby('test_category').indices
+
+@st.cache_data(ttl=60)
+def _cached_get_allergies(patient_id, status='active'):
+    return get_allergies(patient_id, status)
+
+@st.cache_data(ttl=60)
+def _cached_get_immunizations(patient_id):
+    return get_immunizations(patient_id)
+
+@st.cache_data(ttl=300, show_spinner=False)
+def _cached_get_patient_by_id(patient_id):
+    return get_patient_by_id(patient_id)
+
+@st.cache_data(ttl=300, show_spinner=False)
+def _cached_get_encounters(patient_id, limit=None):
+    return get_encounters(patient_id, limit)
+
+@st.cache_data(ttl=300, show_spinner=False)
+def _cached_get_documents(patient_id, limit=None):
+    return get_documents(patient_id, limit)
+
+@st.cache_data(ttl=600, show_spinner=False)
+def _cached_get_document_text(document_id):
+    # Document text is never edited after upload, so this needs no invalidation
+    return get_document_text(document_id)
+
+@st.cache_data(ttl=300, show_spinner=False)
+def _cached_get_patient_bundle(patient_id):
+    return get_patient_bundle(patient_id)
+
+@st.cache_data(ttl=600, show_spinner=False)
+def _cached_get_ai_conversation_history(patient_id):
+    return get_ai_conversation_history(patient_id)
+
+@st.cache_data(ttl=30, show_spinner=False)
+def _cached_audit_logs(mtime, limit):
+    """Audit log tail keyed by the file's mtime, so new events bust the cache."""
+    return pd.DataFrame(get_audit_logs(limit))
+
+def audit_log_mtime():
+    """Flush buffered audit events and return the log's mtime, used as the audit cache key."""
+    flush_audit_log()
+    return os.path.getmtime(AUDIT_FILE) if os.path.exists(AUDIT_FILE) else 0
+
+@st.cache_data(ttl=30, show_spinner=False)
+def _audit_filter_options(mtime, column, _logs):
+    """Sorted distinct values of an audit column, recomputed only when the log changes."""
+    return sorted(_logs[column].dropna().unique().tolist())
+
+def invalidate_documents():
+    """Drop cached document reads after a document write; other per-patient caches stay warm."""
+    _cached_get_documents.clear()
+    _cached_get_patient_bundle.clear()
+
+def invalidate_encounters():
+    """Drop cached encounter reads, and the aggregates built on them, after an encounter write."""
+    _cached_get_encounters.clear()
+    _cached_get_patient_bundle.clear()
+    _cached_encounter_counts.clear()
+    _cached_recent_activity.clear()
+
+def invalidate_appointments():
+    """Drop cached appointment reads and the appointment analytics after an appointment write."""
+    _cached_get_appointments.clear()
+    _cached_appointment_analytics.clear()
+
+@st.cache_data(ttl=300)
+def _cached_interactions(medication_ids):
+    """Interaction lookup keyed by a sorted tuple so prescription order doesn't matter."""
+    return check_medication_interactions(list(medication_ids))
+
+# Analytics readers: read-only aggregates shared by every analytics rerun
+@st.cache_data(ttl=60, show_spinner=False)
+def _cached_age_distribution():
+    return get_patient_age_distribution()
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _cached_encounter_counts():
+    return get_encounter_counts_by_type()
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _cached_recent_activity(limit):
+    return get_recent_patient_activity(limit)
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _cached_prescription_analytics():
+    return get_prescription_analytics()
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _cached_appointment_analytics():
+    return get_appointment_analytics()
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _cached_demographics():
+    """Gender counts and daily new-patient registrations for the demographics tab."""
+    patients = _cached_get_patients()
+    gender_counts = patients['gender'].value_counts()
+    new_patients_by_month = None
+    if 'created_at' in patients.columns:
+        # Floor to days in datetime64 so value_counts hashes int64, not date objects
+        created = pd.to_datetime(patients['created_at'], errors='coerce').dt.floor('D')
+        new_patients_by_month = created.value_counts().sort_index().rename_axis('created_date').reset_index(name='new_patients')
+    return gender_counts, new_patients_by_month
+
+def preload_analytics():
+    """Warm every analytics reader concurrently so tabs don't wait on them one by one."""
+    # Readers are cached for 60s, so within that window there is nothing left to warm
+    now = time.monotonic()
+    if now - st.session_state.get('analytics_preloaded_at', float('-inf')) < 60:
+        return
+    st.session_state.analytics_preloaded_at = now
+    readers = [
+        _cached_get_patients, _cached_age_distribution, _cached_encounter_counts,
+        lambda: _cached_recent_activity(30), _cached_prescription_analytics,
+        _cached_get_medications, _cached_appointment_analytics,
+    ]
+    with ThreadPoolExecutor(max_workers=len(readers)) as pool:
+        for future in [pool.submit(reader) for reader in readers]:
+            future.result()
+
+def build_patient_options(patients_df):
+    """Build {"Name (ID: n)": id} selectbox options by zipping the column arrays instead of iterrows."""
+    names = patients_df['name'].to_numpy()
+    ids = patients_df['id'].to_numpy()
+    return {f"{n} (ID: {i})": int(i) for n, i in zip(names, ids)}
+
+def get_patient_options():
+    """Return {label: patient_id} selectbox options built from the cached patient list."""
+    return build_patient_options(_cached_get_patients())
+
+def get_today_appts():
+    """Return (scheduled appointments, the subset falling on today) from one cached query."""
+    scheduled = _cached_get_appointments(status="scheduled")
+    today = np.datetime64(datetime.now().date(), 'D')
+    return scheduled, scheduled[scheduled['appointment_day'] == today]
+
 # Page configuration
 st.set_page_config(
     layout="wide",
@@ -105,9 +302,40 @@ def show_login_page():
                     else:
                         st.error(message)
 
+def calculate_age(dob):
+    """Calculate a patient's age in whole years from their date of birth."""
+    if pd.isna(dob):
+        return "N/A"
+    today = date.today()
+    return today.year - dob.year - ((today.month, today.day) < (dob.month, dob.day))
+
+def create_ai_response(**request):
+    """
+    Call the OpenAI Responses API, collapsing duplicate requests.
+    A double-clicked button reruns the script with the same request while the
+    first call is still in flight; the rerun waits on the existing future
+    instead of paying for a second identical call.
+    """
+    request_hash = hashlib.blake2b(
+        json.dumps(request, sort_keys=True, default=str).encode(), digest_size=16
+    ).hexdigest()
+    inflight = st.session_state.setdefault('inflight', {})
+
+    future = inflight.get(request_hash)
+    if future is None:
+        future = ai_request_executor.submit(get_openai_client().responses.create, **request)
+        inflight[request_hash] = future
+        future.add_done_callback(lambda _: inflight.pop(request_hash, None))
+
+    return future.result()
+
 # Document Processing Functions
-def process_document(uploaded_file):
-    """Process different document types and extract content."""
+def process_document(uploaded_file, need_vision=False):
+    """
+    Process different document types and extract content.
+    Images are only re-encoded to base64 when need_vision is True, i.e. when
+    the caller is going to send the pixels to a vision model.
+    """
     file_content = ""
     file_metadata = {
         "name": uploaded_file.name,
@@ -144,7 +372,7 @@ def process_document(uploaded_file):
             return file_content, file_metadata, "pdf"
 
         elif uploaded_file.type.startswith("image/"):
-            # Process image files
+            # Process image files (Image.open is lazy; only the header is read here)
             image = Image.open(io.BytesIO(uploaded_file.read()))
 
             # Basic image metadata
@@ -160,9 +388,11 @@ def process_document(uploaded_file):
 
             # For medical images, we'll use OCR or base64 encoding for AI analysis
             # Convert image to base64 for API submission
-            buffered = io.BytesIO()
-            image.save(buffered, format=image.format or "PNG")
-            img_str = base64.b64encode(buffered.getvalue()).decode()
+            img_str = None
+            if need_vision:
+                buffered = io.BytesIO()
+                image.save(buffered, format=image.format or "PNG")
+                img_str = base64.b64encode(buffered.getvalue()).decode()
 
             # Extract some basic image info
             file_content = f"""
@@ -174,8 +404,9 @@ Image Mode: {image.mode}
 File Size: {uploaded_file.size / 1024:.1f} KB
 
 Note: This is a medical image that requires visual analysis for diagnostic purposes.
-The image has been encoded for AI vision analysis.
             """.strip()
+            if img_str:
+                file_content += "\nThe image has been encoded for AI vision analysis."
 
             return file_content, file_metadata, "image", img_str
 
@@ -184,16 +415,184 @@ The image has been encoded for AI vision analysis.
 
     return None, file_metadata, "unknown"
 
-def get_document_analysis_prompt(file_content, file_metadata, patient_info, doc_type):
-    """Generate enhanced analysis prompt based on document type and patient context."""
+# Static chat system prompt. Kept identical across requests so the provider can
+# reuse the cached prompt prefix; patient-specific context goes in a separate message.
+CHAT_SYSTEM_PROMPT = """
+You are an expert clinical AI assistant with specialized knowledge in diagnostics, treatment planning, and clinical decision support.
+
+CLINICAL GUIDELINES:
+1. **Diagnostic Excellence**: Consider differential diagnoses systematically, from common to rare conditions
+2. **Safety First**: Always identify red flag symptoms and conditions requiring urgent attention
+3. **Evidence-Based**: Provide clinical reasoning based on current medical guidelines and evidence
+4. **Context-Aware**: Consider patient age, gender, comorbidities, and medical history
+5. **Risk Assessment**: Evaluate potential risks, benefits, and contraindications for recommendations
+
+RESPONSE REQUIREMENTS:
+- Provide specific, actionable clinical insights rather than general advice
+- When discussing diagnoses, explain the reasoning and key diagnostic criteria
+- Highlight any abnormal values or critical findings that need attention
+- Suggest specific follow-up tests, referrals, or monitoring parameters
+- Consider medication interactions, allergies, and contraindications
+- Provide differential diagnoses with likelihood ranking when appropriate
+- Include evidence levels for recommendations where applicable
+
+SAFETY PROTOCOLS:
+- Always include "Red Flag Warning" section for symptoms requiring immediate care
+- Specify when emergency care is warranted
+- Recommend specialist consultation when appropriate
+- Consider drug-gene interactions and pharmacogenomics when relevant
+
+PROFESSIONAL RESPONSIBILITY:
+- Use clear, professional medical terminology while explaining complex concepts
+- Provide references to clinical guidelines when possible
+- Encourage shared decision-making with patients
+- Maintain patient-centered approach in all recommendations
+
+Remember: You are assisting a qualified healthcare professional. Provide insights that enhance their clinical judgment while respecting their ultimate authority in patient care decisions.
+""".strip()
+
+# Analysis prompt suffixes, appended to the shared document context.
+ANALYSIS_SUFFIXES = {
+    "Quick Summary": """
+
+Provide a concise, bulleted summary focusing on:
+1. Most important findings (top 3-5)
+2. Critical values requiring immediate attention
+3. Overall clinical impression
+4. Key recommendations
+
+Keep it brief but comprehensive for quick clinical review.
+""",
+    "Diagnostic Focus": """
+
+Focus specifically on DIAGNOSTIC INSIGHTS:
+1. Most likely diagnoses based on these findings
+2. Differential diagnoses to consider
+3. Key diagnostic criteria present or absent
+4. Recommended confirmatory tests
+5. Red flag symptoms or findings that require urgent evaluation
+
+Provide detailed reasoning for each diagnostic consideration.
+""",
+    "Risk Assessment": """
+
+Focus specifically on RISK ASSESSMENT:
+1. High-risk findings and their clinical significance
+2. Mortality/morbidity risk assessment
+3. Risk of complications or deterioration
+4. Factors that increase or decrease risk
+5. Recommended monitoring and follow-up based on risk level
+6. Emergency warning signs
+
+Quantify risk where possible (low/medium/high risk).
+""",
+    "Treatment Recommendations": """
+
+Focus specifically on TREATMENT RECOMMENDATIONS:
+1. Evidence-based treatment options for identified conditions
+2. Medication considerations (dosages, contraindications)
+3. Lifestyle interventions
+4. Referral recommendations
+5. Follow-up schedule and monitoring parameters
+6. Patient education points
+
+Note: These are suggestions for clinical consideration - use professional judgment.
+""",
+}
+
+MULTI_DOCUMENT_ANALYSIS_SUFFIXES = {
+    "Quick Summary": """
+
+Provide a comprehensive summary of all documents combined:
+
+1. **Key Findings Across All Documents**: List the most important findings from all documents
+2. **Cross-Document Patterns**: Identify correlations or patterns between different documents
+3. **Critical Values**: Highlight any abnormal or critical values found
+4. **Overall Clinical Picture**: Provide a consolidated clinical overview
+5. **Priority Recommendations**: List the most important follow-up actions
+
+Focus on insights that come from analyzing multiple documents together rather than individually.
+""",
+    "Diagnostic Focus": """
+
+Provide a comprehensive diagnostic analysis considering all documents:
 
-    base_context = f"""
+1. **Primary Diagnostic Considerations**: Most likely diagnoses based on collective findings
+2. **Supporting Evidence**: Which findings support each diagnostic consideration from which documents
+3. **Cross-Referenced Findings**: How findings in one document support or contradict findings in others
+4. **Diagnostic Workup Plan**: Recommended tests to confirm or rule out diagnoses
+5. **Red Flag Analysis**: Any urgent findings requiring immediate attention across all documents
+6. **Specialist Referrals**: Which specialists should be consulted based on combined findings
+
+Emphasize how the combination of documents provides a more complete diagnostic picture.
+""",
+    "Risk Assessment": """
+
+Provide a comprehensive risk assessment based on all documents:
+
+1. **High-Risk Findings**: Critical values or findings across all documents
+2. **Mortality/Morbidity Risk**: Overall risk assessment considering all factors
+3. **Complication Risk**: Risk of adverse outcomes based on combined findings
+4. **Medication Risks**: Any identified contraindications, interactions, or warnings
+5. **Lifestyle Risks**: Risk factors identified from the documents
+6. **Monitoring Requirements**: What needs to be monitored based on risk level
+7. **Emergency Indicators**: Symptoms or findings requiring immediate medical attention
+
+Quantify risk levels (low/medium/high) where possible.
+""",
+    "Treatment Recommendations": """
+
+Provide comprehensive treatment recommendations based on all documents:
+
+1. **Evidence-Based Treatment Options**: Recommended treatments based on findings
+2. **Medication Recommendations**: Specific medications, dosages, and considerations
+3. **Lifestyle Interventions**: Recommended lifestyle changes based on findings
+4. **Therapeutic Priorities**: Which issues to address first based on severity
+5. **Follow-Up Schedule**: Recommended timeline for monitoring and reassessment
+6. **Referral Network**: Which specialists should be involved in care
+7. **Patient Education Topics**: Key education points for the patient
+
+Note all treatments should be considered in the context of the complete clinical picture from all documents.
+""",
+    "Comprehensive Analysis": """
+
+Provide a comprehensive multi-document analysis:
+
+1. **Document Overview**: Summary of each document type and its purpose
+2. **Integrated Findings**: How findings across documents create a complete picture
+3. **Key Abnormalities**: All abnormal values and their clinical significance
+4. **Diagnostic Insights**: What conditions or diagnoses are suggested
+5. **Correlations**: How findings in different documents relate to each other
+6. **Risk Assessment**: Overall clinical risk based on all findings
+7. **Recommendations**: Consolidated recommendations for next steps
+8. **Urgent Findings**: Anything requiring immediate attention
+9. **Data Quality Assessment**: Any gaps or inconsistencies in the documentation
+
+Provide a structured analysis that synthesizes information from all documents into actionable clinical insights.
+""",
+}
+
+def build_clinical_context(patient_info):
+    """Build the CLINICAL CONTEXT block shared by every document prompt for a patient."""
+    return f"""
 CLINICAL CONTEXT:
-Patient: {patient_info['name']}, {datetime.now().year - patient_info['dob'].year} years old, {patient_info['gender']}
+Patient: {patient_info['name']}, {patient_info['age']} years old, {patient_info['gender']}
 Patient ID: {patient_info['id']}
 Contact: {patient_info['contact']}
 Address: {patient_info['address']}
+"""
 
+def get_clinical_context(patient_id, patient_info):
+    """Return the patient's clinical context, building it once per session."""
+    context_cache = st.session_state.setdefault('clinical_context_cache', {})
+    if patient_id not in context_cache:
+        context_cache[patient_id] = build_clinical_context(patient_info)
+    return context_cache[patient_id]
+
+def get_document_analysis_prompt(file_content, file_metadata, clinical_context, doc_type):
+    """Generate enhanced analysis prompt based on document type and patient context."""
+
+    base_context = clinical_context + f"""
 DOCUMENT INFORMATION:
 Type: {doc_type.upper()}
 Filename: {file_metadata['name']}
@@ -261,70 +660,19 @@ Please provide a comprehensive, structured analysis that would be valuable for c
 
 def perform_document_analysis(patient_id, patient_info, file_content, file_metadata, doc_type, img_base64, analysis_type):
     """Perform AI analysis of uploaded document using OpenAI Responses API."""
+    client = get_openai_client()
     if not client:
         st.error("❌ OpenAI API not configured. Please set OPENAI_API_KEY environment variable.")
         return
 
-    with st.spinner(f"🧠 AI performing {analysis_type.lower()}..."):
-        try:
+    try:
+        with st.status(f"🧠 AI performing {analysis_type.lower()}...", expanded=True) as status:
+            status.write("📝 Building prompt...")
             # Generate tailored prompt based on analysis type
-            base_prompt = get_document_analysis_prompt(file_content, file_metadata, patient_info, doc_type)
-
-            if analysis_type == "Quick Summary":
-                analysis_prompt = f"""
-{base_prompt}
+            clinical_context = get_clinical_context(patient_id, patient_info)
+            base_prompt = get_document_analysis_prompt(file_content, file_metadata, clinical_context, doc_type)
 
-Provide a concise, bulleted summary focusing on:
-1. Most important findings (top 3-5)
-2. Critical values requiring immediate attention
-3. Overall clinical impression
-4. Key recommendations
-
-Keep it brief but comprehensive for quick clinical review.
-                """
-            elif analysis_type == "Diagnostic Focus":
-                analysis_prompt = f"""
-{base_prompt}
-
-Focus specifically on DIAGNOSTIC INSIGHTS:
-1. Most likely diagnoses based on these findings
-2. Differential diagnoses to consider
-3. Key diagnostic criteria present or absent
-4. Recommended confirmatory tests
-5. Red flag symptoms or findings that require urgent evaluation
-
-Provide detailed reasoning for each diagnostic consideration.
-                """
-            elif analysis_type == "Risk Assessment":
-                analysis_prompt = f"""
-{base_prompt}
-
-Focus specifically on RISK ASSESSMENT:
-1. High-risk findings and their clinical significance
-2. Mortality/morbidity risk assessment
-3. Risk of complications or deterioration
-4. Factors that increase or decrease risk
-5. Recommended monitoring and follow-up based on risk level
-6. Emergency warning signs
-
-Quantify risk where possible (low/medium/high risk).
-                """
-            elif analysis_type == "Treatment Recommendations":
-                analysis_prompt = f"""
-{base_prompt}
-
-Focus specifically on TREATMENT RECOMMENDATIONS:
-1. Evidence-based treatment options for identified conditions
-2. Medication considerations (dosages, contraindications)
-3. Lifestyle interventions
-4. Referral recommendations
-5. Follow-up schedule and monitoring parameters
-6. Patient education points
-
-Note: These are suggestions for clinical consideration - use professional judgment.
-                """
-            else:  # Comprehensive Analysis
-                analysis_prompt = base_prompt
+            analysis_prompt = base_prompt + ANALYSIS_SUFFIXES.get(analysis_type, "")
 
             # Prepare messages for Responses API
             messages = [
@@ -339,7 +687,8 @@ Note: These are suggestions for clinical consideration - use professional judgme
             ]
 
             # Use OpenAI Responses API with chat history
-            response = client.responses.create(
+            status.write("🤖 Calling model...")
+            response = create_ai_response(
                 model="gpt-5-nano-2025-08-07",
                 input=messages,
                 store=True,  # Enable stateful context
@@ -347,41 +696,43 @@ Note: These are suggestions for clinical consideration - use professional judgme
             )
 
             ai_analysis = response.output_text
+            status.update(label="✅ Analysis complete", state="complete", expanded=False)
 
-            # Display the analysis
-            st.markdown("### 📊 AI Analysis Results")
-            st.markdown("---")
-            st.markdown(ai_analysis)
+        # Display the analysis
+        st.markdown("### 📊 AI Analysis Results")
+        st.markdown("---")
+        st.markdown(ai_analysis)
 
-            # Add warning disclaimer
-            st.warning("⚠️ **Clinical Disclaimer**: This AI analysis is for informational purposes only and should not replace professional medical judgment. Always use clinical expertise and consider patient context when making medical decisions.")
+        # Add warning disclaimer
+        st.warning("⚠️ **Clinical Disclaimer**: This AI analysis is for informational purposes only and should not replace professional medical judgment. Always use clinical expertise and consider patient context when making medical decisions.")
 
-            # Save analysis to patient record
-            try:
-                add_document(
-                    patient_id,
-                    None,  # No specific encounter_id for AI analysis
-                    doc_type,
-                    file_metadata['name'],  # Use filename as file_path
-                    ai_analysis  # Use AI analysis as text_content
-                )
-
-                # Log the analysis
-                log_audit_event(
-                    st.session_state.current_user['username'],
-                    "document_analysis",
-                    f"AI analysis of {doc_type} document for patient {patient_id}",
-                    patient_id
-                )
+        # Save analysis to patient record
+        try:
+            add_document(
+                patient_id,
+                None,  # No specific encounter_id for AI analysis
+                doc_type,
+                file_metadata['name'],  # Use filename as file_path
+                ai_analysis  # Use AI analysis as text_content
+            )
+            invalidate_documents()
+
+            # Log the analysis
+            log_audit_event(
+                st.session_state.current_user['username'],
+                "document_analysis",
+                f"AI analysis of {doc_type} document for patient {patient_id}",
+                patient_id
+            )
 
-                st.success("✅ Analysis saved to patient record")
+            st.success("✅ Analysis saved to patient record")
 
-            except Exception as save_error:
-                st.warning(f"Analysis completed but couldn't save to record: {save_error}")
+        except Exception as save_error:
+            st.warning(f"Analysis completed but couldn't save to record: {save_error}")
 
-        except Exception as e:
-            st.error(f"❌ AI Analysis failed: {str(e)}")
-            st.info("Please check your OpenAI API configuration and try again.")
+    except Exception as e:
+        st.error(f"❌ AI Analysis failed: {str(e)}")
+        st.info("Please check your OpenAI API configuration and try again.")
 
 def save_document_to_patient_record(patient_id, uploaded_file, file_metadata, doc_type):
     """Save uploaded document to patient record."""
@@ -412,6 +763,7 @@ Uploaded by: {st.session_state.current_user['username']}
             file_metadata['name'],  # Use filename as file_path
             doc_summary  # Use document summary as text_content
         )
+        invalidate_documents()
 
         st.success("✅ Document saved to patient record!")
         st.balloons()
@@ -429,15 +781,17 @@ Uploaded by: {st.session_state.current_user['username']}
 
 def perform_multi_document_analysis(patient_id, patient_info, selected_docs, analysis_type):
     """Perform AI analysis on multiple documents simultaneously."""
+    client = get_openai_client()
     if not client:
         st.error("❌ OpenAI API not configured. Please set OPENAI_API_KEY environment variable.")
         return
 
-    with st.spinner(f"🧠 AI analyzing {len(selected_docs)} document(s)..."):
-        try:
+    try:
+        with st.status(f"🧠 AI analyzing {len(selected_docs)} document(s)...", expanded=True) as status:
+            status.write("📝 Building prompt...")
             # Combine all documents into a comprehensive analysis prompt
             combined_content = f"MULTI-DOCUMENT ANALYSIS REQUEST\n{'='*60}\n\n"
-            combined_content += f"Patient: {patient_info['name']}, {datetime.now().year - patient_info['dob'].year} years old, {patient_info['gender']}\n"
+            combined_content += f"Patient: {patient_info['name']}, {patient_info['age']} years old, {patient_info['gender']}\n"
             combined_content += f"Analysis Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
             combined_content += f"Number of Documents: {len(selected_docs)}\n\n"
 
@@ -460,85 +814,9 @@ def perform_multi_document_analysis(patient_id, patient_info, selected_docs, ana
                 combined_content += "\n" + "-"*60 + "\n\n"
 
             # Generate tailored analysis prompt
-            if analysis_type == "Quick Summary":
-                analysis_prompt = f"""
-{combined_content}
-
-Provide a comprehensive summary of all documents combined:
-
-1. **Key Findings Across All Documents**: List the most important findings from all documents
-2. **Cross-Document Patterns**: Identify correlations or patterns between different documents
-3. **Critical Values**: Highlight any abnormal or critical values found
-4. **Overall Clinical Picture**: Provide a consolidated clinical overview
-5. **Priority Recommendations**: List the most important follow-up actions
-
-Focus on insights that come from analyzing multiple documents together rather than individually.
-                """
-            elif analysis_type == "Diagnostic Focus":
-                analysis_prompt = f"""
-{combined_content}
-
-Provide a comprehensive diagnostic analysis considering all documents:
-
-1. **Primary Diagnostic Considerations**: Most likely diagnoses based on collective findings
-2. **Supporting Evidence**: Which findings support each diagnostic consideration from which documents
-3. **Cross-Referenced Findings**: How findings in one document support or contradict findings in others
-4. **Diagnostic Workup Plan**: Recommended tests to confirm or rule out diagnoses
-5. **Red Flag Analysis**: Any urgent findings requiring immediate attention across all documents
-6. **Specialist Referrals**: Which specialists should be consulted based on combined findings
-
-Emphasize how the combination of documents provides a more complete diagnostic picture.
-                """
-            elif analysis_type == "Risk Assessment":
-                analysis_prompt = f"""
-{combined_content}
-
-Provide a comprehensive risk assessment based on all documents:
-
-1. **High-Risk Findings**: Critical values or findings across all documents
-2. **Mortality/Morbidity Risk**: Overall risk assessment considering all factors
-3. **Complication Risk**: Risk of adverse outcomes based on combined findings
-4. **Medication Risks**: Any identified contraindications, interactions, or warnings
-5. **Lifestyle Risks**: Risk factors identified from the documents
-6. **Monitoring Requirements**: What needs to be monitored based on risk level
-7. **Emergency Indicators**: Symptoms or findings requiring immediate medical attention
-
-Quantify risk levels (low/medium/high) where possible.
-                """
-            elif analysis_type == "Treatment Recommendations":
-                analysis_prompt = f"""
-{combined_content}
-
-Provide comprehensive treatment recommendations based on all documents:
-
-1. **Evidence-Based Treatment Options**: Recommended treatments based on findings
-2. **Medication Recommendations**: Specific medications, dosages, and considerations
-3. **Lifestyle Interventions**: Recommended lifestyle changes based on findings
-4. **Therapeutic Priorities**: Which issues to address first based on severity
-5. **Follow-Up Schedule**: Recommended timeline for monitoring and reassessment
-6. **Referral Network**: Which specialists should be involved in care
-7. **Patient Education Topics**: Key education points for the patient
-
-Note all treatments should be considered in the context of the complete clinical picture from all documents.
-                """
-            else:  # Comprehensive Analysis
-                analysis_prompt = f"""
-{combined_content}
-
-Provide a comprehensive multi-document analysis:
-
-1. **Document Overview**: Summary of each document type and its purpose
-2. **Integrated Findings**: How findings across documents create a complete picture
-3. **Key Abnormalities**: All abnormal values and their clinical significance
-4. **Diagnostic Insights**: What conditions or diagnoses are suggested
-5. **Correlations**: How findings in different documents relate to each other
-6. **Risk Assessment**: Overall clinical risk based on all findings
-7. **Recommendations**: Consolidated recommendations for next steps
-8. **Urgent Findings**: Anything requiring immediate attention
-9. **Data Quality Assessment**: Any gaps or inconsistencies in the documentation
-
-Provide a structured analysis that synthesizes information from all documents into actionable clinical insights.
-                """
+            analysis_prompt = combined_content + MULTI_DOCUMENT_ANALYSIS_SUFFIXES.get(
+                analysis_type, MULTI_DOCUMENT_ANALYSIS_SUFFIXES["Comprehensive Analysis"]
+            )
 
             # Use OpenAI Responses API
             messages = [
@@ -552,7 +830,8 @@ Provide a structured analysis that synthesizes information from all documents in
                 }
             ]
 
-            response = client.responses.create(
+            status.write("🤖 Calling model...")
+            response = create_ai_response(
                 model="gpt-5-nano-2025-08-07",
                 input=messages,
                 store=True,
@@ -560,49 +839,53 @@ Provide a structured analysis that synthesizes information from all documents in
             )
 
             ai_analysis = response.output_text
+            status.update(label="✅ Analysis complete", state="complete", expanded=False)
 
-            # Display the analysis
-            st.markdown("### 📊 Multi-Document AI Analysis Results")
-            st.markdown("---")
-            st.markdown(ai_analysis)
+        # Display the analysis
+        st.markdown("### 📊 Multi-Document AI Analysis Results")
+        st.markdown("---")
+        st.markdown(ai_analysis)
 
-            # Add warning disclaimer
-            st.warning("⚠️ **Clinical Disclaimer**: This AI analysis is for informational purposes only and should not replace professional medical judgment. Always use clinical expertise and consider patient context when making medical decisions.")
+        # Add warning disclaimer
+        st.warning("⚠️ **Clinical Disclaimer**: This AI analysis is for informational purposes only and should not replace professional medical judgment. Always use clinical expertise and consider patient context when making medical decisions.")
 
-            # Save analysis to patient record
-            try:
-                doc_names = ", ".join([doc['metadata']['name'] for doc in selected_docs])
-                total_size = sum(doc['metadata'].get('file_size', doc['metadata'].get('size', 0)) for doc in selected_docs if isinstance(doc['metadata'].get('file_size', doc['metadata'].get('size', 0)), (int, float)))
-                add_document(
-                    patient_id,
-                    None,  # No specific encounter_id for multi-document analysis
-                    f"AI Analysis - {analysis_type}",
-                    f"Multi-Document Analysis: {len(selected_docs)} documents",  # Use as file_path
-                    f"Analyzed documents: {doc_names}\n\n{ai_analysis}"  # Use as text_content
-                )
-
-                # Log the analysis
-                log_audit_event(
-                    st.session_state.current_user['username'],
-                    "multi_document_analysis",
-                    f"AI analysis of {len(selected_docs)} documents for patient {patient_id}",
-                    patient_id
-                )
+        # Save analysis to patient record
+        try:
+            doc_names = ", ".join([doc['metadata']['name'] for doc in selected_docs])
+            total_size = sum(doc['metadata'].get('file_size', doc['metadata'].get('size', 0)) for doc in selected_docs if isinstance(doc['metadata'].get('file_size', doc['metadata'].get('size', 0)), (int, float)))
+            add_document(
+                patient_id,
+                None,  # No specific encounter_id for multi-document analysis
+                f"AI Analysis - {analysis_type}",
+                f"Multi-Document Analysis: {len(selected_docs)} documents",  # Use as file_path
+                f"Analyzed documents: {doc_names}\n\n{ai_analysis}"  # Use as text_content
+            )
+            invalidate_documents()
+
+            # Log the analysis
+            log_audit_event(
+                st.session_state.current_user['username'],
+                "multi_document_analysis",
+                f"AI analysis of {len(selected_docs)} documents for patient {patient_id}",
+                patient_id
+            )
 
-                st.success("✅ Multi-document analysis saved to patient record")
+            st.success("✅ Multi-document analysis saved to patient record")
 
-            except Exception as save_error:
-                st.warning(f"Analysis completed but couldn't save to record: {save_error}")
+        except Exception as save_error:
+            st.warning(f"Analysis completed but couldn't save to record: {save_error}")
 
-        except Exception as e:
-            st.error(f"❌ Multi-document analysis failed: {str(e)}")
-            st.info("Please check your OpenAI API configuration and try again.")
+    except Exception as e:
+        st.error(f"❌ Multi-document analysis failed: {str(e)}")
+        st.info("Please check your OpenAI API configuration and try again.")
 
 def save_multiple_documents_to_record(patient_id, documents):
     """Save multiple documents to patient record."""
     success_count = 0
     error_count = 0
 
+    upload_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
     with st.spinner("💾 Saving documents to patient record..."):
         for doc in documents:
             try:
@@ -611,7 +894,7 @@ def save_multiple_documents_to_record(patient_id, documents):
 Document Type: {doc['type'].upper()}
 Filename: {doc['metadata']['name']}
 File Size: {doc['metadata'].get('file_size', doc['metadata'].get('size', 'N/A')) / 1024 if isinstance(doc['metadata'].get('file_size', doc['metadata'].get('size', 0)), (int, float)) else 'N/A'} KB
-Upload Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+Upload Date: {upload_date}
 Uploaded by: {st.session_state.current_user['username']}
 Session ID: {doc['session_id']}
 
@@ -634,6 +917,9 @@ Content Preview:
                 st.error(f"Failed to save {doc['metadata']['name']}: {str(e)}")
                 error_count += 1
 
+        if success_count > 0:
+            invalidate_documents()
+
         # Display results
         if success_count > 0:
             st.success(f"✅ Successfully saved {success_count} document(s) to patient record!")
@@ -656,7 +942,7 @@ def display_saved_documents_for_chat(patient_id):
         st.markdown("### 📚 Saved Patient Documents")
 
         # Get saved documents
-        saved_docs = get_documents(patient_id)
+        saved_docs = _cached_get_documents(patient_id)
 
         if saved_docs.empty:
             st.info("No saved documents found for this patient.")
@@ -670,30 +956,35 @@ def display_saved_documents_for_chat(patient_id):
         # Document selection interface
         selected_docs = []
 
-        for i, (_, doc) in enumerate(saved_docs.iterrows()):
+        doc_rows = saved_docs[['id', 'file_path', 'type', 'upload_time']]
+        for i, (doc_id, file_path, doc_type, upload_time) in enumerate(
+            doc_rows.itertuples(index=False, name=None)
+        ):
             col1, col2, col3 = st.columns([3, 1, 1])
 
             with col1:
                 # Document info
-                doc_title = f"📄 {doc['file_path']}"
-                if doc['type']:
-                    doc_title += f" ({doc['type']})"
+                doc_title = f"📄 {file_path}"
+                if doc_type:
+                    doc_title += f" ({doc_type})"
 
                 # Add date info
-                if hasattr(doc, 'upload_time') and pd.notna(doc['upload_time']):
-                    doc_title += f" - {doc['upload_time'].strftime('%Y-%m-%d')}"
+                if pd.notna(upload_time):
+                    doc_title += f" - {upload_time.strftime('%Y-%m-%d')}"
 
                 selected = st.checkbox(doc_title, key=f"saved_doc_{i}", help="Include in chat context")
 
                 if selected:
-                    selected_docs.append(doc)
+                    # Text is only loaded for the documents actually picked
+                    text_content = _cached_get_document_text(int(doc_id))
+                    selected_docs.append((doc_id, file_path, doc_type, text_content))
 
                     # Show document preview in expander
-                    with st.expander(f"Preview: {doc['file_path']}", expanded=False):
-                        if doc['text_content']:
-                            st.text_area("Content:", value=doc['text_content'][:1000], height=150, disabled=True, key=f"saved_content_{i}")
-                            if len(doc['text_content']) > 1000:
-                                st.caption(f"Showing first 1000 of {len(doc['text_content'])} characters")
+                    with st.expander(f"Preview: {file_path}", expanded=False):
+                        if text_content:
+                            st.text_area("Content:", value=text_content[:1000], height=150, disabled=True, key=f"saved_content_{i}")
+                            if len(text_content) > 1000:
+                                st.caption(f"Showing first 1000 of {len(text_content)} characters")
                         else:
                             st.info("No content preview available")
 
@@ -711,12 +1002,12 @@ def display_saved_documents_for_chat(patient_id):
                     if 'chat_context_documents' not in st.session_state:
                         st.session_state.chat_context_documents = []
 
-                    for doc in selected_docs:
+                    for doc_id, file_path, doc_type, text_content in selected_docs:
                         st.session_state.chat_context_documents.append({
-                            'id': doc['id'],
-                            'name': doc['file_path'],
-                            'type': doc['type'],
-                            'content': doc['text_content'] or "",
+                            'id': doc_id,
+                            'name': file_path,
+                            'type': doc_type,
+                            'content': text_content or "",
                             'added_time': datetime.now()
                         })
 
@@ -762,6 +1053,7 @@ def main():
 
     with col2:
         if st.button("🔄 Refresh Data"):
+            st.cache_data.clear()
             st.rerun()
 
     with col3:
@@ -813,6 +1105,52 @@ def main():
     elif section == "⚙️ Settings":
         show_settings()
 
+# HTML card templates, filled per row with format_map(row._asdict())
+_ACTIVITY_TPL = (
+    '<div style="padding: 0.75rem; background: #f8f9fa; border-radius: 8px; margin-bottom: 0.5rem;">'
+    '<strong>{patient_name}</strong> - {encounter_type}<br>'
+    '<small>{encounter_date} with Dr. {doctor}</small>'
+    '</div>'
+)
+_SCHEDULE_TPL = (
+    '<div style="padding: 0.75rem; background: #e8f5e8; border-radius: 8px; margin-bottom: 0.5rem;">'
+    '<strong>{time_str}</strong> - {patient_name}<br>'
+    '<small>{appointment_type} ({duration} min)</small>'
+    '</div>'
+)
+_INTERACTION_TPL = (
+    '<div style="padding: 1rem; background: #fff3cd; border-radius: 8px; margin-bottom: 0.5rem;">'
+    '<strong>{name}</strong><br>'
+    '<small>{interactions}</small>'
+    '</div>'
+)
+_CRITICAL_LAB_TPL = (
+    '<div style="padding: 1rem; background: #f8d7da; border-radius: 8px; margin-bottom: 0.5rem;">'
+    '<strong>{test_name}</strong>: {result_value} {unit}<br>'
+    '<small>Test Date: {performed_date} | Status: CRITICAL</small>'
+    '</div>'
+)
+_ALLERGY_TPL = (
+    '<div style="padding: 1rem; background: {color}20; border-left: 4px solid {color}; '
+    'border-radius: 8px; margin-bottom: 0.5rem;">'
+    '<strong>{allergen}</strong> ({allergen_type})<br>'
+    '<small>Reaction: {reaction} | Severity: {severity}</small>'
+    '{notes_html}'
+    '</div>'
+)
+_OVERDUE_IMM_TPL = (
+    '<div style="padding: 0.75rem; background: #f8d7da; border-radius: 8px; margin-bottom: 0.5rem;">'
+    '<strong>{vaccine_name}</strong> - Dose {dose_number}<br>'
+    '<small>Due: {next_due_date} (Overdue)</small>'
+    '</div>'
+)
+_UPCOMING_IMM_TPL = (
+    '<div style="padding: 0.75rem; background: #d1ecf1; border-radius: 8px; margin-bottom: 0.5rem;">'
+    '<strong>{vaccine_name}</strong> - Dose {dose_number}<br>'
+    '<small>Due: {next_due_date}</small>'
+    '</div>'
+)
+
 def show_dashboard():
     """Enhanced dashboard with key metrics and insights."""
     st.header("📊 Clinical Dashboard")
@@ -821,12 +1159,8 @@ def show_dashboard():
     col1, col2, col3, col4 = st.columns(4)
 
     # Get metrics
-    patients_df = get_patients()
-    appointments_df = get_appointments(status="scheduled")
-    today = datetime.now().date()
-    today_appointments = appointments_df[
-        pd.to_datetime(appointments_df['appointment_date']).dt.date == today
-    ]
+    patients_df = _cached_get_patients()
+    appointments_df, today_appointments = get_today_appts()
 
     with col1:
         modern_metric_card(
@@ -873,37 +1207,74 @@ def show_dashboard():
         st.subheader("📈 Recent Patient Activity")
         recent_activity = get_recent_patient_activity(5)
         if not recent_activity.empty:
-            for _, activity in recent_activity.iterrows():
-                st.markdown(f"""
-                <div style="padding: 0.75rem; background: #f8f9fa; border-radius: 8px; margin-bottom: 0.5rem;">
-                    <strong>{activity['patient_name']}</strong> - {activity['encounter_type']}<br>
-                    <small>{activity['encounter_date']} with Dr. {activity['doctor']}</small>
-                </div>
-                """, unsafe_allow_html=True)
+            activity_html = "".join(
+                _ACTIVITY_TPL.format_map(activity._asdict())
+                for activity in recent_activity.itertuples(index=False)
+            )
+            st.markdown(activity_html, unsafe_allow_html=True)
 
     with col2:
         st.subheader("📅 Today's Schedule")
         if not today_appointments.empty:
-            for _, apt in today_appointments.iterrows():
-                time_str = pd.to_datetime(apt['appointment_date']).strftime('%I:%M %p')
-                st.markdown(f"""
-                <div style="padding: 0.75rem; background: #e8f5e8; border-radius: 8px; margin-bottom: 0.5rem;">
-                    <strong>{time_str}</strong> - {apt['patient_name']}<br>
-                    <small>{apt['appointment_type']} ({apt['duration']} min)</small>
-                </div>
-                """, unsafe_allow_html=True)
+            schedule_html = "".join(
+                _SCHEDULE_TPL.format_map(apt._asdict())
+                for apt in today_appointments.itertuples(index=False)
+            )
+            st.markdown(schedule_html, unsafe_allow_html=True)
 
     # Notifications
     st.markdown("---")
     st.subheader("🔔 Notifications & Alerts")
     notification_system()
 
+@st.fragment
+def _patient_registry_fragment(filtered_patients):
+    """Registry table and selected-patient card; row selection reruns only this part."""
+    if not filtered_patients.empty:
+        # One table for the registry; the card and actions render only for the selected row
+        registry = filtered_patients[['id', 'name', 'contact']].reset_index(drop=True)
+        selection = st.dataframe(
+            registry,
+            hide_index=True,
+            use_container_width=True,
+            selection_mode="single-row",
+            on_select="rerun",
+            key="patient_registry_table"
+        )
+
+        selected_rows = selection.selection.rows
+        if selected_rows:
+            st.session_state.selected_patient_id = registry['id'].iloc[selected_rows[0]]
+
+        selected_id = st.session_state.get('selected_patient_id')
+        selected = filtered_patients[filtered_patients['id'] == selected_id]
+
+        if not selected.empty:
+            patient = selected.iloc[0]
+            with st.container():
+                patient_summary_card(patient.to_dict())
+
+                col1, col2, col3 = st.columns(3)
+                with col1:
+                    if st.button("📅 Schedule", key="schedule_selected_patient"):
+                        st.session_state.schedule_patient_id = patient['id']
+                with col2:
+                    if st.button("💊 Prescribe", key="prescribe_selected_patient"):
+                        st.session_state.prescribe_patient_id = patient['id']
+                with col3:
+                    if st.button("📊 Analytics", key="analytics_selected_patient"):
+                        st.session_state.analytics_patient_id = patient['id']
+        else:
+            st.caption("Select a patient in the table to view details and actions.")
+    else:
+        st.info("No patients found. Register your first patient above!")
+
 def show_patient_management():
     """Enhanced patient management interface."""
     st.header("👥 Patient Management")
 
     # Search functionality
-    patients_df = get_patients()
+    patients_df = _cached_get_patients()
     filtered_patients, search_term = smart_search_bar(
         patients_df, ['name', 'contact', 'address'], 'patients'
     )
@@ -913,41 +1284,44 @@ def show_patient_management():
 
     # Registration section
     with st.expander("➕ Register New Patient", expanded=False):
-        with st.form("register_patient_form"):
+        with st.form("register_patient_form", clear_on_submit=True):
             col1, col2 = st.columns(2)
 
             with col1:
-                name = st.text_input("Full Name *")
-                dob = st.date_input("Date of Birth *")
-                gender = st.selectbox("Gender *", ["Male", "Female", "Other"])
-                contact = st.text_input("Contact Number *")
-                email = st.text_input("Email Address")
+                name = st.text_input("Full Name *", key="register_name")
+                dob = st.date_input("Date of Birth *", key="register_dob")
+                gender = st.selectbox("Gender *", ["Male", "Female", "Other"], key="register_gender")
+                contact = st.text_input("Contact Number *", key="register_contact")
+                email = st.text_input("Email Address", key="register_email")
 
             with col2:
-                address = st.text_area("Address *")
-                emergency_contact = st.text_input("Emergency Contact")
-                blood_type = st.selectbox("Blood Type", ["", "A+", "A-", "B+", "B-", "AB+", "AB-", "O+", "O-"])
-                marital_status = st.selectbox("Marital Status", ["", "Single", "Married", "Divorced", "Widowed"])
-                employment = st.text_input("Employment")
+                address = st.text_area("Address *", key="register_address")
+                emergency_contact = st.text_input("Emergency Contact", key="register_emergency_contact")
+                blood_type = st.selectbox("Blood Type", ["", "A+", "A-", "B+", "B-", "AB+", "AB-", "O+", "O-"], key="register_blood_type")
+                marital_status = st.selectbox("Marital Status", ["", "Single", "Married", "Divorced", "Widowed"], key="register_marital_status")
+                employment = st.text_input("Employment", key="register_employment")
 
             col3, col4 = st.columns(2)
             with col3:
-                insurance_provider = st.text_input("Insurance Provider")
+                insurance_provider = st.text_input("Insurance Provider", key="register_insurance_provider")
             with col4:
-                insurance_policy = st.text_input("Policy Number")
+                insurance_policy = st.text_input("Policy Number", key="register_insurance_policy")
 
             submitted = st.form_submit_button("Register Patient", use_container_width=True)
 
             if submitted and all([name, dob, gender, contact, address]):
-                add_patient_enhanced(
+                new_patient_id = add_patient_enhanced(
                     name, dob, gender, contact, address,
                     emergency_contact, blood_type, marital_status,
                     employment, insurance_provider, insurance_policy
                 )
+                _cached_get_patients.clear()
+                _cached_demographics.clear()
                 log_audit_event(
                     st.session_state.current_user['username'],
                     "patient_registration",
-                    f"Registered new patient: {name}"
+                    f"Registered new patient: {name}",
+                    new_patient_id
                 )
                 st.success(f"Patient '{name}' registered successfully!")
                 st.rerun()
@@ -955,29 +1329,62 @@ def show_patient_management():
     # Patient list with enhanced display
     st.subheader("📋 Patient Registry")
 
-    if not filtered_patients.empty:
-        # Display patient cards
-        for _, patient in filtered_patients.iterrows():
-            with st.container():
-                patient_summary_card(patient.to_dict())
+    _patient_registry_fragment(filtered_patients)
 
-                col1, col2, col3, col4 = st.columns(4)
-                with col1:
-                    if st.button(f"📝 View Details", key=f"view_{patient['id']}"):
-                        st.session_state.selected_patient_id = patient['id']
-                with col2:
-                    if st.button("📅 Schedule", key=f"schedule_{patient['id']}"):
-                        st.session_state.schedule_patient_id = patient['id']
-                with col3:
-                    if st.button("💊 Prescribe", key=f"prescribe_{patient['id']}"):
-                        st.session_state.prescribe_patient_id = patient['id']
-                with col4:
-                    if st.button("📊 Analytics", key=f"analytics_{patient['id']}"):
-                        st.session_state.analytics_patient_id = patient['id']
+@st.fragment
+def _appointment_list_fragment():
+    """Appointment table and quick actions; status filter changes rerun only this part."""
+    status_filter = st.selectbox(
+        "Filter by Status",
+        ["All", "scheduled", "completed", "cancelled", "no-show"]
+    )
 
-                st.markdown("---")
+    all_appointments = _cached_get_appointments(
+        status=None if status_filter == "All" else status_filter
+    )
+
+    if not all_appointments.empty:
+        # Sort once by the precomputed datetime and take only the displayed columns
+        order = np.argsort(all_appointments['appointment_dt'].values, kind='stable')
+        sorted_dt = all_appointments['appointment_dt'].take(order)
+
+        display_df = all_appointments[[
+            'patient_name', 'appointment_type', 'duration', 'status', 'notes'
+        ]].take(order)
+        display_df.insert(2, 'date', sorted_dt.dt.date.values)
+        display_df.insert(3, 'time', all_appointments['time_str'].values[order])
+
+        st.dataframe(display_df, use_container_width=True)
+
+        # Batch actions
+        st.subheader("⚡ Quick Actions")
+        col1, col2, col3 = st.columns(3)
+
+        with col1:
+            selected_to_complete = st.multiselect(
+                "Mark as Completed",
+                options=all_appointments['id'].tolist(),
+                format_func=lambda x: f"ID: {x}"
+            )
+            if st.button("✅ Mark Completed"):
+                update_appointment_status_bulk(selected_to_complete, "completed")
+                invalidate_appointments()
+                st.success("Appointments marked as completed!")
+                st.rerun()
+
+        with col2:
+            selected_to_cancel = st.multiselect(
+                "Cancel Appointments",
+                options=all_appointments['id'].tolist(),
+                format_func=lambda x: f"ID: {x}"
+            )
+            if st.button("❌ Cancel Selected"):
+                update_appointment_status_bulk(selected_to_cancel, "cancelled")
+                invalidate_appointments()
+                st.success("Appointments cancelled!")
+                st.rerun()
     else:
-        st.info("No patients found. Register your first patient above!")
+        st.info("No appointments found.")
 
 def show_appointments():
     """Appointment scheduling and management."""
@@ -988,9 +1395,8 @@ def show_appointments():
     with col1:
         st.subheader("📅 Schedule New Appointment")
 
-        with st.form("schedule_appointment"):
-            patients_df = get_patients()
-            patient_options = {f"{row['name']} (ID: {row['id']})": row['id'] for _, row in patients_df.iterrows()}
+        with st.form("schedule_appointment", clear_on_submit=True):
+            patient_options = get_patient_options()
 
             selected_patient = st.selectbox("Select Patient *", list(patient_options.keys()))
             patient_id = patient_options[selected_patient] if selected_patient else None
@@ -1016,6 +1422,7 @@ def show_appointments():
                         patient_id, 1, appointment_type,
                         appointment_datetime, duration, notes
                     )
+                    invalidate_appointments()
                     log_audit_event(
                         st.session_state.current_user['username'],
                         "appointment_scheduled",
@@ -1027,11 +1434,7 @@ def show_appointments():
     with col2:
         st.subheader("📊 Today's Summary")
 
-        today = datetime.now().date()
-        today_appts = get_appointments(status="scheduled")
-        today_appts = today_appts[
-            pd.to_datetime(today_appts['appointment_date']).dt.date == today
-        ]
+        _, today_appts = get_today_appts()
 
         modern_metric_card(
             "Today's Appointments",
@@ -1043,74 +1446,24 @@ def show_appointments():
 
         if not today_appts.empty:
             st.markdown("**Upcoming Today:**")
-            for _, apt in today_appts.iterrows():
-                time_str = pd.to_datetime(apt['appointment_date']).strftime('%I:%M %p')
-                st.markdown(f"• {time_str} - {apt['patient_name']}")
+            for apt in today_appts.itertuples(index=False):
+                st.markdown(f"• {apt.time_str} - {apt.patient_name}")
 
     st.markdown("---")
 
     # Appointment list
     st.subheader("📋 All Appointments")
 
-    status_filter = st.selectbox(
-        "Filter by Status",
-        ["All", "scheduled", "completed", "cancelled", "no-show"]
-    )
-
-    all_appointments = get_appointments()
-    if status_filter != "All":
-        all_appointments = all_appointments[all_appointments['status'] == status_filter]
-
-    if not all_appointments.empty:
-        # Format datetime for display
-        all_appointments['appointment_datetime'] = pd.to_datetime(all_appointments['appointment_date'])
-        all_appointments['date'] = all_appointments['appointment_datetime'].dt.date
-        all_appointments['time'] = all_appointments['appointment_datetime'].dt.strftime('%I:%M %p')
-
-        display_df = all_appointments[[
-            'patient_name', 'appointment_type', 'date', 'time',
-            'duration', 'status', 'notes', 'appointment_datetime'
-        ]].sort_values('appointment_datetime')
-
-        # Remove appointment_datetime from final display
-        display_df = display_df.drop('appointment_datetime', axis=1)
-
-        st.dataframe(display_df, use_container_width=True)
-
-        # Batch actions
-        st.subheader("⚡ Quick Actions")
-        col1, col2, col3 = st.columns(3)
-
-        with col1:
-            selected_to_complete = st.multiselect(
-                "Mark as Completed",
-                options=all_appointments['id'].tolist(),
-                format_func=lambda x: f"ID: {x}"
-            )
-            if st.button("✅ Mark Completed"):
-                for apt_id in selected_to_complete:
-                    update_appointment_status(apt_id, "completed")
-                st.success("Appointments marked as completed!")
-                st.rerun()
-
-        with col2:
-            selected_to_cancel = st.multiselect(
-                "Cancel Appointments",
-                options=all_appointments['id'].tolist(),
-                format_func=lambda x: f"ID: {x}"
-            )
-            if st.button("❌ Cancel Selected"):
-                for apt_id in selected_to_cancel:
-                    update_appointment_status(apt_id, "cancelled")
-                st.success("Appointments cancelled!")
-                st.rerun()
-    else:
-        st.info("No appointments found.")
+    _appointment_list_fragment()
 
 def show_medications():
     """Medication and prescription management."""
     st.header("💊 Medication Management")
 
+    # Patient options shared by every tab
+    patient_options = get_patient_options()
+    patient_labels = list(patient_options.keys())
+
     # Tabs for different medication functions
     tab1, tab2, tab3 = st.tabs(["📋 Prescriptions", "💊 Medication Library", "⚠️ Interactions"])
 
@@ -1118,18 +1471,15 @@ def show_medications():
         st.subheader("📋 Patient Prescriptions")
 
         # Patient selection
-        patients_df = get_patients()
-        patient_options = {f"{row['name']} (ID: {row['id']})": row['id'] for _, row in patients_df.iterrows()}
-
-        selected_patient = st.selectbox("Select Patient", list(patient_options.keys()))
+        selected_patient = st.selectbox("Select Patient", patient_labels)
         patient_id = patient_options[selected_patient] if selected_patient else None
 
         if patient_id:
             # Add new prescription
             with st.expander("➕ Add New Prescription", expanded=False):
-                with st.form("add_prescription"):
-                    medications = get_medications()
-                    med_options = {f"{row['name']} ({row['strength']})": row['id'] for _, row in medications.iterrows()}
+                with st.form("add_prescription", clear_on_submit=True):
+                    medications = _cached_get_medications()
+                    med_options = {f"{row.name} ({row.strength})": row.id for row in medications.itertuples(index=False)}
 
                     selected_med = st.selectbox("Select Medication", list(med_options.keys()))
                     medication_id = med_options[selected_med] if selected_med else None
@@ -1153,6 +1503,7 @@ def show_medications():
                                 route, start_date, end_date,
                                 st.session_state.current_user['username'], notes
                             )
+                            _cached_get_prescriptions.clear()
                             log_audit_event(
                                 st.session_state.current_user['username'],
                                 "prescription_added",
@@ -1163,25 +1514,25 @@ def show_medications():
 
             # Display current prescriptions
             st.subheader("Current Prescriptions")
-            prescriptions = get_prescriptions(patient_id, status="active")
+            prescriptions = _cached_get_prescriptions(patient_id, status="active")
 
             if not prescriptions.empty:
-                for _, rx in prescriptions.iterrows():
+                for rx in prescriptions.itertuples(index=False):
                     col1, col2, col3 = st.columns([3, 1, 1])
                     with col1:
                         st.markdown(f"""
                         <div style="padding: 1rem; background: #f0f8ff; border-radius: 8px; margin-bottom: 0.5rem;">
-                            <strong>{rx['medication_name']}</strong><br>
-                            <small>{rx['dosage']} - {rx['frequency']} ({rx['route']})</small><br>
-                            <small>From {rx['start_date']} to {rx['end_date']}</small>
+                            <strong>{rx.medication_name}</strong><br>
+                            <small>{rx.dosage} - {rx.frequency} ({rx.route})</small><br>
+                            <small>From {rx.start_date} to {rx.end_date}</small>
                         </div>
                         """, unsafe_allow_html=True)
                     with col2:
-                        if st.button("✅ Complete", key=f"complete_{rx['id']}"):
+                        if st.button("✅ Complete", key=f"complete_{rx.id}"):
                             # Update prescription status to completed
                             pass
                     with col3:
-                        if st.button("📝 Edit", key=f"edit_{rx['id']}"):
+                        if st.button("📝 Edit", key=f"edit_{rx.id}"):
                             # Edit prescription
                             pass
             else:
@@ -1213,11 +1564,13 @@ def show_medications():
                             contraindications, side_effects, interactions,
                             dosage_form, strength
                         )
+                        _cached_get_medications.clear()
+                        _cached_interactions.clear()
                         st.success("Medication added to library!")
                         st.rerun()
 
         # Display medications
-        medications = get_medications()
+        medications = _cached_get_medications()
         if not medications.empty:
             st.dataframe(medications[['name', 'generic_name', 'drug_class', 'dosage_form', 'strength']],
                          use_container_width=True)
@@ -1226,34 +1579,83 @@ def show_medications():
         st.subheader("⚠️ Drug Interaction Checker")
 
         if patient_id:
-            current_prescriptions = get_prescriptions(patient_id, status="active")
+            current_prescriptions = _cached_get_prescriptions(patient_id, status="active")
             if not current_prescriptions.empty:
                 medication_ids = current_prescriptions['medication_id'].tolist()
 
                 if len(medication_ids) > 1:
-                    interactions = check_medication_interactions(medication_ids)
+                    interactions = _cached_interactions(tuple(sorted(medication_ids)))
 
                     st.warning("⚠️ Potential Interactions Detected:")
-                    for _, med in interactions.iterrows():
-                        if med['interactions']:
-                            st.markdown(f"""
-                            <div style="padding: 1rem; background: #fff3cd; border-radius: 8px; margin-bottom: 0.5rem;">
-                                <strong>{med['name']}</strong><br>
-                                <small>{med['interactions']}</small>
-                            </div>
-                            """, unsafe_allow_html=True)
+                    interactions_html = "".join(
+                        _INTERACTION_TPL.format_map(med._asdict())
+                        for med in interactions.itertuples(index=False)
+                        if med.interactions
+                    )
+                    st.markdown(interactions_html, unsafe_allow_html=True)
                 else:
                     st.info("Add more medications to check for interactions.")
             else:
                 st.info("No active prescriptions to check.")
 
+@st.fragment
+def _lab_results_fragment(patient_id):
+    """Lab history, filters and trends; reruns on its own when the category filter changes."""
+    # Filter by category
+    all_results, category_groups = _cached_get_lab_results(patient_id)
+    if not all_results.empty:
+        categories = ["All"] + list(category_groups)
+        selected_category = st.selectbox("Filter by Category", categories)
+
+        if selected_category != "All":
+            filtered_results = all_results.iloc[category_groups[selected_category]]
+        else:
+            filtered_results = all_results
+
+        # Critical results alert
+        critical_results = filtered_results[filtered_results['status'] == 'critical']
+        if not critical_results.empty:
+            st.error("🚨 CRITICAL RESULTS DETECTED!")
+            critical_html = "".join(
+                _CRITICAL_LAB_TPL.format_map(result._asdict())
+                for result in critical_results.itertuples(index=False)
+            )
+            st.markdown(critical_html, unsafe_allow_html=True)
+
+        # Display results table
+        display_cols = ['test_name', 'test_category', 'result_value', 'unit',
+                       'reference_range', 'status', 'performed_date']
+        st.dataframe(filtered_results[display_cols], use_container_width=True)
+
+        # Trend visualization for repeated tests
+        if len(filtered_results) > 1:
+            st.subheader("📈 Result Trends")
+            import plotly.express as px
+
+            # Convert result values once, then group by test name for trend charts
+            numeric_results = filtered_results.assign(
+                _num=pd.to_numeric(filtered_results['result_value'], errors='coerce')
+            ).dropna(subset=['_num'])
+
+            for test_name, test_data in numeric_results.groupby('test_name', sort=False):
+                if len(test_data) > 1:
+                    fig = px.line(
+                        test_data,
+                        x='performed_date',
+                        y='_num',
+                        title=f"{test_name} Trend",
+                        markers=True
+                    )
+                    st.plotly_chart(fig, use_container_width=True)
+    else:
+        st.info("No lab results found for this patient.")
+
 def show_lab_results():
     """Lab results management."""
     st.header("🧪 Lab Results Management")
 
     # Patient selection
-    patients_df = get_patients()
-    patient_options = {f"{row['name']} (ID: {row['id']})": row['id'] for _, row in patients_df.iterrows()}
+    patient_options = get_patient_options()
 
     selected_patient = st.selectbox("Select Patient", list(patient_options.keys()))
     patient_id = patient_options[selected_patient] if selected_patient else None
@@ -1261,7 +1663,7 @@ def show_lab_results():
     if patient_id:
         # Add new lab results
         with st.expander("➕ Add Lab Results", expanded=False):
-            with st.form("add_lab_result"):
+            with st.form("add_lab_result", clear_on_submit=True):
                 test_name = st.text_input("Test Name *")
                 test_category = st.selectbox(
                     "Test Category *",
@@ -1288,6 +1690,7 @@ def show_lab_results():
                             result_value, reference_range, unit, status,
                             performed_date, performed_by, notes
                         )
+                        _cached_get_lab_results.clear()
                         log_audit_event(
                             st.session_state.current_user['username'],
                             "lab_result_added",
@@ -1299,76 +1702,30 @@ def show_lab_results():
         # Display lab results
         st.subheader("📊 Lab Results History")
 
-        # Filter by category
-        all_results = get_lab_results(patient_id)
-        if not all_results.empty:
-            categories = ["All"] + all_results['test_category'].unique().tolist()
-            selected_category = st.selectbox("Filter by Category", categories)
+        _lab_results_fragment(patient_id)
 
-            if selected_category != "All":
-                filtered_results = all_results[all_results['test_category'] == selected_category]
-            else:
-                filtered_results = all_results
-
-            # Critical results alert
-            critical_results = filtered_results[filtered_results['status'] == 'critical']
-            if not critical_results.empty:
-                st.error("🚨 CRITICAL RESULTS DETECTED!")
-                for _, result in critical_results.iterrows():
-                    st.markdown(f"""
-                    <div style="padding: 1rem; background: #f8d7da; border-radius: 8px; margin-bottom: 0.5rem;">
-                        <strong>{result['test_name']}</strong>: {result['result_value']} {result['unit']}<br>
-                        <small>Test Date: {result['performed_date']} | Status: CRITICAL</small>
-                    </div>
-                    """, unsafe_allow_html=True)
-
-            # Display results table
-            display_cols = ['test_name', 'test_category', 'result_value', 'unit',
-                           'reference_range', 'status', 'performed_date']
-            st.dataframe(filtered_results[display_cols], use_container_width=True)
-
-            # Trend visualization for repeated tests
-            if len(filtered_results) > 1:
-                st.subheader("📈 Result Trends")
-
-                # Group by test name and create trend charts
-                for test_name in filtered_results['test_name'].unique():
-                    test_data = filtered_results[filtered_results['test_name'] == test_name]
-                    if len(test_data) > 1:
-                        try:
-                            # Convert result values to numeric if possible
-                            numeric_values = pd.to_numeric(test_data['result_value'], errors='coerce')
-                            if not numeric_values.isna().all():
-                                fig = px.line(
-                                    x=test_data['performed_date'],
-                                    y=numeric_values,
-                                    title=f"{test_name} Trend",
-                                    markers=True
-                                )
-                                st.plotly_chart(fig, use_container_width=True)
-                        except:
-                            continue
-        else:
-            st.info("No lab results found for this patient.")
+# Allergy card accent colours by severity
+SEVERITY_COLOR = {"Mild": "#28a745", "Moderate": "#ffc107", "Severe": "#dc3545"}
 
 def show_allergies_immunizations():
     """Allergies and immunizations management."""
     st.header("🤧 Allergies & Immunizations")
 
+    # Patient options shared by both tabs
+    patient_options = get_patient_options()
+    patient_labels = list(patient_options.keys())
+
     tab1, tab2 = st.tabs(["🤧 Allergies", "💉 Immunizations"])
 
     with tab1:
         # Patient selection
-        patients_df = get_patients()
-        patient_options = {f"{row['name']} (ID: {row['id']})": row['id'] for _, row in patients_df.iterrows()}
-
-        selected_patient = st.selectbox("Select Patient", list(patient_options.keys()), key="allergy_patient")
+        selected_patient = st.selectbox("Select Patient", patient_labels, key="allergy_patient")
         patient_id = patient_options[selected_patient] if selected_patient else None
 
         if patient_id:
             # Add new allergy
             with st.expander("➕ Add Allergy", expanded=False):
-                with st.form("add_allergy"):
+                with st.form("add_allergy", clear_on_submit=True):
                     allergen = st.text_input("Allergen *")
                     allergen_type = st.selectbox(
                         "Allergen Type *",
@@ -1381,6 +1738,7 @@ def show_allergies_immunizations():
                     if st.form_submit_button("Add Allergy"):
                         if allergen and reaction:
                             add_allergy(patient_id, allergen, allergen_type, reaction, severity, notes)
+                            _cached_get_allergies.clear()
                             log_audit_event(
                                 st.session_state.current_user['username'],
                                 "allergy_added",
@@ -1391,33 +1749,29 @@ def show_allergies_immunizations():
 
             # Display allergies
             st.subheader("🚨 Current Allergies")
-            allergies = get_allergies(patient_id)
+            allergies = _cached_get_allergies(patient_id)
 
             if not allergies.empty:
-                for _, allergy in allergies.iterrows():
-                    severity_color = {"Mild": "#28a745", "Moderate": "#ffc107", "Severe": "#dc3545"}
-                    color = severity_color.get(allergy['severity'], "#6c757d")
-
-                    st.markdown(f"""
-                    <div style="padding: 1rem; background: {color}20; border-left: 4px solid {color};
-                               border-radius: 8px; margin-bottom: 0.5rem;">
-                        <strong>{allergy['allergen']}</strong> ({allergy['allergen_type']})<br>
-                        <small>Reaction: {allergy['reaction']} | Severity: {allergy['severity']}</small>
-                        {f'<br><small>Notes: {allergy["notes"]}</small>' if allergy['notes'] else ''}
-                    </div>
-                    """, unsafe_allow_html=True)
+                allergy_cards = []
+                for allergy in allergies.itertuples(index=False):
+                    allergy_cards.append(_ALLERGY_TPL.format(
+                        color=SEVERITY_COLOR.get(allergy.severity, "#6c757d"),
+                        notes_html=f'<br><small>Notes: {allergy.notes}</small>' if allergy.notes else '',
+                        **allergy._asdict()
+                    ))
+                st.markdown("".join(allergy_cards), unsafe_allow_html=True)
             else:
                 st.info("No allergies recorded for this patient.")
 
     with tab2:
         # Patient selection
-        selected_patient_imm = st.selectbox("Select Patient", list(patient_options.keys()), key="imm_patient")
+        selected_patient_imm = st.selectbox("Select Patient", patient_labels, key="imm_patient")
         patient_id_imm = patient_options[selected_patient_imm] if selected_patient_imm else None
 
         if patient_id_imm:
             # Add new immunization
             with st.expander("➕ Add Immunization", expanded=False):
-                with st.form("add_immunization"):
+                with st.form("add_immunization", clear_on_submit=True):
                     vaccine_name = st.text_input("Vaccine Name *")
                     vaccine_type = st.selectbox(
                         "Vaccine Type",
@@ -1438,6 +1792,7 @@ def show_allergies_immunizations():
                                 administered_date, administered_by, next_due_date,
                                 lot_number, site, notes
                             )
+                            _cached_get_immunizations.clear()
                             log_audit_event(
                                 st.session_state.current_user['username'],
                                 "immunization_added",
@@ -1448,32 +1803,32 @@ def show_allergies_immunizations():
 
             # Display immunizations
             st.subheader("💉 Immunization Record")
-            immunizations = get_immunizations(patient_id_imm)
+            immunizations = _cached_get_immunizations(patient_id_imm)
 
             if not immunizations.empty:
-                # Immunization status
-                upcoming = immunizations[immunizations['next_due_date'] > datetime.now().date()]
-                overdue = immunizations[immunizations['next_due_date'] < datetime.now().date()]
+                # Immunization status, from one parse of the due dates
+                today = pd.Timestamp(datetime.now().date())
+                due = pd.to_datetime(immunizations['next_due_date'])
+                overdue_mask = (due < today).to_numpy()
+                upcoming_mask = (due > today).to_numpy()
+
+                names = immunizations['vaccine_name'].to_numpy()
+                doses = immunizations['dose_number'].to_numpy()
+                due_dates = due.dt.strftime('%Y-%m-%d').to_numpy()
 
-                if not overdue.empty:
+                if overdue_mask.any():
                     st.warning("⚠️ Overdue Immunizations:")
-                    for _, imm in overdue.iterrows():
-                        st.markdown(f"""
-                        <div style="padding: 0.75rem; background: #f8d7da; border-radius: 8px; margin-bottom: 0.5rem;">
-                            <strong>{imm['vaccine_name']}</strong> - Dose {imm['dose_number']}<br>
-                            <small>Due: {imm['next_due_date']} (Overdue)</small>
-                        </div>
-                        """, unsafe_allow_html=True)
+                    st.markdown("".join(
+                        _OVERDUE_IMM_TPL.format(vaccine_name=v, dose_number=d, next_due_date=dt)
+                        for v, d, dt in zip(names[overdue_mask], doses[overdue_mask], due_dates[overdue_mask])
+                    ), unsafe_allow_html=True)
 
-                if not upcoming.empty:
+                if upcoming_mask.any():
                     st.info("📅 Upcoming Immunizations:")
-                    for _, imm in upcoming.iterrows():
-                        st.markdown(f"""
-                        <div style="padding: 0.75rem; background: #d1ecf1; border-radius: 8px; margin-bottom: 0.5rem;">
-                            <strong>{imm['vaccine_name']}</strong> - Dose {imm['dose_number']}<br>
-                            <small>Due: {imm['next_due_date']}</small>
-                        </div>
-                        """, unsafe_allow_html=True)
+                    st.markdown("".join(
+                        _UPCOMING_IMM_TPL.format(vaccine_name=v, dose_number=d, next_due_date=dt)
+                        for v, d, dt in zip(names[upcoming_mask], doses[upcoming_mask], due_dates[upcoming_mask])
+                    ), unsafe_allow_html=True)
 
                 # Full immunization history
                 st.subheader("📋 Complete History")
@@ -1483,23 +1838,35 @@ def show_allergies_immunizations():
             else:
                 st.info("No immunizations recorded for this patient.")
 
+# Notes longer than this are shown as plain text instead of an HTML block
+LARGE_NOTE_CHARS = 5000
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def _encounter_notes_html(encounter_id, notes):
+    """Escaped HTML block for an encounter's notes, built once per (id, notes)."""
+    return (
+        '<div style="white-space: pre-wrap; padding: 1rem; background: #f8f9fa; '
+        f'border-radius: 8px; line-height: 1.6;">{html.escape(notes)}</div>'
+    )
+
 def show_clinical_notes():
     """Enhanced clinical notes and encounters."""
     st.header("📝 Clinical Notes & Encounters")
 
     # Patient selection
-    patients_df = get_patients()
-    patient_options = {f"{row['name']} (ID: {row['id']})": row['id'] for _, row in patients_df.iterrows()}
+    patient_options = get_patient_options()
 
     selected_patient = st.selectbox("Select Patient", list(patient_options.keys()))
     patient_id = patient_options[selected_patient] if selected_patient else None
 
     if patient_id:
-        patient_info = get_patient_by_id(patient_id)
+        # Patient, encounters and documents come from one cached round of queries
+        bundle = _cached_get_patient_bundle(patient_id)
+        patient_info = bundle["patient"]
 
         # Patient summary
         if patient_info is not None:
-            patient_summary_card(patient_info.to_dict())
+            patient_summary_card(patient_info)
 
         # Add new encounter
         with st.expander("➕ Add Clinical Encounter", expanded=False):
@@ -1528,26 +1895,19 @@ def show_clinical_notes():
                     help="Treatment plan, medications, follow-up")
 
                 if st.form_submit_button("Save Encounter"):
-                    # Combine SOAP notes
-                    notes = f"""
-CHIEF COMPLAINT: {chief_complaint}
-
-SUBJECTIVE:
-{subjective}
-
-OBJECTIVE:
-{objective}
-
-ASSESSMENT:
-{assessment}
-
-PLAN:
-{plan}
-                    """.strip()
+                    # Combine SOAP notes, leaving out empty sections
+                    sections = [
+                        ("CHIEF COMPLAINT", chief_complaint), ("SUBJECTIVE", subjective),
+                        ("OBJECTIVE", objective), ("ASSESSMENT", assessment), ("PLAN", plan)
+                    ]
+                    notes = "\n\n".join(
+                        f"{heading}:\n{text.strip()}" for heading, text in sections if text and text.strip()
+                    )
 
                     add_encounter(
                         patient_id, encounter_date, encounter_type, notes, doctor
                     )
+                    invalidate_encounters()
                     log_audit_event(
                         st.session_state.current_user['username'],
                         "encounter_added",
@@ -1558,7 +1918,7 @@ PLAN:
 
         # Display encounters
         st.subheader("📋 Encounter History")
-        encounters = get_encounters(patient_id)
+        encounters = bundle["encounters"]
 
         if not encounters.empty:
             # Create activity timeline
@@ -1566,22 +1926,33 @@ PLAN:
 
             # Detailed encounter view
             st.subheader("📄 Detailed Notes")
-            for _, encounter in encounters.iterrows():
-                with st.expander(f"{encounter['date'].strftime('%Y-%m-%d')} - {encounter['type']} with Dr. {encounter['doctor']}"):
-                    st.markdown(f"""
-                    <div style="white-space: pre-wrap; padding: 1rem; background: #f8f9fa;
-                               border-radius: 8px; line-height: 1.6;">
-                    {encounter['notes']}
-                    </div>
-                    """, unsafe_allow_html=True)
+            encounters['date_str'] = pd.to_datetime(encounters['date']).dt.strftime('%Y-%m-%d')
+
+            # One documents read for all expanders, sorted by encounter so each
+            # encounter's attachments are a contiguous run found by binary search
+            all_docs = bundle["documents"]
+            doc_eids = all_docs['encounter_id'].to_numpy(dtype=float, na_value=np.nan)
+            order = np.argsort(doc_eids, kind='stable')
+            doc_eids = doc_eids[order]
+            docs_sorted = all_docs.iloc[order]
+
+            encounter_rows = encounters[['date_str', 'type', 'doctor', 'id', 'notes']]
+            for date_str, etype, doctor, eid, notes in encounter_rows.itertuples(index=False, name=None):
+                with st.expander(f"{date_str} - {etype} with Dr. {doctor}"):
+                    notes = notes or ""
+                    if len(notes) > LARGE_NOTE_CHARS:
+                        st.text(notes)
+                    else:
+                        st.markdown(_encounter_notes_html(eid, notes), unsafe_allow_html=True)
 
                     # Document attachments
-                    docs = get_documents(patient_id)
-                    encounter_docs = docs[docs['encounter_id'] == encounter['id']]
-                    if not encounter_docs.empty:
+                    left = np.searchsorted(doc_eids, eid, side='left')
+                    right = np.searchsorted(doc_eids, eid, side='right')
+                    if right > left:
+                        encounter_docs = docs_sorted.iloc[left:right]
                         st.markdown("**📎 Attached Documents:**")
-                        for _, doc in encounter_docs.iterrows():
-                            st.markdown(f"• {os.path.basename(doc['file_path'])} ({doc['type']})")
+                        for file_path, doc_type in encounter_docs[['file_path', 'type']].itertuples(index=False, name=None):
+                            st.markdown(f"• {os.path.basename(file_path)} ({doc_type})")
         else:
             st.info("No encounters recorded for this patient.")
 
@@ -1589,19 +1960,21 @@ def show_ai_assistant():
     """AI-powered clinical assistant."""
     st.header("🤖 AI Clinical Assistant")
 
+    client = get_openai_client()
+
     if not client:
         st.error("AI Assistant is not available. Please configure OpenAI API key.")
         return
 
     # Patient selection
-    patients_df = get_patients()
-    patient_options = {f"{row['name']} (ID: {row['id']})": row['id'] for _, row in patients_df.iterrows()}
+    patient_options = get_patient_options()
 
     selected_patient = st.selectbox("Select Patient", list(patient_options.keys()))
     patient_id = patient_options[selected_patient] if selected_patient else None
 
     if patient_id:
-        patient_info = get_patient_by_id(patient_id)
+        patient_info = _cached_get_patient_by_id(patient_id)
+        patient_info['age'] = calculate_age(patient_info['dob'])
 
         # AI assistant tabs
         tab1, tab2, tab3 = st.tabs(["💬 Clinical Chat", "📋 Document Analysis", "🔍 Differential Diagnosis"])
@@ -1611,14 +1984,19 @@ def show_ai_assistant():
 
             # Initialize chat history
             chat_key = f"ai_chat_{patient_id}"
+            recent_key = f"{chat_key}_recent"
             if chat_key not in st.session_state:
-                st.session_state[chat_key] = get_ai_conversation_history(patient_id)
+                st.session_state[chat_key] = _cached_get_ai_conversation_history(patient_id)
+            # Bounded mirror of the last 10 messages, used for display and the API payload
+            if recent_key not in st.session_state:
+                st.session_state[recent_key] = deque(st.session_state[chat_key][-10:], maxlen=10)
 
             # Chat controls and document context
             col1, col2, col3 = st.columns([3, 1, 1])
             with col2:
                 if st.button("🗑️ Clear Chat", type="secondary"):
                     st.session_state[chat_key] = []
+                    st.session_state[recent_key] = deque(maxlen=10)
                     st.rerun()
             with col3:
                 if st.button("📚 Add Documents", type="secondary"):
@@ -1642,16 +2020,26 @@ def show_ai_assistant():
                                 ]
                                 st.rerun()
 
-            # Display chat messages
-            for message in st.session_state[chat_key][-10:]:  # Show last 10 messages
+            # Display chat messages: last 10, with all but the latest turn in one scrollable container
+            recent_messages = list(st.session_state[recent_key])
+            older_messages, live_messages = recent_messages[:-2], recent_messages[-2:]
+            if older_messages:
+                with st.container(height=400):
+                    for m in older_messages:
+                        speaker = "You" if m["role"] == "user" else "Assistant"
+                        st.markdown(f"**{speaker}:**\n\n{m['content']}")
+            for message in live_messages:
                 with st.chat_message(message["role"]):
                     st.markdown(message["content"])
 
             # Chat input
             if prompt := st.chat_input("Ask clinical questions or request analysis..."):
                 # Add user message
-                st.session_state[chat_key].append({"role": "user", "content": prompt})
+                user_message = {"role": "user", "content": prompt}
+                st.session_state[chat_key].append(user_message)
+                st.session_state[recent_key].append(user_message)
                 add_ai_conversation_entry(patient_id, "user", prompt)
+                _cached_get_ai_conversation_history.clear()
 
                 with st.chat_message("user"):
                     st.markdown(prompt)
@@ -1661,18 +2049,20 @@ def show_ai_assistant():
                     with st.spinner("AI Assistant is thinking..."):
                         # Build patient context
                         patient_context = f"""
-Patient: {patient_info['name']}, {datetime.now().year - patient_info['dob'].year} years old, {patient_info['gender']}
+Patient: {patient_info['name']}, {patient_info['age']} years old, {patient_info['gender']}
 Contact: {patient_info['contact']}
                         """.strip()
 
                         # Get recent encounters for context
-                        recent_encounters = get_encounters(patient_id).head(3)
+                        recent_encounters = _cached_get_encounters(patient_id, limit=3)
                         encounters_context = ""
                         if not recent_encounters.empty:
-                            encounters_context = "\n".join([
-                                f"Recent {enc['type']} on {enc['date']}: {enc['notes'][:200]}..."
-                                for _, enc in recent_encounters.iterrows()
-                            ])
+                            encounters_context = (
+                                "Recent " + recent_encounters['type'].astype(str)
+                                + " on " + recent_encounters['date'].astype(str)
+                                + ": " + recent_encounters['notes'].fillna("").str.slice(0, 200)
+                                + "..."
+                            ).str.cat(sep="\n")
 
                         # Get patient documents for additional context
                         document_context = ""
@@ -1689,19 +2079,22 @@ Contact: {patient_info['contact']}
                             document_context += "\n"
 
                         # Add recent patient documents
-                        patient_documents = get_documents(patient_id)
-                        if not patient_documents.empty:
-                            recent_docs = patient_documents.tail(3)  # Last 3 documents
+                        recent_docs = _cached_get_documents(patient_id, limit=3)  # Last 3 documents
+                        if not recent_docs.empty:
                             document_context += "**RECENT PATIENT DOCUMENTS:**\n"
-                            for _, doc in recent_docs.iterrows():
+                            # One character past the preview length is enough to know whether to add "..."
+                            recent_texts = get_document_texts(recent_docs['id'].tolist(), max_chars=1001)
+                            for doc_id, doc_path, doc_type in zip(
+                                recent_docs['id'].tolist(), recent_docs['file_path'].tolist(), recent_docs['type'].tolist()
+                            ):
                                 # Include more content for recent documents (up to 1000 characters)
-                                content_preview = doc['text_content']
+                                content_preview = recent_texts.get(doc_id) or ""
                                 if len(content_preview) > 1000:
                                     content_preview = content_preview[:1000] + "..."
-                                document_context += f"- {doc['file_path']} ({doc['type']}):\n{content_preview}\n\n"
+                                document_context += f"- {doc_path} ({doc_type}):\n{content_preview}\n\n"
 
-                        enhanced_system_prompt = f"""
-You are an expert clinical AI assistant with specialized knowledge in diagnostics, treatment planning, and clinical decision support. You are assisting with patient care for {patient_info['name']}.
+                        patient_context_message = f"""
+You are assisting with patient care for {patient_info['name']}.
 
 COMPREHENSIVE PATIENT CONTEXT:
 {patient_context}
@@ -1711,65 +2104,37 @@ RECENT CLINICAL ENCOUNTERS:
 
 RECENT DOCUMENTS & TEST RESULTS:
 {document_context}
-
-CLINICAL GUIDELINES:
-1. **Diagnostic Excellence**: Consider differential diagnoses systematically, from common to rare conditions
-2. **Safety First**: Always identify red flag symptoms and conditions requiring urgent attention
-3. **Evidence-Based**: Provide clinical reasoning based on current medical guidelines and evidence
-4. **Context-Aware**: Consider patient age, gender, comorbidities, and medical history
-5. **Risk Assessment**: Evaluate potential risks, benefits, and contraindications for recommendations
-
-RESPONSE REQUIREMENTS:
-- Provide specific, actionable clinical insights rather than general advice
-- When discussing diagnoses, explain the reasoning and key diagnostic criteria
-- Highlight any abnormal values or critical findings that need attention
-- Suggest specific follow-up tests, referrals, or monitoring parameters
-- Consider medication interactions, allergies, and contraindications
-- Provide differential diagnoses with likelihood ranking when appropriate
-- Include evidence levels for recommendations where applicable
-
-SAFETY PROTOCOLS:
-- Always include "Red Flag Warning" section for symptoms requiring immediate care
-- Specify when emergency care is warranted
-- Recommend specialist consultation when appropriate
-- Consider drug-gene interactions and pharmacogenomics when relevant
-
-PROFESSIONAL RESPONSIBILITY:
-- Use clear, professional medical terminology while explaining complex concepts
-- Provide references to clinical guidelines when possible
-- Encourage shared decision-making with patients
-- Maintain patient-centered approach in all recommendations
-
-Remember: You are assisting a qualified healthcare professional. Provide insights that enhance their clinical judgment while respecting their ultimate authority in patient care decisions.
-                        """
+                        """.strip()
 
                         try:
                             # Prepare full conversation history for context
                             conversation_history = [
-                                {"role": "system", "content": enhanced_system_prompt}
+                                {"role": "system", "content": CHAT_SYSTEM_PROMPT},
+                                {"role": "user", "content": patient_context_message}
                             ]
 
                             # Add recent messages for context (last 10 messages)
-                            for msg in st.session_state[chat_key][-10:]:
-                                conversation_history.append({
-                                    "role": msg["role"],
-                                    "content": msg["content"]
-                                })
-
-                            # Use OpenAI Responses API with full conversation context
-                            response = client.responses.create(
+                            conversation_history.extend(st.session_state[recent_key])
+
+                            # Stream the Responses API output so text appears as it is generated
+                            stream = client.responses.create(
                                 model="gpt-5-nano-2025-08-07",
                                 input=conversation_history,
                                 store=True,  # Enable stateful context for better continuity
+                                stream=True,
                             )
 
-                            ai_response = response.output_text
-
-                            st.markdown(ai_response)
+                            ai_response = st.write_stream(
+                                event.delta for event in stream
+                                if event.type == "response.output_text.delta"
+                            )
 
                             # Save to session and database
-                            st.session_state[chat_key].append({"role": "assistant", "content": ai_response})
+                            assistant_message = {"role": "assistant", "content": ai_response}
+                            st.session_state[chat_key].append(assistant_message)
+                            st.session_state[recent_key].append(assistant_message)
                             add_ai_conversation_entry(patient_id, "assistant", ai_response)
+                            _cached_get_ai_conversation_history.clear()
 
                             log_audit_event(
                                 st.session_state.current_user['username'],
@@ -1809,9 +2174,14 @@ Remember: You are assisting a qualified healthcare professional. Provide insight
                 st.session_state.document_session_id = f"session_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
 
             if uploaded_files:
-                # Process each uploaded file
+                # Process each uploaded file once; files still in the uploader on later
+                # reruns are recognised by content hash and skipped
+                processed_hashes = {doc.get('hash') for doc in st.session_state.processed_documents}
                 processed_docs = []
                 for uploaded_file in uploaded_files:
+                    file_hash = hashlib.blake2b(uploaded_file.getvalue(), digest_size=16).hexdigest()
+                    if file_hash in processed_hashes:
+                        continue
                     try:
                         with st.spinner(f"📄 Processing {uploaded_file.name}..."):
                             result = process_document(uploaded_file)
@@ -1830,8 +2200,10 @@ Remember: You are assisting a qualified healthcare professional. Provide insight
                                 'metadata': file_metadata,
                                 'type': doc_type,
                                 'base64': img_base64,
-                                'session_id': st.session_state.document_session_id
+                                'session_id': st.session_state.document_session_id,
+                                'hash': file_hash
                             })
+                            processed_hashes.add(file_hash)
 
                     except Exception as e:
                         st.error(f"❌ Error processing {uploaded_file.name}: {str(e)}")
@@ -1939,7 +2311,7 @@ Remember: You are assisting a qualified healthcare professional. Provide insight
                                 ddx_prompt = f"""
 Generate a differential diagnosis for this patient:
 
-PATIENT: {patient_info['name']}, {datetime.now().year - patient_info['dob'].year}y, {patient_info['gender']}
+PATIENT: {patient_info['name']}, {patient_info['age']}y, {patient_info['gender']}
 
 SYMPTOMS: {symptoms}
 DURATION: {duration}
@@ -1969,7 +2341,7 @@ Provide:
                                     }
                                 ]
 
-                                response = client.responses.create(
+                                response = create_ai_response(
                                     model="gpt-5-nano-2025-08-07",
                                     input=messages,
                                     store=True,
@@ -1988,13 +2360,17 @@ Provide:
 
 def show_analytics():
     """Comprehensive analytics dashboard."""
+    # Figures are built from plain numpy arrays so only the plotted values are serialized
+    import plotly.graph_objects as go
+
     st.header("📊 Practice Analytics Dashboard")
+    preload_analytics()
 
     # Key performance indicators
     col1, col2, col3, col4 = st.columns(4)
 
     with col1:
-        modern_metric_card("Total Patients", f"{len(get_patients())}", "+12% this month", "👥", "blue")
+        modern_metric_card("Total Patients", f"{len(_cached_get_patients())}", "+12% this month", "👥", "blue")
     with col2:
         modern_metric_card("Monthly Visits", "247", "+8% vs last month", "📅", "green")
     with col3:
@@ -2014,71 +2390,68 @@ def show_analytics():
         col1, col2 = st.columns(2)
 
         with col1:
-            age_dist = get_patient_age_distribution()
+            age_dist = _cached_age_distribution()
             if not age_dist.empty:
-                fig = px.bar(age_dist, x='age_group', y='count', title="Patient Age Distribution")
+                fig = go.Figure(go.Bar(x=age_dist['age_group'].to_numpy(), y=age_dist['count'].to_numpy()))
+                fig.update_layout(title="Patient Age Distribution")
                 st.plotly_chart(fig, use_container_width=True)
 
         with col2:
-            encounter_counts = get_encounter_counts_by_type()
+            encounter_counts = _cached_encounter_counts()
             if not encounter_counts.empty:
-                fig = px.pie(encounter_counts, values='count', names='type', title="Visit Types Distribution")
+                fig = go.Figure(go.Pie(values=encounter_counts['count'].to_numpy(), labels=encounter_counts['type'].to_numpy()))
+                fig.update_layout(title="Visit Types Distribution")
                 st.plotly_chart(fig, use_container_width=True)
 
         # Recent activity trend
         st.subheader("📊 Activity Trends")
-        recent_activity = get_recent_patient_activity(30)
+        recent_activity = _cached_recent_activity(30)
 
         if not recent_activity.empty:
-            # Convert date to datetime and extract date
-            recent_activity['date'] = pd.to_datetime(recent_activity['encounter_date']).dt.date
-            daily_counts = recent_activity.groupby('date').size().reset_index(name='visits')
+            # Count visits per day on datetime64 keys rather than Python date objects
+            daily = pd.to_datetime(recent_activity['encounter_date']).dt.floor('D').value_counts().sort_index()
+            daily_counts = daily.rename_axis('date').reset_index(name='visits')
 
-            fig = px.line(daily_counts, x='date', y='visits', title="Daily Patient Visits (Last 30 Days)")
+            fig = go.Figure(go.Scatter(x=daily_counts['date'].to_numpy(), y=daily_counts['visits'].to_numpy(), mode='lines'))
+            fig.update_layout(title="Daily Patient Visits (Last 30 Days)")
             st.plotly_chart(fig, use_container_width=True)
 
     with tab2:
         st.subheader("💊 Medication Analytics")
 
-        prescription_analytics = get_prescription_analytics()
+        prescription_analytics = _cached_prescription_analytics()
 
-        if not prescription_analytics.empty:
-            # Top prescribed medications
-            fig = px.bar(
-                prescription_analytics.head(10),
-                x='prescription_count',
-                y='medication_name',
-                orientation='h',
-                title="Top 10 Prescribed Medications"
-            )
+        if len(prescription_analytics['medication_name']):
+            # Top prescribed medications (rows arrive sorted by count)
+            fig = go.Figure(go.Bar(
+                x=prescription_analytics['prescription_count'][:10],
+                y=prescription_analytics['medication_name'][:10],
+                orientation='h'
+            ))
+            fig.update_layout(title="Top 10 Prescribed Medications")
             st.plotly_chart(fig, use_container_width=True)
 
             # Medication categories
             st.subheader("📋 Medication Categories")
-            meds = get_medications()
+            meds = _cached_get_medications()
             if not meds.empty and 'drug_class' in meds.columns:
                 class_counts = meds['drug_class'].value_counts().head(10)
-                fig = px.pie(values=class_counts.values, names=class_counts.index, title="Medication Classes")
+                fig = go.Figure(go.Pie(values=class_counts.to_numpy(), labels=class_counts.index.to_numpy()))
+                fig.update_layout(title="Medication Classes")
                 st.plotly_chart(fig, use_container_width=True)
 
     with tab3:
         st.subheader("📅 Appointment Analytics")
 
-        appointment_analytics = get_appointment_analytics()
+        appointment_analytics = _cached_appointment_analytics()
 
-        if not appointment_analytics.empty:
-            # Appointment completion rates
-            appointment_analytics['completion_rate'] = (
-                appointment_analytics['completed_count'] / appointment_analytics['total_count'] * 100
-            )
-
-            fig = px.bar(
-                appointment_analytics,
-                x='appointment_type',
-                y=['completed_count', 'cancelled_count', 'no_show_count'],
-                title="Appointment Outcomes by Type",
-                barmode='group'
-            )
+        if len(appointment_analytics['appointment_type']):
+            appointment_types = appointment_analytics['appointment_type']
+            fig = go.Figure([
+                go.Bar(name=outcome, x=appointment_types, y=appointment_analytics[outcome])
+                for outcome in ['completed_count', 'cancelled_count', 'no_show_count']
+            ])
+            fig.update_layout(title="Appointment Outcomes by Type", barmode='group')
             st.plotly_chart(fig, use_container_width=True)
 
             # Show/no-show rates
@@ -2106,27 +2479,28 @@ def show_analytics():
     with tab4:
         st.subheader("👥 Patient Demographics")
 
-        patients = get_patients()
+        patients = _cached_get_patients()
 
         if not patients.empty:
+            gender_counts, new_patients_by_month = _cached_demographics()
             col1, col2 = st.columns(2)
 
             with col1:
                 # Gender distribution
-                gender_counts = patients['gender'].value_counts()
-                fig = px.pie(values=gender_counts.values, names=gender_counts.index, title="Gender Distribution")
+                fig = go.Figure(go.Pie(values=gender_counts.to_numpy(), labels=gender_counts.index.to_numpy()))
+                fig.update_layout(title="Gender Distribution")
                 st.plotly_chart(fig, use_container_width=True)
 
             with col2:
                 # New patients over time
-                if 'created_at' in patients.columns:
-                    patients['created_date'] = pd.to_datetime(patients['created_at']).dt.date
-                    new_patients_by_month = patients.groupby('created_date').size().reset_index(name='new_patients')
-
-                    if not new_patients_by_month.empty:
-                        fig = px.line(new_patients_by_month, x='created_date', y='new_patients',
-                                     title="New Patient Registrations")
-                        st.plotly_chart(fig, use_container_width=True)
+                if new_patients_by_month is not None and not new_patients_by_month.empty:
+                    fig = go.Figure(go.Scatter(
+                        x=new_patients_by_month['created_date'].to_numpy(),
+                        y=new_patients_by_month['new_patients'].to_numpy(),
+                        mode='lines'
+                    ))
+                    fig.update_layout(title="New Patient Registrations")
+                    st.plotly_chart(fig, use_container_width=True)
 
 def show_settings():
     """Settings and configuration."""
@@ -2188,39 +2562,46 @@ def show_settings():
     with tab3:
         st.subheader("📊 Audit Logs")
 
-        logs = get_audit_logs(50)
+        logs_mtime = audit_log_mtime()
+        logs = _cached_audit_logs(logs_mtime, 50)
 
         if not logs.empty:
-            # Filter options
-            col1, col2 = st.columns(2)
-            with col1:
-                action_filter = st.selectbox(
-                    "Filter by Action",
-                    ["All"] + logs['action'].unique().tolist()
-                )
-            with col2:
-                user_filter = st.selectbox(
-                    "Filter by User",
-                    ["All"] + logs['user_id'].unique().tolist()
-                )
+            # Filter options are only built once the user asks for them
+            action_filter = user_filter = "All"
+            if st.checkbox("Filter logs", key="audit_filters_open"):
+                col1, col2 = st.columns(2)
+                with col1:
+                    action_filter = st.selectbox(
+                        "Filter by Action",
+                        ["All"] + _audit_filter_options(logs_mtime, 'action', logs)
+                    )
+                with col2:
+                    user_filter = st.selectbox(
+                        "Filter by User",
+                        ["All"] + _audit_filter_options(logs_mtime, 'user_id', logs)
+                    )
 
-            # Apply filters
-            filtered_logs = logs.copy()
+            # Apply filters as one mask instead of copying the frame
+            mask = pd.Series(True, index=logs.index)
             if action_filter != "All":
-                filtered_logs = filtered_logs[filtered_logs['action'] == action_filter]
+                mask &= logs['action'].eq(action_filter)
             if user_filter != "All":
-                filtered_logs = filtered_logs[filtered_logs['user_id'] == user_filter]
-
-            # Display logs
-            for log in filtered_logs.itertuples():
-                st.markdown(f"""
-                <div style="padding: 0.75rem; background: #f8f9fa; border-radius: 8px; margin-bottom: 0.5rem;">
-                    <small>{log.timestamp}</small><br>
-                    <strong>{log.user_id}</strong> - {log.action}<br>
-                    {f"<small>{log.details}</small>" if log.details else ""}
-                    {f"<br><small>Patient ID: {log.patient_id}</small>" if log.patient_id else ""}
-                </div>
-                """, unsafe_allow_html=True)
+                mask &= logs['user_id'].eq(user_filter)
+            filtered_logs = logs[mask]
+
+            # Display logs as a single HTML block built with column string ops
+            details = filtered_logs['details'].fillna('').astype(str)
+            patient_ids = filtered_logs['patient_id'].fillna('').astype(str)
+            logs_html = (
+                '<div style="padding: 0.75rem; background: #f8f9fa; border-radius: 8px; margin-bottom: 0.5rem;">'
+                '<small>' + filtered_logs['timestamp'].astype(str) + '</small><br>'
+                '<strong>' + filtered_logs['user_id'].astype(str) + '</strong> - '
+                + filtered_logs['action'].astype(str) + '<br>'
+                + ('<small>' + details + '</small>').where(details != '', '')
+                + ('<br><small>Patient ID: ' + patient_ids + '</small>').where(patient_ids != '', '')
+                + '</div>'
+            ).str.cat(sep='')
+            st.markdown(logs_html, unsafe_allow_html=True)
         else:
             st.info("No audit logs found.")
 
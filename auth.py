@@ -1,99 +1,115 @@
+import atexit
+import base64
+import glob
 import hashlib
+import hmac
+import mmap
 import secrets
+import threading
+import time
 import streamlit as st
-from datetime import datetime, timedelta
+from datetime import datetime
 from functools import wraps
 import json
+import orjson
 import os
+from db import (
+    get_user, get_users, count_users, add_user, import_users,
+    record_user_login, record_user_failed_login, unlock_user
+)
 
-# Simple in-memory user store (in production, use proper database)
+# Legacy JSON user store, imported into the DuckDB users table on first use
 USERS_FILE = "ehr_users.json"
 
+_USERS_SEEDED = False
+
+def _ensure_users():
+    """Seed the users table from the legacy JSON file, or with a default admin, when it is empty."""
+    global _USERS_SEEDED
+    if _USERS_SEEDED:
+        return
+    if count_users() == 0:
+        if os.path.exists(USERS_FILE):
+            with open(USERS_FILE, 'r') as f:
+                users = json.load(f)
+            # Lock expiries are stored as epoch seconds rather than ISO strings
+            for user in users.values():
+                if user.get("locked_until"):
+                    user["locked_until"] = int(datetime.fromisoformat(user["locked_until"]).timestamp())
+            import_users(users)
+        else:
+            # Create default admin user
+            add_user("admin", hash_password("admin123"), "admin",
+                     "System Administrator", "admin@ehr.local")
+    _USERS_SEEDED = True
+
 def load_users():
-    """Load users from file or create default admin user."""
-    if os.path.exists(USERS_FILE):
-        with open(USERS_FILE, 'r') as f:
-            return json.load(f)
-    else:
-        # Create default admin user
-        admin_password = hash_password("admin123")
-        default_users = {
-            "admin": {
-                "password": admin_password,
-                "role": "admin",
-                "name": "System Administrator",
-                "email": "admin@ehr.local",
-                "created_at": datetime.now().isoformat(),
-                "last_login": None,
-                "failed_attempts": 0,
-                "locked_until": None
-            }
-        }
-        save_users(default_users)
-        return default_users
-
-def save_users(users):
-    """Save users to file."""
-    with open(USERS_FILE, 'w') as f:
-        json.dump(users, f, indent=2)
+    """Load all users as a {username: record} dict."""
+    _ensure_users()
+    return get_users()
+
+SALT_BYTES = 16
+
+def _derive_key(password, salt):
+    """scrypt-derive a 32-byte key from the password and raw salt bytes."""
+    return hashlib.scrypt(password.encode(), salt=salt, n=2**14, r=8, p=1, dklen=32)
 
 def hash_password(password):
-    """Hash password using SHA-256 with salt."""
-    salt = secrets.token_hex(16)
-    password_hash = hashlib.sha256((password + salt).encode()).hexdigest()
-    return f"{salt}:{password_hash}"
+    """Hash password with scrypt; stored as base64 of salt + derived key."""
+    salt = secrets.token_bytes(SALT_BYTES)
+    return base64.b64encode(salt + _derive_key(password, salt)).decode()
 
 def verify_password(password, hashed):
-    """Verify password against hash."""
+    """Verify password against hash (scrypt, or legacy "salt:sha256" entries)."""
+    salt, sep, stored = hashed.rpartition(':')
+    if sep:
+        computed = hashlib.sha256((password + salt).encode()).hexdigest()
+        return hmac.compare_digest(computed, stored)
     try:
-        salt, password_hash = hashed.split(':')
-        return hashlib.sha256((password + salt).encode()).hexdigest() == password_hash
-    except:
+        decoded = base64.b64decode(hashed, validate=True)
+    except ValueError:
+        return False
+    salt, expected = decoded[:SALT_BYTES], decoded[SALT_BYTES:]
+    if len(salt) < SALT_BYTES or not expected:
         return False
+    return hmac.compare_digest(_derive_key(password, salt), expected)
 
-def is_account_locked(username):
-    """Check if account is locked due to failed attempts."""
-    users = load_users()
-    user = users.get(username)
-    if user and user.get("locked_until"):
-        locked_until = datetime.fromisoformat(user["locked_until"])
-        if datetime.now() < locked_until:
+# Distinguishes "no record passed" from a caller that already looked up a missing user (None)
+_UNSET = object()
+
+def is_account_locked(username, user=_UNSET):
+    """Check if account is locked due to failed attempts; pass `user` to reuse an already-fetched record."""
+    if user is _UNSET:
+        _ensure_users()
+        user = get_user(username)
+    locked_until = user.get("locked_until") if user else None
+    if locked_until:
+        if time.time() < locked_until:
             return True
         else:
             # Unlock if lock period has expired
-            user["locked_until"] = None
-            user["failed_attempts"] = 0
-            save_users(users)
+            unlock_user(username)
     return False
 
+LOCKOUT_SECONDS = 30 * 60
+
 def record_failed_login(username):
     """Record failed login attempt and lock account if necessary."""
-    users = load_users()
-    user = users.get(username)
-    if user:
-        user["failed_attempts"] = user.get("failed_attempts", 0) + 1
-        if user["failed_attempts"] >= 3:
-            # Lock for 30 minutes
-            user["locked_until"] = (datetime.now() + timedelta(minutes=30)).isoformat()
-        save_users(users)
+    # Lock for 30 minutes on the third consecutive failure
+    record_user_failed_login(username, int(time.time()) + LOCKOUT_SECONDS, max_attempts=3)
 
 def record_successful_login(username):
     """Record successful login and reset failed attempts."""
-    users = load_users()
-    user = users.get(username)
-    if user:
-        user["last_login"] = datetime.now().isoformat()
-        user["failed_attempts"] = 0
-        user["locked_until"] = None
-        save_users(users)
+    record_user_login(username)
 
 def login_user(username, password):
     """Authenticate user."""
-    if is_account_locked(username):
-        return False, "Account locked due to multiple failed attempts. Please try again later."
+    # Fetch the account once and share it with the lock check
+    _ensure_users()
+    user = get_user(username)
 
-    users = load_users()
-    user = users.get(username)
+    if is_account_locked(username, user):
+        return False, "Account locked due to multiple failed attempts. Please try again later."
 
     if user and verify_password(password, user["password"]):
         record_successful_login(username)
@@ -104,23 +120,12 @@ def login_user(username, password):
 
 def register_user(username, password, name, email, role="doctor"):
     """Register a new user."""
-    users = load_users()
+    _ensure_users()
 
-    if username in users:
+    if get_user(username):
         return False, "Username already exists"
 
-    users[username] = {
-        "password": hash_password(password),
-        "role": role,
-        "name": name,
-        "email": email,
-        "created_at": datetime.now().isoformat(),
-        "last_login": None,
-        "failed_attempts": 0,
-        "locked_until": None
-    }
-
-    save_users(users)
+    add_user(username, hash_password(password), role, name, email)
     return True, "User registered successfully"
 
 def get_current_user():
@@ -178,10 +183,63 @@ def is_staff():
     return get_user_role() in ["admin", "doctor", "nurse"]
 
 # Audit logging functions
+AUDIT_FILE = "ehr_audit.log"
+AUDIT_FLUSH_EVERY = 20
+AUDIT_ROTATE_LINES = 10_000
+AUDIT_SHARD_GLOB = "ehr_audit-*.parquet"
+
+# Schema for Parquet audit shards; the NDJSON hot log is rotated into these
+AUDIT_COLUMNS = {
+    "timestamp": "TIMESTAMP",
+    "user_id": "VARCHAR",
+    "action": "VARCHAR",
+    "details": "VARCHAR",
+    "patient_id": "VARCHAR",
+    "ip_address": "VARCHAR",
+}
+
+# Persistent buffered handle for audit writes, flushed every AUDIT_FLUSH_EVERY events
+_AUDIT_FH = None
+_AUDIT_PENDING = 0
+_AUDIT_LINES = 0
+_AUDIT_LOCK = threading.Lock()
+
+def _count_lines(path):
+    """Count newlines in a file by scanning a read-only memory map."""
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return 0
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        count, position = 0, mm.find(b"\n")
+        while position != -1:
+            count += 1
+            position = mm.find(b"\n", position + 1)
+    return count
+
+def _rotate_audit():
+    """Convert the NDJSON hot log into a zstd Parquet shard and start a fresh log. Caller holds _AUDIT_LOCK."""
+    global _AUDIT_FH, _AUDIT_PENDING, _AUDIT_LINES
+    import duckdb
+
+    _AUDIT_FH.close()
+    _AUDIT_FH = None
+    _AUDIT_PENDING = 0
+
+    shard = f"ehr_audit-{datetime.now():%Y%m%d%H%M%S%f}.parquet"
+    columns = ", ".join(f"'{name}': '{dtype}'" for name, dtype in AUDIT_COLUMNS.items())
+    with duckdb.connect() as conn:
+        conn.execute(f"""
+            COPY (
+                SELECT * FROM read_json('{AUDIT_FILE}', format = 'newline_delimited', columns = {{{columns}}})
+                ORDER BY timestamp
+            ) TO '{shard}' (FORMAT PARQUET, COMPRESSION ZSTD)
+        """)
+    os.remove(AUDIT_FILE)
+    _AUDIT_LINES = 0
+
 def log_audit_event(user_id, action, details=None, patient_id=None):
     """Log audit events for compliance."""
     audit_log = {
-        "timestamp": datetime.now().isoformat(),
+        "timestamp": datetime.now(),
         "user_id": user_id,
         "action": action,
         "details": details,
@@ -190,22 +248,77 @@ def log_audit_event(user_id, action, details=None, patient_id=None):
     }
 
     # In production, save to secure audit log database
-    audit_file = "ehr_audit.log"
-    with open(audit_file, "a") as f:
-        f.write(json.dumps(audit_log) + "\n")
+    global _AUDIT_FH, _AUDIT_PENDING, _AUDIT_LINES
+    with _AUDIT_LOCK:
+        if _AUDIT_FH is None:
+            _AUDIT_LINES = _count_lines(AUDIT_FILE)
+            _AUDIT_FH = open(AUDIT_FILE, "ab", buffering=64 * 1024)
+        # orjson writes the datetime as ISO 8601 and appends the newline itself
+        _AUDIT_FH.write(orjson.dumps(audit_log, option=orjson.OPT_APPEND_NEWLINE))
+        _AUDIT_PENDING += 1
+        _AUDIT_LINES += 1
+        if _AUDIT_LINES >= AUDIT_ROTATE_LINES:
+            _rotate_audit()
+        elif _AUDIT_PENDING >= AUDIT_FLUSH_EVERY:
+            _AUDIT_FH.flush()
+            _AUDIT_PENDING = 0
 
-def get_audit_logs(limit=100):
-    """Get recent audit logs."""
-    audit_file = "ehr_audit.log"
-    if not os.path.exists(audit_file):
+def flush_audit_log():
+    """Flush buffered audit events to disk."""
+    global _AUDIT_PENDING
+    with _AUDIT_LOCK:
+        if _AUDIT_FH is not None:
+            _AUDIT_FH.flush()
+        _AUDIT_PENDING = 0
+
+atexit.register(flush_audit_log)
+
+def _tail_lines(path, limit):
+    """Return the last `limit` lines of a file, scanning a memory map backwards from EOF."""
+    if limit <= 0 or os.path.getsize(path) == 0:
+        return []
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        end = mm.size()
+        if mm[end - 1] == ord("\n"):
+            end -= 1
+        position = end
+        for _ in range(limit):
+            position = mm.rfind(b"\n", 0, position)
+            if position == -1:
+                break
+        tail = mm[position + 1:end]
+    return tail.split(b"\n") if tail else []
+
+def _read_audit_shards(limit):
+    """Newest `limit` events from the rotated Parquet shards."""
+    if limit <= 0 or not glob.glob(AUDIT_SHARD_GLOB):
         return []
+    import duckdb
+
+    with duckdb.connect() as conn:
+        cursor = conn.execute(f"""
+            SELECT strftime(timestamp, '%Y-%m-%dT%H:%M:%S.%f') AS timestamp,
+                   user_id, action, details, patient_id, ip_address
+            FROM read_parquet('{AUDIT_SHARD_GLOB}')
+            ORDER BY timestamp DESC
+            LIMIT ?
+        """, [limit])
+        names = [column[0] for column in cursor.description]
+        return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+def get_audit_logs(limit=100):
+    """Get recent audit logs, newest first."""
+    flush_audit_log()
+    audit_file = AUDIT_FILE
 
+    # The log is append-only in timestamp order, so only its tail needs parsing
     logs = []
-    with open(audit_file, "r") as f:
-        for line in f:
+    if os.path.exists(audit_file):
+        for line in reversed(_tail_lines(audit_file, limit)):
             try:
-                logs.append(json.loads(line.strip()))
+                logs.append(orjson.loads(line))
             except:
                 continue
 
-    return sorted(logs, key=lambda x: x["timestamp"], reverse=True)[:limit]
\ No newline at end of file
+    # Older events live in Parquet shards once the hot log has been rotated
+    return logs + _read_audit_shards(limit - len(logs))
\ No newline at end of file
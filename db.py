@@ -1,34 +1,162 @@
+import atexit
 import duckdb
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
 import pandas as pd # Import pandas for DataFrame operations
 
 DB_FILE = "clinical_logs.duckdb"
 
+logger = logging.getLogger(__name__)
+
+# One connection per process; each call works on its own cursor, and writes are serialized.
+# Statements are not pre-prepared: the Python API has no prepare(), and SQL-level
+# PREPARE/EXECUTE only takes literal arguments, which would mean formatting values into SQL.
+# List reads return pandas DataFrames (.df()) because both apps index, mask and iterate them;
+# single-row, history and chart-only reads use fetchone/fetchall/fetchnumpy instead.
+# The write lock is re-entrant so write helpers can run inside transaction().
+_con = None
+_CON_LOCK = threading.Lock()
+_WRITE_LOCK = threading.RLock()
+
+# Per-thread cursor of the open transaction(), if any
+_TX = threading.local()
+
+# Set once init_db has run in this process; Streamlit calls init_db on every rerun.
+_schema_ready = False
+
+def _get_con():
+    """Returns the shared DuckDB connection, opening it on first use."""
+    global _con
+    if _con is None:
+        with _CON_LOCK:
+            if _con is None:
+                con = duckdb.connect(DB_FILE)
+                # Size the executor to the machine, cap memory, and keep the WAL checkpointed small
+                con.execute(f"PRAGMA threads={os.cpu_count() or 1}")
+                con.execute(f"PRAGMA memory_limit='{os.getenv('EHR_DB_MEMORY_LIMIT', '4GB')}'")
+                con.execute("PRAGMA wal_autocheckpoint='16MB'")
+                con.execute("PRAGMA enable_object_cache")
+                _con = con
+    return _con
+
+def _close_con():
+    """Closes the shared connection at interpreter exit, after pending writes have been flushed."""
+    global _con
+    with _CON_LOCK:
+        if _con is not None:
+            _con.close()
+            _con = None
+
+# Registered before flush_ai_conversations, so atexit (which runs last-in first-out) closes afterwards
+atexit.register(_close_con)
+
+class _TransactionCursor:
+    """The open transaction's cursor as handed to helpers; their close() is left to transaction()."""
+    def __init__(self, con):
+        self._con = con
+
+    def close(self):
+        pass
+
+    def __getattr__(self, name):
+        return getattr(self._con, name)
+
+def _cursor():
+    """
+    Returns a cursor on the shared connection; DuckDB cursors may be used from separate threads.
+    Inside transaction() the calling thread gets the transaction's cursor instead.
+    """
+    tx_cursor = getattr(_TX, "cursor", None)
+    return tx_cursor if tx_cursor is not None else _get_con().cursor()
+
+@contextmanager
+def transaction():
+    """
+    Runs a batch of writes as one transaction, so they share a single commit:
+
+        with transaction():
+            for row in rows:
+                add_immunization(**row)
+
+    Rolls back if the block raises. Nested use joins the outer transaction.
+    """
+    if getattr(_TX, "cursor", None) is not None:
+        yield _TX.cursor
+        return
+    with _WRITE_LOCK:
+        con = _get_con().cursor()
+        con.execute("BEGIN")
+        _TX.cursor = _TransactionCursor(con)
+        try:
+            yield _TX.cursor
+        except BaseException:
+            con.execute("ROLLBACK")
+            raise
+        else:
+            con.execute("COMMIT")
+        finally:
+            _TX.cursor = None
+            con.close()
+
+def _insert_frame(table, columns, records, checkpoint=False):
+    """
+    Inserts many rows through DuckDB's appender, which fills the column vectors straight
+    from the DataFrame without planning an INSERT statement.
+    Column defaults (ids, timestamps) still apply because only `columns` are appended, by name.
+    Pass checkpoint=True after large loads to fold the WAL into the database file.
+    """
+    df = records[columns] if isinstance(records, pd.DataFrame) else pd.DataFrame(records, columns=columns)
+    if df.empty:
+        return
+    with _WRITE_LOCK:
+        con = _cursor()
+        con.append(table, df, by_name=True)
+        # A checkpoint has to wait until an enclosing transaction() commits
+        if checkpoint and getattr(_TX, "cursor", None) is None:
+            con.execute("CHECKPOINT")
+        con.close()
+
 def init_db():
     """
     Initializes the DuckDB database and creates all necessary tables
     (patients, encounters, documents, vitals, ai_logs) with sequences
     for auto-incrementing primary keys.
     """
-    con = duckdb.connect(DB_FILE)
+    global _schema_ready
+    if _schema_ready:
+        return
+
+    # All DDL is collected and run as one script inside a single transaction.
+    schema = []
+
+    # Per-patient lookups need no extra CREATE INDEX: DuckDB backs every PRIMARY KEY and
+    # FOREIGN KEY column with an ART index, so each child table's patient_id (and
+    # encounters.follow_up_of_encounter_id) is already indexed through its FOREIGN KEY.
+    # Composite (patient_id, date DESC) indexes are not added either: DuckDB only uses ART
+    # indexes for point/range lookups, never to return rows pre-sorted, so they would cost
+    # every insert without removing the per-patient ORDER BY.
 
     # Create sequences for each table's primary key.
     # These sequences will generate unique, sequential IDs for each new record.
-    con.execute("CREATE SEQUENCE IF NOT EXISTS patients_id_seq START 1;")
-    con.execute("CREATE SEQUENCE IF NOT EXISTS encounters_id_seq START 1;")
-    con.execute("CREATE SEQUENCE IF NOT EXISTS documents_id_seq START 1;")
-    con.execute("CREATE SEQUENCE IF NOT EXISTS vitals_id_seq START 1;")
-    con.execute("CREATE SEQUENCE IF NOT EXISTS ai_logs_id_seq START 1;")
-    con.execute("CREATE SEQUENCE IF NOT EXISTS ai_conversations_id_seq START 1;")
-    con.execute("CREATE SEQUENCE IF NOT EXISTS medications_id_seq START 1;")
-    con.execute("CREATE SEQUENCE IF NOT EXISTS prescriptions_id_seq START 1;")
-    con.execute("CREATE SEQUENCE IF NOT EXISTS appointments_id_seq START 1;")
-    con.execute("CREATE SEQUENCE IF NOT EXISTS lab_results_id_seq START 1;")
-    con.execute("CREATE SEQUENCE IF NOT EXISTS allergies_id_seq START 1;")
-    con.execute("CREATE SEQUENCE IF NOT EXISTS immunizations_id_seq START 1;")
+    schema.append("CREATE SEQUENCE IF NOT EXISTS patients_id_seq START 1;")
+    schema.append("CREATE SEQUENCE IF NOT EXISTS encounters_id_seq START 1;")
+    schema.append("CREATE SEQUENCE IF NOT EXISTS documents_id_seq START 1;")
+    schema.append("CREATE SEQUENCE IF NOT EXISTS vitals_id_seq START 1;")
+    schema.append("CREATE SEQUENCE IF NOT EXISTS ai_logs_id_seq START 1;")
+    schema.append("CREATE SEQUENCE IF NOT EXISTS ai_conversations_id_seq START 1;")
+    schema.append("CREATE SEQUENCE IF NOT EXISTS medications_id_seq START 1;")
+    schema.append("CREATE SEQUENCE IF NOT EXISTS prescriptions_id_seq START 1;")
+    schema.append("CREATE SEQUENCE IF NOT EXISTS appointments_id_seq START 1;")
+    schema.append("CREATE SEQUENCE IF NOT EXISTS lab_results_id_seq START 1;")
+    schema.append("CREATE SEQUENCE IF NOT EXISTS allergies_id_seq START 1;")
+    schema.append("CREATE SEQUENCE IF NOT EXISTS immunizations_id_seq START 1;")
 
     # Patients table: Stores patient demographic information.
-    con.execute("""
+    schema.append("""
         CREATE TABLE IF NOT EXISTS patients (
             id INTEGER PRIMARY KEY DEFAULT nextval('patients_id_seq'), -- Auto-incrementing ID
             name VARCHAR,
@@ -49,7 +177,7 @@ def init_db():
 
     # Encounters table: Stores details of patient visits/interactions.
     # Added follow_up_of_encounter_id for linking follow-up encounters to original ones.
-    con.execute("""
+    schema.append("""
         CREATE TABLE IF NOT EXISTS encounters (
             id INTEGER PRIMARY KEY DEFAULT nextval('encounters_id_seq'), -- Auto-incrementing ID
             patient_id INTEGER,
@@ -64,35 +192,44 @@ def init_db():
     """)
 
     # Documents table: Stores metadata about uploaded patient documents (scans, reports).
-    con.execute("""
+    schema.append("""
         CREATE TABLE IF NOT EXISTS documents (
             id INTEGER PRIMARY KEY DEFAULT nextval('documents_id_seq'), -- Auto-incrementing ID
             patient_id INTEGER,
             encounter_id INTEGER,
             type VARCHAR, -- e.g., 'PDF', 'TXT', 'JPEG'
             file_path VARCHAR, -- Path to the stored file
-            text_content VARCHAR, -- Extracted text content from the document
             upload_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP, -- Timestamp of upload
             FOREIGN KEY(patient_id) REFERENCES patients(id),
             FOREIGN KEY(encounter_id) REFERENCES encounters(id)
         )
     """)
 
+    # Document text table: Extracted text kept apart from the document metadata, which is listed far more often.
+    # No FOREIGN KEY to documents, as DuckDB would then refuse any later ALTER of the documents table.
+    schema.append("""
+        CREATE TABLE IF NOT EXISTS documents_text (
+            document_id INTEGER PRIMARY KEY, -- documents.id
+            text_content VARCHAR -- Extracted text content from the document
+        )
+    """)
+
     # Vitals table: Stores patient vital signs over time.
-    con.execute("""
+    schema.append("""
         CREATE TABLE IF NOT EXISTS vitals (
             id INTEGER PRIMARY KEY DEFAULT nextval('vitals_id_seq'), -- Auto-incrementing ID
             patient_id INTEGER,
             timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP, -- Timestamp of vital measurement
             heart_rate INTEGER,
-            bp VARCHAR, -- Blood pressure (e.g., "120/80")
+            bp_sys SMALLINT, -- Systolic blood pressure
+            bp_dia SMALLINT, -- Diastolic blood pressure
             temp FLOAT, -- Temperature
             FOREIGN KEY(patient_id) REFERENCES patients(id)
         )
     """)
 
     # AI logs table: Stores records of AI interactions (e.g., suggestions, prompts).
-    con.execute("""
+    schema.append("""
         CREATE TABLE IF NOT EXISTS ai_logs (
             id INTEGER PRIMARY KEY DEFAULT nextval('ai_logs_id_seq'), -- Auto-incrementing ID
             patient_id INTEGER,
@@ -108,7 +245,7 @@ def init_db():
 
     # AI Conversations table: Stores detailed chat history for AI triage/consultation.
     # This is separate from ai_logs to store individual chat turns for a continuous conversation.
-    con.execute("""
+    schema.append("""
         CREATE TABLE IF NOT EXISTS ai_conversations (
             id INTEGER PRIMARY KEY DEFAULT nextval('ai_conversations_id_seq'),
             patient_id INTEGER,
@@ -120,7 +257,7 @@ def init_db():
     """)
 
     # Medications table: Stores medication information and interaction data
-    con.execute("""
+    schema.append("""
         CREATE TABLE IF NOT EXISTS medications (
             id INTEGER PRIMARY KEY DEFAULT nextval('medications_id_seq'),
             name VARCHAR NOT NULL,
@@ -137,7 +274,7 @@ def init_db():
     """)
 
     # Prescriptions table: Links patients to medications with dosing instructions
-    con.execute("""
+    schema.append("""
         CREATE TABLE IF NOT EXISTS prescriptions (
             id INTEGER PRIMARY KEY DEFAULT nextval('prescriptions_id_seq'),
             patient_id INTEGER,
@@ -159,7 +296,7 @@ def init_db():
     """)
 
     # Appointments table: Manages patient appointments and scheduling
-    con.execute("""
+    schema.append("""
         CREATE TABLE IF NOT EXISTS appointments (
             id INTEGER PRIMARY KEY DEFAULT nextval('appointments_id_seq'),
             patient_id INTEGER,
@@ -174,9 +311,13 @@ def init_db():
             FOREIGN KEY(patient_id) REFERENCES patients(id)
         )
     """)
+    schema.append("""
+        CREATE INDEX IF NOT EXISTS idx_appointments_status_date
+        ON appointments(status, appointment_date)
+    """)
 
     # Lab Results table: Stores laboratory test results
-    con.execute("""
+    schema.append("""
         CREATE TABLE IF NOT EXISTS lab_results (
             id INTEGER PRIMARY KEY DEFAULT nextval('lab_results_id_seq'),
             patient_id INTEGER,
@@ -198,7 +339,7 @@ def init_db():
     """)
 
     # Allergies table: Stores patient allergy information
-    con.execute("""
+    schema.append("""
         CREATE TABLE IF NOT EXISTS allergies (
             id INTEGER PRIMARY KEY DEFAULT nextval('allergies_id_seq'),
             patient_id INTEGER,
@@ -215,7 +356,7 @@ def init_db():
     """)
 
     # Immunizations table: Stores patient immunization records
-    con.execute("""
+    schema.append("""
         CREATE TABLE IF NOT EXISTS immunizations (
             id INTEGER PRIMARY KEY DEFAULT nextval('immunizations_id_seq'),
             patient_id INTEGER,
@@ -233,103 +374,347 @@ def init_db():
         )
     """)
 
+    # Users table: Application accounts, updated row-by-row on each login
+    schema.append("""
+        CREATE TABLE IF NOT EXISTS users (
+            username VARCHAR PRIMARY KEY,
+            password VARCHAR,
+            role VARCHAR,
+            name VARCHAR,
+            email VARCHAR,
+            created_at TIMESTAMP,
+            last_login TIMESTAMP,
+            failed_attempts INTEGER DEFAULT 0,
+            locked_until BIGINT -- lock expiry as epoch seconds
+        )
+    """)
+
+    # Analytics summary tables: dashboard aggregates kept current by the add_*/update_* writers,
+    # so charts read O(#groups) rows instead of re-scanning the base tables on every render.
+    schema.append("""
+        CREATE TABLE IF NOT EXISTS mv_encounter_counts (
+            type VARCHAR PRIMARY KEY,
+            count BIGINT
+        )
+    """)
+    schema.append("""
+        CREATE TABLE IF NOT EXISTS mv_prescription_counts (
+            medication_id INTEGER PRIMARY KEY,
+            prescription_count BIGINT,
+            active_count BIGINT
+        )
+    """)
+    schema.append("""
+        CREATE TABLE IF NOT EXISTS mv_appointment_counts (
+            appointment_type VARCHAR PRIMARY KEY,
+            total_count BIGINT,
+            completed_count BIGINT,
+            cancelled_count BIGINT,
+            no_show_count BIGINT
+        )
+    """)
+
+    con = _cursor()
+    con.execute("BEGIN;\n" + ";\n".join(stmt.strip().rstrip(";") for stmt in schema) + ";\nCOMMIT;")
+    _migrate_vitals_bp(con)
+    _migrate_documents_text(con)
+    _refresh_analytics(con)
     con.close()
+    _prewarm_db_file()
+    _schema_ready = True
+
+def _prewarm_db_file():
+    """Asks the OS to start reading the database file into the page cache, so first page loads skip cold IO."""
+    if not hasattr(os, "posix_fadvise"):
+        return
+    try:
+        fd = os.open(DB_FILE, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        # WILLNEED only schedules readahead; it returns without waiting for the IO
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+def _migrate_vitals_bp(con):
+    """Splits a legacy VARCHAR vitals.bp ("120/80") into the bp_sys/bp_dia SMALLINT columns."""
+    has_legacy_bp = con.execute("""
+        SELECT COUNT(*) FROM information_schema.columns
+        WHERE table_name = 'vitals' AND column_name = 'bp'
+    """).fetchone()[0]
+    if not has_legacy_bp:
+        return
+    # DuckDB rejects altering and updating a table in one transaction, so each step
+    # autocommits; ADD COLUMN IF NOT EXISTS keeps an interrupted migration re-runnable
+    con.execute("ALTER TABLE vitals ADD COLUMN IF NOT EXISTS bp_sys SMALLINT")
+    con.execute("ALTER TABLE vitals ADD COLUMN IF NOT EXISTS bp_dia SMALLINT")
+    con.execute("""
+        UPDATE vitals SET
+            bp_sys = TRY_CAST(split_part(bp, '/', 1) AS SMALLINT),
+            bp_dia = TRY_CAST(split_part(bp, '/', 2) AS SMALLINT)
+    """)
+    con.execute("ALTER TABLE vitals DROP COLUMN bp")
+
+def _migrate_documents_text(con):
+    """Moves a legacy documents.text_content column into the documents_text table."""
+    has_legacy_text = con.execute("""
+        SELECT COUNT(*) FROM information_schema.columns
+        WHERE table_name = 'documents' AND column_name = 'text_content'
+    """).fetchone()[0]
+    if not has_legacy_text:
+        return
+    con.execute("""
+        INSERT OR IGNORE INTO documents_text (document_id, text_content)
+        SELECT id, text_content FROM documents WHERE text_content IS NOT NULL
+    """)
+    con.execute("ALTER TABLE documents DROP COLUMN text_content")
+
+def _refresh_appointment_counts(con, appointment_ids=None):
+    """Re-aggregates the appointment types touched by `appointment_ids` (all types when None)."""
+    con.execute("""
+        INSERT OR REPLACE INTO mv_appointment_counts
+        SELECT
+            appointment_type,
+            COUNT(*),
+            COUNT(*) FILTER (WHERE status = 'completed'),
+            COUNT(*) FILTER (WHERE status = 'cancelled'),
+            COUNT(*) FILTER (WHERE status = 'no-show')
+        FROM appointments
+        WHERE appointment_type IN (
+            SELECT appointment_type FROM appointments WHERE ? IS NULL OR list_contains(?, id)
+        )
+        GROUP BY appointment_type
+    """, [appointment_ids, appointment_ids])
+
+def refresh_analytics():
+    """Rebuilds the analytics summary tables; call after loading rows without the add_* helpers."""
+    with _WRITE_LOCK:
+        con = _cursor()
+        _refresh_analytics(con)
+        con.close()
+
+def _refresh_analytics(con):
+    """
+    Rebuilds the analytics summary tables from the base tables once per process,
+    which also seeds them for databases created before they existed.
+    Rows are never deleted and their grouping columns never change, so no group goes stale.
+    """
+    con.execute("""
+        INSERT OR REPLACE INTO mv_encounter_counts
+        SELECT type, COUNT(*) FROM encounters WHERE type IS NOT NULL GROUP BY type
+    """)
+    con.execute("""
+        INSERT OR REPLACE INTO mv_prescription_counts
+        SELECT medication_id, COUNT(*), COUNT(*) FILTER (WHERE status = 'active')
+        FROM prescriptions WHERE medication_id IS NOT NULL GROUP BY medication_id
+    """)
+    _refresh_appointment_counts(con)
 
 # --- Patient Management Functions ---
 def add_patient(name, dob, gender, contact, address):
-    """Adds a new patient record to the database."""
-    con = duckdb.connect(DB_FILE)
-    # ID is auto-generated by the sequence, so it's omitted from the INSERT statement.
-    con.execute(
-        "INSERT INTO patients (name, dob, gender, contact, address) VALUES (?, ?, ?, ?, ?)",
-        [name, dob, gender, contact, address]
-    )
-    con.close()
+    """Adds a new patient record to the database. Returns the new id."""
+    with _WRITE_LOCK:
+        con = _cursor()
+        # ID is auto-generated by the sequence, so it's omitted from the INSERT statement.
+        new_id = con.execute(
+            "INSERT INTO patients (name, dob, gender, contact, address) VALUES (?, ?, ?, ?, ?) RETURNING id",
+            [name, dob, gender, contact, address]
+        ).fetchone()[0]
+        con.close()
+        return new_id
 
 def get_patients():
     """Retrieves all patient records, ordered by name."""
-    con = duckdb.connect(DB_FILE)
+    con = _cursor()
     df = con.execute("SELECT * FROM patients ORDER BY name").df()
     con.close()
     return df
 
+def _select_patient(con, patient_id):
+    cursor = con.execute("SELECT * FROM patients WHERE id = ?", [patient_id])
+    row = cursor.fetchone()
+    columns = [column[0] for column in cursor.description]
+    # A plain dict avoids building a one-row DataFrame just to take its first row
+    return dict(zip(columns, row)) if row else None
+
 def get_patient_by_id(patient_id):
     """Retrieves a single patient record by their ID."""
-    con = duckdb.connect(DB_FILE)
-    df = con.execute("SELECT * FROM patients WHERE id = ?", [patient_id]).df()
+    con = _cursor()
+    patient = _select_patient(con, patient_id)
     con.close()
-    return df.iloc[0] if not df.empty else None
+    return patient
 
 # --- Encounter Management Functions ---
 def add_encounter(patient_id, date, type_, notes, doctor, follow_up_of_encounter_id=None):
     """
     Adds a new encounter record for a patient.
     Can link to a previous encounter via follow_up_of_encounter_id.
+    Returns the new id.
     """
-    con = duckdb.connect(DB_FILE)
-    con.execute(
-        "INSERT INTO encounters (patient_id, date, type, notes, doctor, follow_up_of_encounter_id) VALUES (?, ?, ?, ?, ?, ?)",
-        [patient_id, date, type_, notes, doctor, follow_up_of_encounter_id]
-    )
-    con.close()
-
-def get_encounters(patient_id):
+    with _WRITE_LOCK:
+        con = _cursor()
+        new_id = con.execute(
+            "INSERT INTO encounters (patient_id, date, type, notes, doctor, follow_up_of_encounter_id) VALUES (?, ?, ?, ?, ?, ?) RETURNING id",
+            [patient_id, date, type_, notes, doctor, follow_up_of_encounter_id]
+        ).fetchone()[0]
+        if type_ is not None:
+            con.execute("""
+                INSERT INTO mv_encounter_counts VALUES (?, 1)
+                ON CONFLICT (type) DO UPDATE SET count = count + 1
+            """, [type_])
+        con.close()
+        return new_id
+
+def _select_encounters(con, patient_id, limit=None):
+    # Narrow to this patient's encounters (and the limit) first, then resolve only the
+    # encounters they follow up on, rather than joining against the whole table.
+    return con.execute("""
+        WITH mine AS (
+            SELECT id, patient_id, date, type, notes, doctor, follow_up_of_encounter_id
+            FROM encounters
+            WHERE patient_id = ?
+            ORDER BY date DESC
+            LIMIT ?
+        ),
+        followed AS (
+            SELECT id, date, notes, type
+            FROM encounters
+            WHERE id IN (SELECT follow_up_of_encounter_id FROM mine)
+        )
+        SELECT
+            mine.*,
+            followed.date AS followed_up_date,
+            followed.notes AS followed_up_notes,
+            followed.type AS followed_up_type
+        FROM mine
+        LEFT JOIN followed ON mine.follow_up_of_encounter_id = followed.id
+        ORDER BY mine.date DESC
+    """, [patient_id, limit]).df()
+
+def get_encounters(patient_id, limit=None):
     """
-    Retrieves all encounters for a specific patient, ordered by date (descending).
+    Retrieves encounters for a specific patient, ordered by date (descending).
     Includes details of the encounter it's following up on (if applicable).
+    If limit is given, only the most recent `limit` encounters are returned.
     """
-    con = duckdb.connect(DB_FILE)
-    df = con.execute("""
-        SELECT
-            e1.id,
-            e1.patient_id,
-            e1.date,
-            e1.type,
-            e1.notes,
-            e1.doctor,
-            e1.follow_up_of_encounter_id,
-            e2.date AS followed_up_date,
-            e2.notes AS followed_up_notes,
-            e2.type AS followed_up_type
-        FROM encounters e1
-        LEFT JOIN encounters e2 ON e1.follow_up_of_encounter_id = e2.id
-        WHERE e1.patient_id = ?
-        ORDER BY e1.date DESC
-    """, [patient_id]).df()
+    con = _cursor()
+    df = _select_encounters(con, patient_id, limit)
     con.close()
     return df
 
 # --- Document Management Functions ---
 def add_document(patient_id, encounter_id, type_, file_path, text_content):
-    """Adds a new document record."""
-    con = duckdb.connect(DB_FILE)
-    con.execute(
-        "INSERT INTO documents (patient_id, encounter_id, type, file_path, text_content) VALUES (?, ?, ?, ?, ?)",
-        [patient_id, encounter_id, type_, file_path, text_content]
-    )
-    con.close()
+    """Adds a new document record and its extracted text. Returns the new id."""
+    with transaction() as con:
+        new_id = con.execute(
+            "INSERT INTO documents (patient_id, encounter_id, type, file_path) VALUES (?, ?, ?, ?) RETURNING id",
+            [patient_id, encounter_id, type_, file_path]
+        ).fetchone()[0]
+        con.execute(
+            "INSERT INTO documents_text (document_id, text_content) VALUES (?, ?)",
+            [new_id, text_content]
+        )
+    return new_id
 
-def get_documents(patient_id):
-    """Retrieves all documents for a specific patient."""
-    con = duckdb.connect(DB_FILE)
-    df = con.execute("SELECT * FROM documents WHERE patient_id = ? ORDER BY upload_time DESC", [patient_id]).df()
+def _select_documents(con, patient_id, limit=None):
+    # Metadata only; the extracted text is fetched on demand with get_document_text(s)
+    query = """
+        SELECT id, patient_id, encounter_id, type, file_path, upload_time
+        FROM documents WHERE patient_id = ? ORDER BY upload_time DESC
+    """
+    params = [patient_id]
+    if limit is not None:
+        query += " LIMIT ?"
+        params.append(limit)
+    return con.execute(query, params).df()
+
+def get_documents(patient_id, limit=None):
+    """Retrieves documents for a specific patient, newest first, optionally limited."""
+    con = _cursor()
+    df = _select_documents(con, patient_id, limit)
     con.close()
     return df
 
+def get_document_text(document_id):
+    """Retrieves the extracted text of a single document, or None."""
+    con = _cursor()
+    row = con.execute(
+        "SELECT text_content FROM documents_text WHERE document_id = ?", [document_id]
+    ).fetchone()
+    con.close()
+    return row[0] if row else None
+
+def get_document_texts(document_ids, max_chars=None):
+    """
+    Retrieves the extracted text of several documents as a {document_id: text} dict.
+    With max_chars, each text is cut to that many characters before leaving DuckDB.
+    """
+    con = _cursor()
+    rows = con.execute("""
+        SELECT document_id, CASE WHEN ? IS NULL THEN text_content ELSE left(text_content, ?) END
+        FROM documents_text WHERE list_contains(?, document_id)
+    """, [max_chars, max_chars, list(document_ids)]).fetchall()
+    con.close()
+    return dict(rows)
+
+def get_patient_bundle(patient_id):
+    """
+    Retrieves everything the encounter page shows for a patient on one cursor:
+    the patient record, their encounters and their documents.
+    """
+    con = _cursor()
+    bundle = {
+        "patient": _select_patient(con, patient_id),
+        "encounters": _select_encounters(con, patient_id),
+        "documents": _select_documents(con, patient_id),
+    }
+    con.close()
+    return bundle
+
 # --- Vitals Management Functions (Placeholder - implement add_vitals, get_vitals if needed) ---
+def _split_bp(bp):
+    """Splits a "120/80" blood pressure reading into (systolic, diastolic) ints, or (None, None)."""
+    systolic, sep, diastolic = (bp or "").partition("/")
+    try:
+        return (int(systolic), int(diastolic)) if sep else (None, None)
+    except ValueError:
+        return None, None
+
 def add_vitals(patient_id, heart_rate, bp, temp):
-    """Adds new vital signs for a patient."""
-    con = duckdb.connect(DB_FILE)
-    con.execute(
-        "INSERT INTO vitals (patient_id, heart_rate, bp, temp) VALUES (?, ?, ?, ?)",
-        [patient_id, heart_rate, bp, temp]
-    )
-    con.close()
+    """Adds new vital signs for a patient; bp is given as "systolic/diastolic"."""
+    bp_sys, bp_dia = _split_bp(bp)
+    with _WRITE_LOCK:
+        con = _cursor()
+        con.execute(
+            "INSERT INTO vitals (patient_id, heart_rate, bp_sys, bp_dia, temp) VALUES (?, ?, ?, ?, ?)",
+            [patient_id, heart_rate, bp_sys, bp_dia, temp]
+        )
+        con.close()
+
+def add_vitals_bulk(records):
+    """
+    Adds many vital-sign rows (a DataFrame or list of dicts) in a single insert.
+    Rows carry either bp_sys/bp_dia or a "systolic/diastolic" bp string.
+    """
+    df = records.copy() if isinstance(records, pd.DataFrame) else pd.DataFrame(records)
+    if "bp" in df.columns:
+        parts = df["bp"].astype("string").str.split("/", n=1, expand=True).reindex(columns=[0, 1])
+        df["bp_sys"] = pd.to_numeric(parts[0], errors="coerce").astype("Int16")
+        df["bp_dia"] = pd.to_numeric(parts[1], errors="coerce").astype("Int16")
+    df = df.reindex(columns=["patient_id", "heart_rate", "bp_sys", "bp_dia", "temp"])
+    _insert_frame("vitals", ["patient_id", "heart_rate", "bp_sys", "bp_dia", "temp"], df, checkpoint=True)
 
 def get_vitals(patient_id):
     """Retrieves vital signs for a specific patient."""
-    con = duckdb.connect(DB_FILE)
-    df = con.execute("SELECT * FROM vitals WHERE patient_id = ? ORDER BY timestamp DESC", [patient_id]).df()
+    con = _cursor()
+    # Only the columns the vitals chart plots; patient_id is fixed by the filter
+    df = con.execute("""
+        SELECT id, timestamp, heart_rate, bp_sys, bp_dia, temp
+        FROM vitals WHERE patient_id = ? ORDER BY timestamp DESC
+    """, [patient_id]).df()
     con.close()
     return df
 
@@ -338,43 +723,91 @@ def add_ai_log(patient_id, encounter_id, prompt, ai_response, context_type):
     """
     Logs an AI interaction, linking it to a patient and optionally an encounter.
     """
-    con = duckdb.connect(DB_FILE)
-    con.execute(
-        "INSERT INTO ai_logs (patient_id, encounter_id, timestamp, prompt, ai_response, context_type) VALUES (?, ?, CURRENT_TIMESTAMP, ?, ?, ?)",
-        [patient_id, encounter_id, prompt, ai_response, context_type]
-    )
-    con.close()
+    with _WRITE_LOCK:
+        con = _cursor()
+        con.execute(
+            "INSERT INTO ai_logs (patient_id, encounter_id, timestamp, prompt, ai_response, context_type) VALUES (?, ?, CURRENT_TIMESTAMP, ?, ?, ?)",
+            [patient_id, encounter_id, prompt, ai_response, context_type]
+        )
+        con.close()
 
 def get_ai_logs(patient_id):
     """Retrieves all AI logs for a specific patient."""
-    con = duckdb.connect(DB_FILE)
+    con = _cursor()
     df = con.execute("SELECT * FROM ai_logs WHERE patient_id = ? ORDER BY timestamp DESC", [patient_id]).df()
     con.close()
     return df
 
 # --- AI Conversation Functions ---
+# Chat turns are buffered and written behind in batches by a daemon thread; each turn is
+# timestamped when queued so history order doesn't depend on when the batch lands.
+AI_CONVERSATION_BATCH = 64
+AI_CONVERSATION_FLUSH_SECONDS = 0.5
+_ai_conversation_pending = []
+_ai_conversation_lock = threading.Lock()
+_ai_conversation_event = threading.Event()
+_ai_conversation_writer = None
+
+def _ai_conversation_writer_loop():
+    """Waits for queued turns, lets a burst accumulate briefly, then writes it in one insert."""
+    while True:
+        _ai_conversation_event.wait()
+        time.sleep(AI_CONVERSATION_FLUSH_SECONDS)
+        _ai_conversation_event.clear()
+        try:
+            flush_ai_conversations()
+        except Exception:
+            # The batch is back on the queue; the next turn or history read retries it
+            logger.exception("Writing queued AI conversation turns failed")
+
 def add_ai_conversation_entry(patient_id, role, content):
-    """Adds a single turn to the AI conversation history for a patient."""
-    con = duckdb.connect(DB_FILE)
-    con.execute(
-        "INSERT INTO ai_conversations (patient_id, timestamp, role, content) VALUES (?, CURRENT_TIMESTAMP, ?, ?)",
-        [patient_id, role, content]
-    )
-    con.close()
+    """Queues a single turn of the AI conversation history for a patient."""
+    global _ai_conversation_writer
+    with _ai_conversation_lock:
+        _ai_conversation_pending.append((patient_id, datetime.now(), role, content))
+        if _ai_conversation_writer is None or not _ai_conversation_writer.is_alive():
+            _ai_conversation_writer = threading.Thread(target=_ai_conversation_writer_loop, daemon=True)
+            _ai_conversation_writer.start()
+        full = len(_ai_conversation_pending) >= AI_CONVERSATION_BATCH
+    if full:
+        flush_ai_conversations()
+    else:
+        _ai_conversation_event.set()
+
+def flush_ai_conversations():
+    """Writes every queued conversation turn to the database; failed rows go back on the queue."""
+    # _WRITE_LOCK before the queue lock, the same order as a transaction() caller queueing a turn.
+    # Holding it across the insert also makes a history read wait for a batch already in flight.
+    with _WRITE_LOCK:
+        with _ai_conversation_lock:
+            rows = list(_ai_conversation_pending)
+            _ai_conversation_pending.clear()
+        if not rows:
+            return
+        try:
+            _insert_frame("ai_conversations", ["patient_id", "timestamp", "role", "content"], rows)
+        except BaseException:
+            with _ai_conversation_lock:
+                _ai_conversation_pending[:0] = rows
+            raise
+
+atexit.register(flush_ai_conversations)
 
 def get_ai_conversation_history(patient_id):
     """Retrieves the full AI conversation history for a specific patient."""
-    con = duckdb.connect(DB_FILE)
-    df = con.execute("SELECT role, content FROM ai_conversations WHERE patient_id = ? ORDER BY timestamp ASC", [patient_id]).df()
+    # Read-your-writes: land any queued turns before querying
+    flush_ai_conversations()
+    con = _cursor()
+    rows = con.execute("SELECT role, content FROM ai_conversations WHERE patient_id = ? ORDER BY timestamp ASC", [patient_id]).fetchall()
     con.close()
-    # Convert DataFrame to list of dictionaries for Streamlit chat_history
-    return df.to_dict('records') if not df.empty else []
+    # List of dictionaries for Streamlit chat_history, built straight from the row tuples
+    return [{"role": role, "content": content} for role, content in rows]
 
 # --- Analytics Functions ---
 def get_encounter_counts_by_type():
     """Returns a DataFrame with the count of each encounter type."""
-    con = duckdb.connect(DB_FILE)
-    df = con.execute("SELECT type, COUNT(*) as count FROM encounters GROUP BY type ORDER BY count DESC").df()
+    con = _cursor()
+    df = con.execute("SELECT type, count FROM mv_encounter_counts ORDER BY count DESC").df()
     con.close()
     return df
 
@@ -383,20 +816,28 @@ def get_patient_age_distribution():
     Calculates and returns the distribution of patient ages into groups.
     Note: Assumes DOB is a DATE type.
     """
-    con = duckdb.connect(DB_FILE)
+    con = _cursor()
     df = con.execute("""
+        -- Compute each patient's age once, then bucket it
+        WITH ages AS (
+            SELECT
+                -- Subtract one when this year's birthday is still ahead; month*100+day compares
+                -- as integers, so no date is formatted to a string
+                date_diff('year', dob, CURRENT_DATE)
+                    - CAST(month(CURRENT_DATE) * 100 + day(CURRENT_DATE) < month(dob) * 100 + day(dob) AS INTEGER) AS age
+            FROM patients
+        )
         SELECT
             CASE
-                WHEN dob IS NULL THEN 'Unknown'
-                -- The boolean result of the comparison needs to be cast to INTEGER (0 or 1)
-                WHEN (CAST(STRFTIME(CURRENT_DATE, '%Y') AS INTEGER) - CAST(STRFTIME(dob, '%Y') AS INTEGER) - CAST((CAST(STRFTIME(CURRENT_DATE, '%m%d') AS INTEGER) < CAST(STRFTIME(dob, '%m%d') AS INTEGER)) AS INTEGER)) < 18 THEN '0-17'
-                WHEN (CAST(STRFTIME(CURRENT_DATE, '%Y') AS INTEGER) - CAST(STRFTIME(dob, '%Y') AS INTEGER) - CAST((CAST(STRFTIME(CURRENT_DATE, '%m%d') AS INTEGER) < CAST(STRFTIME(dob, '%m%d') AS INTEGER)) AS INTEGER)) BETWEEN 18 AND 30 THEN '18-30'
-                WHEN (CAST(STRFTIME(CURRENT_DATE, '%Y') AS INTEGER) - CAST(STRFTIME(dob, '%Y') AS INTEGER) - CAST((CAST(STRFTIME(CURRENT_DATE, '%m%d') AS INTEGER) < CAST(STRFTIME(dob, '%m%d') AS INTEGER)) AS INTEGER)) BETWEEN 31 AND 50 THEN '31-50'
-                WHEN (CAST(STRFTIME(CURRENT_DATE, '%Y') AS INTEGER) - CAST(STRFTIME(dob, '%Y') AS INTEGER) - CAST((CAST(STRFTIME(CURRENT_DATE, '%m%d') AS INTEGER) < CAST(STRFTIME(dob, '%m%d') AS INTEGER)) AS INTEGER)) > 50 THEN '50+'
+                WHEN age IS NULL THEN 'Unknown'
+                WHEN age < 18 THEN '0-17'
+                WHEN age BETWEEN 18 AND 30 THEN '18-30'
+                WHEN age BETWEEN 31 AND 50 THEN '31-50'
+                WHEN age > 50 THEN '50+'
                 ELSE 'Other'
             END AS age_group,
             COUNT(*) as count
-        FROM patients
+        FROM ages
         GROUP BY age_group
         ORDER BY age_group;
     """).df()
@@ -405,19 +846,25 @@ def get_patient_age_distribution():
 
 def get_recent_patient_activity(limit=10):
     """Retrieves a DataFrame of recent patient encounters."""
-    con = duckdb.connect(DB_FILE)
-    df = con.execute(f"""
+    con = _cursor()
+    # Take the top `limit` encounters first, so only those rows are joined to patients
+    df = con.execute("""
+        WITH recent AS (
+            SELECT patient_id, date, type, notes, doctor
+            FROM encounters
+            ORDER BY date DESC
+            LIMIT ?
+        )
         SELECT
             p.name AS patient_name,
             e.date AS encounter_date,
             e.type AS encounter_type,
             e.notes AS encounter_notes,
             e.doctor AS doctor
-        FROM encounters e
+        FROM recent e
         JOIN patients p ON e.patient_id = p.id
-        ORDER BY e.date DESC
-        LIMIT {limit};
-    """).df()
+        ORDER BY e.date DESC;
+    """, [int(limit)]).df()
     con.close()
     return df
 
@@ -425,16 +872,19 @@ def get_recent_patient_activity(limit=10):
 def add_patient_enhanced(name, dob, gender, contact, address, emergency_contact=None,
                         blood_type=None, marital_status=None, employment=None,
                         insurance_provider=None, insurance_policy_number=None):
-    """Adds a new enhanced patient record to the database."""
-    con = duckdb.connect(DB_FILE)
-    con.execute("""
-        INSERT INTO patients (name, dob, gender, contact, address, emergency_contact,
-                             blood_type, marital_status, employment, insurance_provider,
-                             insurance_policy_number, updated_at)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-    """, [name, dob, gender, contact, address, emergency_contact, blood_type,
-          marital_status, employment, insurance_provider, insurance_policy_number])
-    con.close()
+    """Adds a new enhanced patient record to the database. Returns the new id."""
+    with _WRITE_LOCK:
+        con = _cursor()
+        new_id = con.execute("""
+            INSERT INTO patients (name, dob, gender, contact, address, emergency_contact,
+                                 blood_type, marital_status, employment, insurance_provider,
+                                 insurance_policy_number, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+            RETURNING id
+        """, [name, dob, gender, contact, address, emergency_contact, blood_type,
+              marital_status, employment, insurance_provider, insurance_policy_number]).fetchone()[0]
+        con.close()
+        return new_id
 
 def update_patient(patient_id, **kwargs):
     """Updates patient record with provided fields."""
@@ -445,151 +895,226 @@ def update_patient(patient_id, **kwargs):
     set_clause = ", ".join([f"{key} = ?" for key in kwargs.keys()])
     values = list(kwargs.values()) + [patient_id]
 
-    con = duckdb.connect(DB_FILE)
-    con.execute(f"""
-        UPDATE patients SET {set_clause}, updated_at = CURRENT_TIMESTAMP
-        WHERE id = ?
-    """, values)
-    con.close()
+    with _WRITE_LOCK:
+        con = _cursor()
+        con.execute(f"""
+            UPDATE patients SET {set_clause}, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        """, values)
+        con.close()
+
+# Every editable patient column, in the order UPDATE_PATIENT_SQL binds them
+PATIENT_EDITABLE_COLUMNS = (
+    "name", "dob", "gender", "contact", "address", "emergency_contact", "blood_type",
+    "marital_status", "employment", "insurance_provider", "insurance_policy_number",
+)
+# One fixed statement for every edit; a NULL parameter keeps the column's current value
+UPDATE_PATIENT_SQL = (
+    "UPDATE patients SET "
+    + ", ".join(f"{column} = COALESCE(?, {column})" for column in PATIENT_EDITABLE_COLUMNS)
+    + ", updated_at = CURRENT_TIMESTAMP WHERE id = ?"
+)
+
+def update_patient_full(patient_id, **fields):
+    """
+    Updates a patient's editable fields through the single fixed UPDATE_PATIENT_SQL statement.
+    Fields that are omitted or None keep their current values.
+    """
+    unknown = set(fields) - set(PATIENT_EDITABLE_COLUMNS)
+    if unknown:
+        raise ValueError(f"Unknown patient fields: {', '.join(sorted(unknown))}")
+    values = [fields.get(column) for column in PATIENT_EDITABLE_COLUMNS] + [patient_id]
+
+    with _WRITE_LOCK:
+        con = _cursor()
+        con.execute(UPDATE_PATIENT_SQL, values)
+        con.close()
 
 # --- Medication Management Functions ---
+# Medications are read-mostly reference data; the snapshot is dropped on every medication write.
+_medications_snapshot = None
+
 def add_medication(name, generic_name=None, drug_class=None, description=None,
                    contraindications=None, side_effects=None, interactions=None,
                    dosage_form=None, strength=None):
-    """Adds a new medication to the database."""
-    con = duckdb.connect(DB_FILE)
-    con.execute("""
-        INSERT INTO medications (name, generic_name, drug_class, description,
-                                contraindications, side_effects, interactions,
-                                dosage_form, strength)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, [name, generic_name, drug_class, description, contraindications,
-          side_effects, interactions, dosage_form, strength])
-    con.close()
+    """Adds a new medication to the database. Returns the new id."""
+    with _WRITE_LOCK:
+        con = _cursor()
+        new_id = con.execute("""
+            INSERT INTO medications (name, generic_name, drug_class, description,
+                                    contraindications, side_effects, interactions,
+                                    dosage_form, strength)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            RETURNING id
+        """, [name, generic_name, drug_class, description, contraindications,
+              side_effects, interactions, dosage_form, strength]).fetchone()[0]
+        con.close()
+        _invalidate_medications()
+        return new_id
+
+def add_medications_bulk(records):
+    """Adds many medications (a DataFrame or list of dicts) in a single insert."""
+    _insert_frame("medications", [
+        "name", "generic_name", "drug_class", "description", "contraindications",
+        "side_effects", "interactions", "dosage_form", "strength"
+    ], records, checkpoint=True)
+    _invalidate_medications()
+
+def _invalidate_medications():
+    """Drops the medications snapshot after a write."""
+    global _medications_snapshot
+    _medications_snapshot = None
 
 def get_medications():
-    """Retrieves all medications."""
-    con = duckdb.connect(DB_FILE)
-    df = con.execute("SELECT * FROM medications ORDER BY name").df()
-    con.close()
-    return df
+    """Retrieves all medications, served from an in-process snapshot between medication writes."""
+    global _medications_snapshot
+    if _medications_snapshot is None:
+        con = _cursor()
+        _medications_snapshot = con.execute("SELECT * FROM medications ORDER BY name").df()
+        con.close()
+    # Callers get their own copy so the snapshot itself is never mutated
+    return _medications_snapshot.copy()
 
 def add_prescription(patient_id, medication_id, encounter_id, dosage, frequency,
                      route, start_date, end_date, prescribed_by, notes=None):
-    """Adds a new prescription for a patient."""
-    con = duckdb.connect(DB_FILE)
-    con.execute("""
-        INSERT INTO prescriptions (patient_id, medication_id, encounter_id, dosage,
-                                   frequency, route, start_date, end_date,
-                                   prescribed_by, status, notes)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 'active', ?)
-    """, [patient_id, medication_id, encounter_id, dosage, frequency, route,
-          start_date, end_date, prescribed_by, notes])
-    con.close()
+    """Adds a new prescription for a patient. Returns the new id."""
+    with _WRITE_LOCK:
+        con = _cursor()
+        new_id = con.execute("""
+            INSERT INTO prescriptions (patient_id, medication_id, encounter_id, dosage,
+                                       frequency, route, start_date, end_date,
+                                       prescribed_by, status, notes)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 'active', ?)
+            RETURNING id
+        """, [patient_id, medication_id, encounter_id, dosage, frequency, route,
+              start_date, end_date, prescribed_by, notes]).fetchone()[0]
+        if medication_id is not None:
+            con.execute("""
+                INSERT INTO mv_prescription_counts VALUES (?, 1, 1)
+                ON CONFLICT (medication_id) DO UPDATE
+                SET prescription_count = prescription_count + 1, active_count = active_count + 1
+            """, [medication_id])
+        con.close()
+        return new_id
 
 def get_prescriptions(patient_id, status=None):
     """Retrieves prescriptions for a patient."""
-    con = duckdb.connect(DB_FILE)
-    if status:
-        df = con.execute("""
-            SELECT p.*, m.name as medication_name, m.generic_name
-            FROM prescriptions p
-            JOIN medications m ON p.medication_id = m.id
-            WHERE p.patient_id = ? AND p.status = ?
-            ORDER BY p.start_date DESC
-        """, [patient_id, status]).df()
-    else:
-        df = con.execute("""
-            SELECT p.*, m.name as medication_name, m.generic_name
-            FROM prescriptions p
-            JOIN medications m ON p.medication_id = m.id
-            WHERE p.patient_id = ?
-            ORDER BY p.start_date DESC
-        """, [patient_id]).df()
+    con = _cursor()
+    status = status or None
+    df = con.execute("""
+        SELECT p.*, m.name as medication_name, m.generic_name
+        FROM prescriptions p
+        JOIN medications m ON p.medication_id = m.id
+        WHERE p.patient_id = ? AND (? IS NULL OR p.status = ?)
+        ORDER BY p.start_date DESC
+    """, [patient_id, status, status]).df()
     con.close()
     return df
 
 def check_medication_interactions(medication_ids):
     """Checks for potential interactions between medications."""
-    con = duckdb.connect(DB_FILE)
-    placeholders = ",".join(["?" for _ in medication_ids])
-    df = con.execute(f"""
+    con = _cursor()
+    # The ids go in as one list parameter, so the statement text doesn't vary with their count
+    df = con.execute("""
         SELECT name, interactions FROM medications
-        WHERE id IN ({placeholders})
-    """, medication_ids).df()
+        WHERE list_contains(?, id)
+    """, [list(medication_ids)]).df()
     con.close()
     return df
 
 # --- Appointment Management Functions ---
 def add_appointment(patient_id, provider_id, appointment_type, appointment_date,
                     duration, notes=None):
-    """Adds a new appointment."""
-    con = duckdb.connect(DB_FILE)
-    con.execute("""
-        INSERT INTO appointments (patient_id, provider_id, appointment_type,
-                                 appointment_date, duration, status, notes)
-        VALUES (?, ?, ?, ?, ?, 'scheduled', ?)
-    """, [patient_id, provider_id, appointment_type, appointment_date,
-          duration, notes])
-    con.close()
+    """Adds a new appointment. Returns the new id."""
+    with _WRITE_LOCK:
+        con = _cursor()
+        new_id = con.execute("""
+            INSERT INTO appointments (patient_id, provider_id, appointment_type,
+                                     appointment_date, duration, status, notes)
+            VALUES (?, ?, ?, ?, ?, 'scheduled', ?)
+            RETURNING id
+        """, [patient_id, provider_id, appointment_type, appointment_date,
+              duration, notes]).fetchone()[0]
+        if appointment_type is not None:
+            con.execute("""
+                INSERT INTO mv_appointment_counts VALUES (?, 1, 0, 0, 0)
+                ON CONFLICT (appointment_type) DO UPDATE SET total_count = total_count + 1
+            """, [appointment_type])
+        con.close()
+        return new_id
 
 def get_appointments(patient_id=None, provider_id=None, status=None):
     """Retrieves appointments with optional filters."""
-    con = duckdb.connect(DB_FILE)
-    query = """
+    con = _cursor()
+    # One statement text for every filter combination; a NULL parameter disables its filter
+    patient_id, provider_id, status = patient_id or None, provider_id or None, status or None
+    df = con.execute("""
         SELECT a.*, p.name as patient_name
         FROM appointments a
         JOIN patients p ON a.patient_id = p.id
-        WHERE 1=1
-    """
-    params = []
-
-    if patient_id:
-        query += " AND a.patient_id = ?"
-        params.append(patient_id)
-
-    if provider_id:
-        query += " AND a.provider_id = ?"
-        params.append(provider_id)
-
-    if status:
-        query += " AND a.status = ?"
-        params.append(status)
-
-    query += " ORDER BY a.appointment_date ASC"
-
-    df = con.execute(query, params).df()
+        WHERE (? IS NULL OR a.patient_id = ?)
+          AND (? IS NULL OR a.provider_id = ?)
+          AND (? IS NULL OR a.status = ?)
+        ORDER BY a.appointment_date ASC
+    """, [patient_id, patient_id, provider_id, provider_id, status, status]).df()
     con.close()
     return df
 
 def update_appointment_status(appointment_id, status):
     """Updates appointment status."""
-    con = duckdb.connect(DB_FILE)
-    con.execute("""
-        UPDATE appointments SET status = ?, updated_at = CURRENT_TIMESTAMP
-        WHERE id = ?
-    """, [status, appointment_id])
-    con.close()
+    with _WRITE_LOCK:
+        con = _cursor()
+        con.execute("""
+            UPDATE appointments SET status = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        """, [status, appointment_id])
+        _refresh_appointment_counts(con, [appointment_id])
+        con.close()
+
+def update_appointment_status_bulk(appointment_ids, status):
+    """Updates the status of several appointments in a single statement."""
+    if not appointment_ids:
+        return
+    with _WRITE_LOCK:
+        con = _cursor()
+        con.execute("""
+            UPDATE appointments SET status = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE list_contains(?, id)
+        """, [status, list(appointment_ids)])
+        _refresh_appointment_counts(con, list(appointment_ids))
+        con.close()
 
 # --- Lab Results Functions ---
 def add_lab_result(patient_id, encounter_id, test_name, test_category,
                    result_value, reference_range=None, unit=None, status=None,
                    performed_date=None, performed_by=None, notes=None):
-    """Adds a new lab result."""
-    con = duckdb.connect(DB_FILE)
-    con.execute("""
-        INSERT INTO lab_results (patient_id, encounter_id, test_name, test_category,
-                                result_value, reference_range, unit, status,
-                                performed_date, performed_by, notes)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, [patient_id, encounter_id, test_name, test_category, result_value,
-          reference_range, unit, status or 'normal', performed_date or datetime.now().date(),
-          performed_by, notes])
-    con.close()
+    """Adds a new lab result. Returns the new id."""
+    with _WRITE_LOCK:
+        con = _cursor()
+        new_id = con.execute("""
+            INSERT INTO lab_results (patient_id, encounter_id, test_name, test_category,
+                                    result_value, reference_range, unit, status,
+                                    performed_date, performed_by, notes)
+            VALUES (?, ?, ?, ?, ?, ?, ?, COALESCE(NULLIF(?, ''), 'normal'), COALESCE(?, CURRENT_DATE), ?, ?)
+            RETURNING id
+        """, [patient_id, encounter_id, test_name, test_category, result_value,
+              reference_range, unit, status, performed_date,
+              performed_by, notes]).fetchone()[0]
+        con.close()
+        return new_id
+
+def add_lab_results_bulk(records):
+    """Adds many lab results (a DataFrame or list of dicts) in a single insert, with add_lab_result's defaults."""
+    columns = ["patient_id", "encounter_id", "test_name", "test_category", "result_value",
+               "reference_range", "unit", "status", "performed_date", "performed_by", "notes"]
+    df = records[columns].copy() if isinstance(records, pd.DataFrame) else pd.DataFrame(records, columns=columns)
+    df["status"] = df["status"].fillna("normal")
+    df["performed_date"] = df["performed_date"].fillna(datetime.now().date())
+    _insert_frame("lab_results", columns, df, checkpoint=True)
 
 def get_lab_results(patient_id, test_category=None):
     """Retrieves lab results for a patient."""
-    con = duckdb.connect(DB_FILE)
+    con = _cursor()
     if test_category:
         df = con.execute("""
             SELECT * FROM lab_results
@@ -608,18 +1133,21 @@ def get_lab_results(patient_id, test_category=None):
 # --- Allergy Management Functions ---
 def add_allergy(patient_id, allergen, allergen_type, reaction, severity,
                 notes=None):
-    """Adds a new allergy record for a patient."""
-    con = duckdb.connect(DB_FILE)
-    con.execute("""
-        INSERT INTO allergies (patient_id, allergen, allergen_type, reaction,
-                               severity, status, notes)
-        VALUES (?, ?, ?, ?, ?, 'active', ?)
-    """, [patient_id, allergen, allergen_type, reaction, severity, notes])
-    con.close()
+    """Adds a new allergy record for a patient. Returns the new id."""
+    with _WRITE_LOCK:
+        con = _cursor()
+        new_id = con.execute("""
+            INSERT INTO allergies (patient_id, allergen, allergen_type, reaction,
+                                   severity, status, notes)
+            VALUES (?, ?, ?, ?, ?, 'active', ?)
+            RETURNING id
+        """, [patient_id, allergen, allergen_type, reaction, severity, notes]).fetchone()[0]
+        con.close()
+        return new_id
 
 def get_allergies(patient_id, status='active'):
     """Retrieves allergies for a patient."""
-    con = duckdb.connect(DB_FILE)
+    con = _cursor()
     df = con.execute("""
         SELECT * FROM allergies
         WHERE patient_id = ? AND status = ?
@@ -632,20 +1160,23 @@ def get_allergies(patient_id, status='active'):
 def add_immunization(patient_id, vaccine_name, vaccine_type, dose_number,
                      administered_date, administered_by, next_due_date=None,
                      lot_number=None, site=None, notes=None):
-    """Adds a new immunization record."""
-    con = duckdb.connect(DB_FILE)
-    con.execute("""
-        INSERT INTO immunizations (patient_id, vaccine_name, vaccine_type,
-                                   dose_number, administered_date, administered_by,
-                                   next_due_date, lot_number, site, notes)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, [patient_id, vaccine_name, vaccine_type, dose_number, administered_date,
-          administered_by, next_due_date, lot_number, site, notes])
-    con.close()
+    """Adds a new immunization record. Returns the new id."""
+    with _WRITE_LOCK:
+        con = _cursor()
+        new_id = con.execute("""
+            INSERT INTO immunizations (patient_id, vaccine_name, vaccine_type,
+                                       dose_number, administered_date, administered_by,
+                                       next_due_date, lot_number, site, notes)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            RETURNING id
+        """, [patient_id, vaccine_name, vaccine_type, dose_number, administered_date,
+              administered_by, next_due_date, lot_number, site, notes]).fetchone()[0]
+        con.close()
+        return new_id
 
 def get_immunizations(patient_id):
     """Retrieves immunization records for a patient."""
-    con = duckdb.connect(DB_FILE)
+    con = _cursor()
     df = con.execute("""
         SELECT * FROM immunizations
         WHERE patient_id = ?
@@ -656,38 +1187,111 @@ def get_immunizations(patient_id):
 
 # --- Analytics Functions ---
 def get_prescription_analytics():
-    """Get prescription analytics and trends."""
-    con = duckdb.connect(DB_FILE)
-    df = con.execute("""
+    """Get prescription analytics and trends as a {column: numpy array} dict."""
+    con = _cursor()
+    # Small chart-only aggregates: fetch column arrays directly instead of building a DataFrame
+    columns = con.execute("""
         SELECT
             m.name as medication_name,
-            COUNT(*) as prescription_count,
-            AVG(CASE WHEN status = 'active' THEN 1 ELSE 0 END) as active_rate
-        FROM prescriptions p
-        JOIN medications m ON p.medication_id = m.id
+            SUM(c.prescription_count)::BIGINT as prescription_count,
+            SUM(c.active_count) / SUM(c.prescription_count) as active_rate
+        FROM mv_prescription_counts c
+        JOIN medications m ON c.medication_id = m.id
         GROUP BY m.name
         ORDER BY prescription_count DESC
         LIMIT 20
-    """).df()
+    """).fetchnumpy()
     con.close()
-    return df
+    return columns
 
 def get_appointment_analytics():
-    """Get appointment statistics and trends."""
-    con = duckdb.connect(DB_FILE)
-    df = con.execute("""
-        SELECT
-            appointment_type,
-            COUNT(*) as total_count,
-            SUM(CASE WHEN status = 'completed' THEN 1 ELSE 0 END) as completed_count,
-            SUM(CASE WHEN status = 'cancelled' THEN 1 ELSE 0 END) as cancelled_count,
-            SUM(CASE WHEN status = 'no-show' THEN 1 ELSE 0 END) as no_show_count
-        FROM appointments
-        GROUP BY appointment_type
+    """Get appointment statistics and trends as a {column: numpy array} dict."""
+    con = _cursor()
+    columns = con.execute("""
+        SELECT appointment_type, total_count, completed_count, cancelled_count, no_show_count
+        FROM mv_appointment_counts
         ORDER BY total_count DESC
-    """).df()
+    """).fetchnumpy()
     con.close()
-    return df
+    return columns
+
+# --- User Account Functions ---
+USER_COLUMNS = ["username", "password", "role", "name", "email", "created_at",
+                "last_login", "failed_attempts", "locked_until"]
+
+def get_user(username):
+    """Retrieves a single user account as a dict, or None if it doesn't exist."""
+    con = _cursor()
+    row = con.execute(
+        f"SELECT {', '.join(USER_COLUMNS)} FROM users WHERE username = ?", [username]
+    ).fetchone()
+    con.close()
+    return dict(zip(USER_COLUMNS, row)) if row else None
+
+def get_users():
+    """Retrieves all user accounts as a {username: record} dict."""
+    con = _cursor()
+    rows = con.execute(f"SELECT {', '.join(USER_COLUMNS)} FROM users").fetchall()
+    con.close()
+    return {row[0]: dict(zip(USER_COLUMNS[1:], row[1:])) for row in rows}
+
+def count_users():
+    """Returns the number of user accounts."""
+    con = _cursor()
+    count = con.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+    con.close()
+    return count
+
+def add_user(username, password, role, name, email):
+    """Adds a new user account."""
+    with _WRITE_LOCK:
+        con = _cursor()
+        con.execute(
+            "INSERT INTO users (username, password, role, name, email, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            [username, password, role, name, email, datetime.now()]
+        )
+        con.close()
+
+def import_users(users):
+    """Bulk-inserts a {username: record} dict, skipping usernames that already exist."""
+    with _WRITE_LOCK:
+        con = _cursor()
+        con.executemany(
+            f"INSERT OR IGNORE INTO users ({', '.join(USER_COLUMNS)}) VALUES ({', '.join('?' * len(USER_COLUMNS))})",
+            [[username] + [user.get(column) for column in USER_COLUMNS[1:]] for username, user in users.items()]
+        )
+        con.close()
+
+def record_user_login(username):
+    """Stamps a successful login and clears any failed attempts or lock."""
+    with _WRITE_LOCK:
+        con = _cursor()
+        con.execute("""
+            UPDATE users SET last_login = ?, failed_attempts = 0, locked_until = NULL
+            WHERE username = ?
+        """, [datetime.now(), username])
+        con.close()
+
+def record_user_failed_login(username, locked_until, max_attempts=3):
+    """Increments failed attempts, locking the account until `locked_until` (epoch seconds) once max_attempts is reached."""
+    with _WRITE_LOCK:
+        con = _cursor()
+        con.execute("""
+            UPDATE users SET
+                failed_attempts = failed_attempts + 1,
+                locked_until = CASE WHEN failed_attempts + 1 >= ? THEN ? ELSE locked_until END
+            WHERE username = ?
+        """, [max_attempts, locked_until, username])
+        con.close()
+
+def unlock_user(username):
+    """Clears an expired account lock."""
+    with _WRITE_LOCK:
+        con = _cursor()
+        con.execute(
+            "UPDATE users SET failed_attempts = 0, locked_until = NULL WHERE username = ?", [username]
+        )
+        con.close()
 
 # Example of how to initialize the database if this script is run directly
 if __name__ == "__main__":
@@ -8,14 +8,15 @@ import sys
 import os
 from datetime import datetime, timedelta
 import random
+import numpy as np
 import pandas as pd
 
 # Add current directory to path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from db import (
-    init_db, add_patient_enhanced, add_encounter, add_medication, add_prescription,
-    add_appointment, add_lab_result, add_allergy, add_immunization
+    init_db, add_patient_enhanced, add_encounter, add_medications_bulk, add_prescription,
+    add_lab_results_bulk, add_allergy, add_immunization, refresh_analytics, transaction
 )
 
 # Sample data
@@ -92,12 +93,13 @@ VACCINES = [
     ("HPV", "HPV", "Gardasil 9")
 ]
 
-def generate_random_date(start_date, end_date):
-    """Generate a random date between start_date and end_date."""
-    time_between = end_date - start_date
-    days_between = time_between.days
-    random_number_of_days = random.randrange(days_between)
-    return start_date + timedelta(days=random_number_of_days)
+# Shared generator for the vectorized draws below
+RNG = np.random.default_rng()
+
+def generate_random_dates(start_date, end_date, n):
+    """Generate n random datetimes between start_date and end_date with one NumPy draw."""
+    days = RNG.integers(0, (end_date - start_date).days, size=n)
+    return (np.datetime64(start_date, 'us') + days.astype('timedelta64[D]')).tolist()
 
 def init_sample_data():
     """Initialize the database with sample data."""
@@ -106,79 +108,104 @@ def init_sample_data():
     # Initialize database
     init_db()
 
-    # Add medications
-    print("💊 Adding medications to library...")
-    for med in MEDICATIONS:
-        add_medication(*med)
-
-    # Create sample patients
-    print("👥 Creating sample patients...")
-    patients_created = 0
-
-    for i in range(25):  # Create 25 sample patients
-        first_name = random.choice(FIRST_NAMES)
-        last_name = random.choice(LAST_NAMES)
-        name = f"{first_name} {last_name}"
-
-        # Generate random demographics
-        birth_year = random.randint(1940, 2005)
-        dob = datetime(birth_year, random.randint(1, 12), random.randint(1, 28))
-        gender = random.choice(["Male", "Female", "Other"])
-
-        # Contact info
-        phone = f"({random.randint(200, 999)}) {random.randint(200, 999)}-{random.randint(1000, 9999)}"
-        email = f"{first_name.lower()}.{last_name.lower()}@email.com"
-
-        # Address
-        street_num = random.randint(100, 9999)
-        street_names = ["Main St", "Oak Ave", "Pine Ln", "Maple Dr", "Cedar Blvd", "Elm Way"]
-        street = random.choice(street_names)
-        city = random.choice(["Springfield", "Franklin", "Georgetown", "Madison", "Washington"])
-        state = random.choice(["IL", "OH", "KY", "WI", "VA"])
-        zip_code = f"{random.randint(10000, 99999)}"
-        address = f"{street_num} {street}, {city}, {state} {zip_code}"
-
-        # Additional demographics
-        blood_type = random.choice(["A+", "A-", "B+", "B-", "AB+", "AB-", "O+", "O-"])
-        marital_status = random.choice(["Single", "Married", "Divorced", "Widowed"])
-        employment = random.choice(["Employed", "Self-employed", "Retired", "Student", "Unemployed"])
-
-        # Insurance
-        insurance_providers = ["Blue Cross Blue Shield", "Aetna", "UnitedHealth", "Cigna", "Humana"]
-        insurance_provider = random.choice(insurance_providers)
-        insurance_policy = f"{random.randint(100000000, 999999999)}"
-
-        # Add patient
-        add_patient_enhanced(
-            name=name,
-            dob=dob.date(),
-            gender=gender,
-            contact=phone,
-            address=address,
-            emergency_contact=f"{first_name} {last_name} Sr - {phone}",
-            blood_type=blood_type,
-            marital_status=marital_status,
-            employment=employment,
-            insurance_provider=insurance_provider,
-            insurance_policy_number=insurance_policy
-        )
-
-        patients_created += 1
-        print(f"  Created patient: {name} (ID: {patients_created})")
-
-        # Add encounters for this patient
-        num_encounters = random.randint(1, 5)
-        for j in range(num_encounters):
-            encounter_date = generate_random_date(dob + timedelta(days=365*18), datetime.now())
-            encounter_type = random.choice(["Consultation", "Follow-up", "Emergency", "Procedure"])
-
-            # Generate SOAP note
-            chief_complaint = random.choice([
-                "Annual checkup", "Chest pain", "Shortness of breath", "Abdominal pain",
-                "Headache", "Joint pain", "Fever", "Cough", "Fatigue", "Dizziness"
-            ])
-
-            soap_note = f"""
+    # Everything below commits once, instead of once per inserted row
+    with transaction() as con:
+        # Add medications
+        print("💊 Adding medications to library...")
+        # The tuples are already in medications column order, so they go in as one DataFrame insert
+        add_medications_bulk(MEDICATIONS)
+
+        # Create sample patients
+        print("👥 Creating sample patients...")
+        patients_created = 0
+        patient_ids = []
+        lab_rows = []  # Inserted together after the patient loop
+
+        # Draw every patient's demographics up front: one vectorized RNG call per field
+        # instead of a random.choice/randint call per field per patient
+        num_patients = 25
+        first_names = RNG.choice(FIRST_NAMES, num_patients).tolist()
+        last_names = RNG.choice(LAST_NAMES, num_patients).tolist()
+        birth_dates = np.stack([
+            RNG.integers(1940, 2006, num_patients),
+            RNG.integers(1, 13, num_patients),
+            RNG.integers(1, 29, num_patients),
+        ], axis=1).tolist()
+        genders = RNG.choice(["Male", "Female", "Other"], num_patients).tolist()
+        phone_parts = RNG.integers([200, 200, 1000], [1000, 1000, 10000], size=(num_patients, 3)).tolist()
+        street_nums = RNG.integers(100, 10000, num_patients).tolist()
+        streets = RNG.choice(["Main St", "Oak Ave", "Pine Ln", "Maple Dr", "Cedar Blvd", "Elm Way"], num_patients).tolist()
+        cities = RNG.choice(["Springfield", "Franklin", "Georgetown", "Madison", "Washington"], num_patients).tolist()
+        states = RNG.choice(["IL", "OH", "KY", "WI", "VA"], num_patients).tolist()
+        zip_codes = RNG.integers(10000, 100000, num_patients).tolist()
+        blood_types = RNG.choice(["A+", "A-", "B+", "B-", "AB+", "AB-", "O+", "O-"], num_patients).tolist()
+        marital_statuses = RNG.choice(["Single", "Married", "Divorced", "Widowed"], num_patients).tolist()
+        employments = RNG.choice(["Employed", "Self-employed", "Retired", "Student", "Unemployed"], num_patients).tolist()
+        insurance_providers = RNG.choice(["Blue Cross Blue Shield", "Aetna", "UnitedHealth", "Cigna", "Humana"], num_patients).tolist()
+        insurance_policies = RNG.integers(100000000, 1000000000, num_patients).tolist()
+
+        for i in range(num_patients):  # Create 25 sample patients
+            first_name, last_name = first_names[i], last_names[i]
+            name = f"{first_name} {last_name}"
+
+            # Demographics
+            dob = datetime(*birth_dates[i])
+            gender = genders[i]
+
+            # Contact info
+            phone = "({}) {}-{}".format(*phone_parts[i])
+            email = f"{first_name.lower()}.{last_name.lower()}@email.com"
+
+            # Address
+            address = f"{street_nums[i]} {streets[i]}, {cities[i]}, {states[i]} {zip_codes[i]}"
+
+            # Additional demographics
+            blood_type = blood_types[i]
+            marital_status = marital_statuses[i]
+            employment = employments[i]
+
+            # Insurance
+            insurance_provider = insurance_providers[i]
+            insurance_policy = str(insurance_policies[i])
+
+            # Add patient
+            patient_id = add_patient_enhanced(
+                name=name,
+                dob=dob.date(),
+                gender=gender,
+                contact=phone,
+                address=address,
+                emergency_contact=f"{first_name} {last_name} Sr - {phone}",
+                blood_type=blood_type,
+                marital_status=marital_status,
+                employment=employment,
+                insurance_provider=insurance_provider,
+                insurance_policy_number=insurance_policy
+            )
+
+            patients_created += 1
+            patient_ids.append(patient_id)
+            print(f"  Created patient: {name} (ID: {patient_id})")
+
+            # Add encounters for this patient
+            num_encounters = random.randint(1, 5)
+            # Insert each patient's encounters oldest first, so rows land clustered by
+            # (patient_id, date) and DuckDB's row-group min/max stats can prune date ranges
+            encounter_dates = sorted(
+                generate_random_dates(dob + timedelta(days=365*18), datetime.now(), num_encounters)
+            )
+            # One random.choices(k=...) call per field instead of a random.choice per encounter
+            encounter_types = random.choices(["Consultation", "Follow-up", "Emergency", "Procedure"], k=num_encounters)
+            doctors = random.choices(["Dr. Smith", "Dr. Johnson", "Dr. Williams", "Dr. Brown", "Dr. Jones"], k=num_encounters)
+            for encounter_date, encounter_type, doctor in zip(encounter_dates, encounter_types, doctors):
+
+                # Generate SOAP note
+                chief_complaint = random.choice([
+                    "Annual checkup", "Chest pain", "Shortness of breath", "Abdominal pain",
+                    "Headache", "Joint pain", "Fever", "Cough", "Fatigue", "Dizziness"
+                ])
+
+                soap_note = f"""
 CHIEF COMPLAINT: {chief_complaint}
 
 SUBJECTIVE: Patient presents with {chief_complaint.lower()}. Reports {random.choice(['mild', 'moderate', 'severe'])} symptoms
@@ -192,150 +219,157 @@ RR {random.randint(12, 20)}, Temp {random.randint(97, 99)}.{random.randint(0, 9)
 ASSESSMENT: {random.choice(CONDITIONS)}. {random.choice(['Well-controlled', 'Mildly symptomatic', 'Requires treatment optimization'])}.
 
 PLAN: Continue current medications. {random.choice(['Lifestyle modifications advised', 'Start new medication', 'Schedule follow-up in 2 weeks', 'Order lab tests'])}.
-            """.strip()
-
-            doctor = random.choice(["Dr. Smith", "Dr. Johnson", "Dr. Williams", "Dr. Brown", "Dr. Jones"])
-
-            add_encounter(
-                patient_id=patients_created,
-                date=encounter_date.date(),
-                type_=encounter_type,
-                notes=soap_note,
-                doctor=doctor
-            )
-
-        # Add allergies for some patients
-        if random.random() < 0.3:  # 30% of patients have allergies
-            num_allergies = random.randint(1, 3)
-            for k in range(num_allergies):
-                allergen = random.choice(ALLERGENS)
-                add_allergy(
-                    patient_id=patients_created,
-                    allergen=allergen[0],
-                    allergen_type=allergen[1],
-                    reaction=allergen[2],
-                    severity=allergen[3]
+                """.strip()
+
+                add_encounter(
+                    patient_id=patient_id,
+                    date=encounter_date.date(),
+                    type_=encounter_type,
+                    notes=soap_note,
+                    doctor=doctor
                 )
 
-        # Add prescriptions for some patients
-        if random.random() < 0.6:  # 60% of patients have prescriptions
-            num_prescriptions = random.randint(1, 4)
-            for k in range(num_prescriptions):
-                medication_id = random.randint(1, len(MEDICATIONS))
-                dosage_options = {
-                    1: "10mg daily", 2: "500mg twice daily", 3: "5mg daily", 4: "2 puffs q4-6h PRN",
-                    5: "20mg daily", 6: "20mg at bedtime", 7: "50mg daily", 8: "50mcg daily",
-                    9: "300mg three times daily", 10: "25mg daily"
-                }
-                frequency_options = ["Once daily", "Twice daily", "Three times daily", "As needed", "At bedtime"]
-
-                start_date = generate_random_date(dob + timedelta(days=365*18), datetime.now())
-                end_date = start_date + timedelta(days=random.randint(30, 365))
-
-                add_prescription(
-                    patient_id=patients_created,
-                    medication_id=medication_id,
-                    encounter_id=None,
-                    dosage=dosage_options.get(medication_id, "Take as directed"),
-                    frequency=random.choice(frequency_options),
-                    route="Oral",
-                    start_date=start_date.date(),
-                    end_date=end_date.date(),
-                    prescribed_by=random.choice(["Dr. Smith", "Dr. Johnson", "Dr. Williams"])
-                )
-
-        # Add lab results for some patients
-        if random.random() < 0.4:  # 40% of patients have lab results
-            num_labs = random.randint(1, 3)
-            for k in range(num_labs):
-                test_categories = ["CBC", "Chemistry", "Lipid Panel", "HbA1c", "TSH"]
-                test_names = {
-                    "CBC": "Complete Blood Count",
-                    "Chemistry": "Comprehensive Metabolic Panel",
-                    "Lipid Panel": "Lipid Panel",
-                    "HbA1c": "Hemoglobin A1c",
-                    "TSH": "Thyroid Stimulating Hormone"
-                }
-
-                category = random.choice(test_categories)
-                test_date = generate_random_date(dob + timedelta(days=365*18), datetime.now())
-
-                # Generate realistic lab values
-                if category == "CBC":
-                    result_value = f"Hgb: {random.uniform(11.0, 16.0):.1f} g/dL, WBC: {random.uniform(4.0, 11.0):.1f} K/μL"
-                    unit = "Various"
-                    ref_range = "Hgb: 12.0-15.5 g/dL, WBC: 4.5-11.0 K/μL"
-                elif category == "Chemistry":
-                    result_value = f"Glucose: {random.randint(70, 120)} mg/dL, Creatinine: {random.uniform(0.6, 1.3):.2f} mg/dL"
-                    unit = "Various"
-                    ref_range = "Glucose: 70-100 mg/dL, Creatinine: 0.6-1.3 mg/dL"
-                elif category == "Lipid Panel":
-                    result_value = f"Total Cholesterol: {random.randint(150, 250)} mg/dL, LDL: {random.randint(70, 160)} mg/dL"
-                    unit = "mg/dL"
-                    ref_range = "Total <200, LDL <100"
-                elif category == "HbA1c":
-                    result_value = f"{random.uniform(5.0, 8.5):.1f}%"
-                    unit = "%"
-                    ref_range = "4.0-5.6%"
-                else:  # TSH
-                    result_value = f"{random.uniform(0.4, 5.5):.2f} mIU/L"
-                    unit = "mIU/L"
-                    ref_range = "0.4-4.0 mIU/L"
-
-                status = random.choice(["normal", "abnormal", "critical"])
-
-                add_lab_result(
-                    patient_id=patients_created,
-                    encounter_id=None,
-                    test_name=test_names[category],
-                    test_category=category,
-                    result_value=result_value,
-                    reference_range=ref_range,
-                    unit=unit,
-                    status=status,
-                    performed_date=test_date.date(),
-                    performed_by="Quest Diagnostics"
-                )
-
-        # Add immunizations for some patients
-        if random.random() < 0.7:  # 70% of patients have immunizations
-            num_vaccines = random.randint(1, 5)
-            for k in range(num_vaccines):
-                vaccine = random.choice(VACCINES)
-                vaccine_date = generate_random_date(dob + timedelta(days=365), datetime.now())
-
-                add_immunization(
-                    patient_id=patients_created,
-                    vaccine_name=vaccine[0],
-                    vaccine_type=vaccine[1],
-                    dose_number=random.randint(1, 3),
-                    administered_date=vaccine_date.date(),
-                    administered_by="Dr. Smith",
-                    next_due_date=vaccine_date + timedelta(days=random.randint(365, 1825)) if random.random() < 0.5 else None,
-                    lot_number=f"LOT{random.randint(1000000, 9999999)}",
-                    site=random.choice(["Left Arm", "Right Arm"])
-                )
-
-    # Add appointments
-    print("📅 Creating sample appointments...")
-    for i in range(1, min(26, patients_created + 1)):  # For first 25 patients
-        num_appointments = random.randint(1, 3)
-        for j in range(num_appointments):
-            apt_date = datetime.now() + timedelta(days=random.randint(-30, 30))
-            apt_time = apt_date.replace(
-                hour=random.choice([9, 10, 11, 14, 15, 16]),
-                minute=random.choice([0, 15, 30, 45]),
-                second=0
-            )
-
-            add_appointment(
-                patient_id=i,
-                provider_id=1,  # Dr. Smith
-                appointment_type=random.choice(["Consultation", "Follow-up", "Procedure", "Vaccination"]),
-                appointment_date=apt_time,
-                duration=random.choice([15, 30, 45, 60]),
-                notes=random.choice(["", "Annual checkup", "Follow-up required", "New patient"])
+            # Add allergies for some patients
+            if random.random() < 0.3:  # 30% of patients have allergies
+                num_allergies = random.randint(1, 3)
+                for allergen in random.choices(ALLERGENS, k=num_allergies):
+                    add_allergy(
+                        patient_id=patient_id,
+                        allergen=allergen[0],
+                        allergen_type=allergen[1],
+                        reaction=allergen[2],
+                        severity=allergen[3]
+                    )
+
+            # Add prescriptions for some patients
+            if random.random() < 0.6:  # 60% of patients have prescriptions
+                num_prescriptions = random.randint(1, 4)
+                start_dates = generate_random_dates(dob + timedelta(days=365*18), datetime.now(), num_prescriptions)
+                for k in range(num_prescriptions):
+                    medication_id = random.randint(1, len(MEDICATIONS))
+                    dosage_options = {
+                        1: "10mg daily", 2: "500mg twice daily", 3: "5mg daily", 4: "2 puffs q4-6h PRN",
+                        5: "20mg daily", 6: "20mg at bedtime", 7: "50mg daily", 8: "50mcg daily",
+                        9: "300mg three times daily", 10: "25mg daily"
+                    }
+                    frequency_options = ["Once daily", "Twice daily", "Three times daily", "As needed", "At bedtime"]
+
+                    start_date = start_dates[k]
+                    end_date = start_date + timedelta(days=random.randint(30, 365))
+
+                    add_prescription(
+                        patient_id=patient_id,
+                        medication_id=medication_id,
+                        encounter_id=None,
+                        dosage=dosage_options.get(medication_id, "Take as directed"),
+                        frequency=random.choice(frequency_options),
+                        route="Oral",
+                        start_date=start_date.date(),
+                        end_date=end_date.date(),
+                        prescribed_by=random.choice(["Dr. Smith", "Dr. Johnson", "Dr. Williams"])
+                    )
+
+            # Add lab results for some patients
+            if random.random() < 0.4:  # 40% of patients have lab results
+                num_labs = random.randint(1, 3)
+                test_dates = generate_random_dates(dob + timedelta(days=365*18), datetime.now(), num_labs)
+                for k in range(num_labs):
+                    test_categories = ["CBC", "Chemistry", "Lipid Panel", "HbA1c", "TSH"]
+                    test_names = {
+                        "CBC": "Complete Blood Count",
+                        "Chemistry": "Comprehensive Metabolic Panel",
+                        "Lipid Panel": "Lipid Panel",
+                        "HbA1c": "Hemoglobin A1c",
+                        "TSH": "Thyroid Stimulating Hormone"
+                    }
+
+                    category = random.choice(test_categories)
+                    test_date = test_dates[k]
+
+                    # Generate realistic lab values
+                    if category == "CBC":
+                        result_value = f"Hgb: {random.uniform(11.0, 16.0):.1f} g/dL, WBC: {random.uniform(4.0, 11.0):.1f} K/μL"
+                        unit = "Various"
+                        ref_range = "Hgb: 12.0-15.5 g/dL, WBC: 4.5-11.0 K/μL"
+                    elif category == "Chemistry":
+                        result_value = f"Glucose: {random.randint(70, 120)} mg/dL, Creatinine: {random.uniform(0.6, 1.3):.2f} mg/dL"
+                        unit = "Various"
+                        ref_range = "Glucose: 70-100 mg/dL, Creatinine: 0.6-1.3 mg/dL"
+                    elif category == "Lipid Panel":
+                        result_value = f"Total Cholesterol: {random.randint(150, 250)} mg/dL, LDL: {random.randint(70, 160)} mg/dL"
+                        unit = "mg/dL"
+                        ref_range = "Total <200, LDL <100"
+                    elif category == "HbA1c":
+                        result_value = f"{random.uniform(5.0, 8.5):.1f}%"
+                        unit = "%"
+                        ref_range = "4.0-5.6%"
+                    else:  # TSH
+                        result_value = f"{random.uniform(0.4, 5.5):.2f} mIU/L"
+                        unit = "mIU/L"
+                        ref_range = "0.4-4.0 mIU/L"
+
+                    status = random.choice(["normal", "abnormal", "critical"])
+
+                    lab_rows.append(dict(
+                        patient_id=patient_id,
+                        encounter_id=None,
+                        test_name=test_names[category],
+                        test_category=category,
+                        result_value=result_value,
+                        reference_range=ref_range,
+                        unit=unit,
+                        status=status,
+                        performed_date=test_date.date(),
+                        performed_by="Quest Diagnostics",
+                        notes=None
+                    ))
+
+            # Add immunizations for some patients
+            if random.random() < 0.7:  # 70% of patients have immunizations
+                num_vaccines = random.randint(1, 5)
+                vaccine_dates = generate_random_dates(dob + timedelta(days=365), datetime.now(), num_vaccines)
+                for vaccine, vaccine_date in zip(random.choices(VACCINES, k=num_vaccines), vaccine_dates):
+
+                    add_immunization(
+                        patient_id=patient_id,
+                        vaccine_name=vaccine[0],
+                        vaccine_type=vaccine[1],
+                        dose_number=random.randint(1, 3),
+                        administered_date=vaccine_date.date(),
+                        administered_by="Dr. Smith",
+                        next_due_date=vaccine_date + timedelta(days=random.randint(365, 1825)) if random.random() < 0.5 else None,
+                        lot_number=f"LOT{random.randint(1000000, 9999999)}",
+                        site=random.choice(["Left Arm", "Right Arm"])
+                    )
+
+        add_lab_results_bulk(lab_rows)
+
+        # Add appointments
+        print("📅 Creating sample appointments...")
+        # Generated entirely inside DuckDB: 1-3 appointments per patient within +/-30 days of today,
+        # on a quarter hour of a clinic hour, all with Dr. Smith (provider 1)
+        con.execute("""
+            WITH picked AS (
+                SELECT unnest(?) AS patient_id, 1 + floor(random() * 3)::INTEGER AS num_appointments
             )
+            INSERT INTO appointments (patient_id, provider_id, appointment_type, appointment_date,
+                                      duration, status, notes)
+            SELECT
+                patient_id,
+                1,
+                ['Consultation', 'Follow-up', 'Procedure', 'Vaccination'][1 + floor(random() * 4)::INTEGER],
+                CAST(current_date + (floor(random() * 61)::INTEGER - 30) AS TIMESTAMP)
+                    + to_hours([9, 10, 11, 14, 15, 16][1 + floor(random() * 6)::INTEGER])
+                    + to_minutes(15 * floor(random() * 4)::INTEGER),
+                [15, 30, 45, 60][1 + floor(random() * 4)::INTEGER],
+                'scheduled',
+                ['', 'Annual checkup', 'Follow-up required', 'New patient'][1 + floor(random() * 4)::INTEGER]
+            FROM picked, range(3) AS slots(slot)
+            WHERE slot < num_appointments
+        """, [patient_ids[:25]])  # For first 25 patients
+
+    # The appointments above bypassed add_appointment's counters
+    refresh_analytics()
 
     print(f"\n✅ Sample data initialization complete!")
     print(f"📊 Summary:")
@@ -1,20 +1,15 @@
 import streamlit as st
-import plotly.express as px
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 import pandas as pd
+import numpy as np
 from datetime import datetime, timedelta
-import base64
+from functools import lru_cache
 from typing import Dict, List, Optional
 
 # Modern UI Components and Styling
 
-def set_custom_theme():
-    """Set modern theme with dark/light mode support."""
-    theme = st.session_state.get("theme", "light")
+# Theme stylesheets are module constants so reruns only look them up
 
-    if theme == "dark":
-        st.markdown("""
+_DARK_CSS = """
         <style>
         .stApp {
             background-color: #1e1e1e;
@@ -47,9 +42,9 @@ def set_custom_theme():
             color: white;
         }
         </style>
-        """, unsafe_allow_html=True)
-    else:
-        st.markdown("""
+        """
+
+_LIGHT_CSS = """
         <style>
         .stButton>button {
             background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
@@ -119,23 +114,40 @@ def set_custom_theme():
             text-align: center;
         }
         </style>
-        """, unsafe_allow_html=True)
+        """
 
-def modern_metric_card(title: str, value: str, delta: Optional[str] = None,
-                      icon: Optional[str] = None, color: str = "blue"):
-    """Create a modern metric card with icon and gradient."""
-    colors = {
-        "blue": "#667eea",
-        "green": "#48bb78",
-        "red": "#f56565",
-        "purple": "#9f7aea",
-        "orange": "#ed8936"
-    }
+# Theme-independent rules, shipped with either stylesheet so components only emit their HTML
+_STATIC_CSS = """
+        <style>
+        @keyframes spin {
+            0% { transform: rotate(0deg); }
+            100% { transform: rotate(360deg); }
+        }
+        </style>
+        """
 
-    icon_html = f"📊" if icon else ""
+_THEME_CSS = {"dark": _DARK_CSS + _STATIC_CSS, "light": _LIGHT_CSS + _STATIC_CSS}
 
-    st.markdown(f"""
-    <div class="metric-card" style="border-left-color: {colors.get(color, '#667eea')};">
+def set_custom_theme():
+    """Set modern theme with dark/light mode support."""
+    theme = st.session_state.get("theme", "light")
+    st.markdown(_THEME_CSS.get(theme, _THEME_CSS["light"]), unsafe_allow_html=True)
+
+_CARD_COLORS = {
+    "blue": "#667eea",
+    "green": "#48bb78",
+    "red": "#f56565",
+    "purple": "#9f7aea",
+    "orange": "#ed8936"
+}
+
+@lru_cache(maxsize=512)
+def _metric_card_html(title: str, value: str, delta: Optional[str], has_icon: bool, color: str) -> str:
+    """HTML for a metric card, memoised since dashboards re-render the same KPIs every rerun."""
+    icon_html = f"📊" if has_icon else ""
+
+    return f"""
+    <div class="metric-card" style="border-left-color: {_CARD_COLORS.get(color, '#667eea')};">
         <div style="display: flex; justify-content: space-between; align-items: center;">
             <div>
                 <div style="font-size: 0.875rem; color: #718096; margin-bottom: 0.25rem;">{title}</div>
@@ -145,11 +157,23 @@ def modern_metric_card(title: str, value: str, delta: Optional[str] = None,
             <div style="font-size: 2rem; opacity: 0.7;">{icon_html}</div>
         </div>
     </div>
-    """, unsafe_allow_html=True)
+    """
+
+def modern_metric_card(title: str, value: str, delta: Optional[str] = None,
+                      icon: Optional[str] = None, color: str = "blue"):
+    """Create a modern metric card with icon and gradient."""
+    st.markdown(_metric_card_html(title, str(value), delta, bool(icon), color), unsafe_allow_html=True)
 
 def patient_summary_card(patient_data: Dict, last_encounter: Optional[Dict] = None):
     """Create a patient summary card with key information."""
-    age = datetime.now().year - patient_data['dob'].year if patient_data['dob'] else 'N/A'
+    age = patient_data.get('age')
+    if age is None or pd.isna(age):
+        dob = patient_data['dob']
+        if dob:
+            today = datetime.now()
+            age = today.year - dob.year - ((today.month, today.day) < (dob.month, dob.day))
+        else:
+            age = 'N/A'
 
     # Use container to create a card-like appearance
     with st.container():
@@ -181,14 +205,19 @@ def patient_summary_card(patient_data: Dict, last_encounter: Optional[Dict] = No
         with st.expander("📍 Address", expanded=False):
             st.info(patient_data['address'])
 
+_GENDER_COLORS = {
+    "Male": "#4299e1",
+    "Female": "#ed64a6",
+    "Other": "#9f7aea"
+}
+
 def get_gender_color(gender: str) -> str:
     """Get color based on gender."""
-    colors = {
-        "Male": "#4299e1",
-        "Female": "#ed64a6",
-        "Other": "#9f7aea"
-    }
-    return colors.get(gender, "#718096")
+    return _GENDER_COLORS.get(gender, "#718096")
+
+# Color mapping for encounter types; unknown types get position -1, which indexes the trailing grey
+_ENCOUNTER_TYPES = pd.Index(["Consultation", "Follow-up", "Emergency", "Procedure"])
+_ENCOUNTER_COLOR_LUT = np.array(["#667eea", "#48bb78", "#f56565", "#ed8936", "#718096"])
 
 def create_activity_timeline(encounters_df: pd.DataFrame):
     """Create an interactive timeline of patient encounters."""
@@ -196,6 +225,10 @@ def create_activity_timeline(encounters_df: pd.DataFrame):
         st.info("No encounters to display")
         return
 
+    # Plotly is imported on first use so pages without charts don't pay for it
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
+
     # Create timeline figure
     fig = make_subplots(
         rows=1, cols=1,
@@ -203,39 +236,37 @@ def create_activity_timeline(encounters_df: pd.DataFrame):
         vertical_spacing=0.1
     )
 
-    # Color mapping for encounter types
-    colors = {
-        "Consultation": "#667eea",
-        "Follow-up": "#48bb78",
-        "Emergency": "#f56565",
-        "Procedure": "#ed8936"
-    }
+    # One trace for every encounter; per-point colours and labels are passed as arrays
+    dates = pd.to_datetime(encounters_df['date'])
+    types = encounters_df['type'].fillna('').astype(str)
+    doctors = encounters_df['doctor'].fillna('').astype(str)
+    notes = encounters_df['notes'].fillna('').astype(str).str[:100]
+    text = types + "<br>" + dates.dt.strftime('%b %d, %Y') + "<br>Dr. " + doctors
+    hovertext = ("<b>" + types + "</b><br>Date: " + dates.dt.strftime('%Y-%m-%d')
+                 + "<br>Doctor: " + doctors + "<br>Notes: " + notes + "...")
 
-    for i, (_, encounter) in enumerate(encounters_df.iterrows()):
-        fig.add_trace(
-            go.Scatter(
-                x=[encounter['date']],
-                y=[i],
-                mode='markers+text',
-                marker=dict(
-                    size=20,
-                    color=colors.get(encounter['type'], '#718096'),
-                    symbol='circle',
-                    line=dict(width=2, color='white')
-                ),
-                text=f"{encounter['type']}<br>{encounter['date'].strftime('%b %d, %Y')}<br>Dr. {encounter['doctor']}",
-                textposition="top center",
-                hovertemplate=f"<b>{encounter['type']}</b><br>"
-                             f"Date: {encounter['date'].strftime('%Y-%m-%d')}<br>"
-                             f"Doctor: {encounter['doctor']}<br>"
-                             f"Notes: {encounter['notes'][:100]}...<extra></extra>",
-                name=encounter['type']
+    fig.add_trace(
+        go.Scattergl(
+            x=dates.to_numpy(),
+            y=np.arange(len(encounters_df)),
+            mode='markers+text',
+            marker=dict(
+                size=20,
+                color=_ENCOUNTER_COLOR_LUT[_ENCOUNTER_TYPES.get_indexer(encounters_df['type'])],
+                symbol='circle',
+                line=dict(width=2, color='white')
             ),
-            row=1, col=1
-        )
+            text=text.to_numpy(),
+            textposition="top center",
+            hovertext=hovertext.to_numpy(),
+            hovertemplate='%{hovertext}<extra></extra>'
+        ),
+        row=1, col=1
+    )
 
     fig.update_layout(
         height=400,
+        uirevision="activity-timeline",
         showlegend=False,
         yaxis=dict(showticklabels=False),
         xaxis=dict(title="Date"),
@@ -251,11 +282,34 @@ def create_activity_timeline(encounters_df: pd.DataFrame):
 
     st.plotly_chart(fig, use_container_width=True)
 
-def create_health_dashboard(vitals_df: pd.DataFrame, patient_age: int):
-    """Create a comprehensive health dashboard with vitals trends."""
-    if vitals_df.empty:
-        st.info("No vitals data available")
-        return
+VITALS_MAX_POINTS = 2000
+
+def _downsample(x, y, max_points: int = VITALS_MAX_POINTS) -> Dict:
+    """Scatter x/y kwargs, min/max-bucketed so long series stay under max_points without hiding spikes."""
+    n = len(y)
+    if n <= max_points:
+        return dict(x=x, y=y)
+    x = np.asarray(x)
+    y = pd.Series(y).to_numpy(dtype=np.float64, na_value=np.nan)
+    buckets = max_points // 2
+    bucket = np.arange(n) * buckets // n
+    starts = np.searchsorted(bucket, np.arange(buckets))
+    ends = np.searchsorted(bucket, np.arange(buckets), side='right') - 1
+    # Sorting by (bucket, value) puts each bucket's min first and max last; NaN never wins either
+    lows = np.lexsort((np.where(np.isnan(y), np.inf, y), bucket))[starts]
+    highs = np.lexsort((np.where(np.isnan(y), -np.inf, y), bucket))[ends]
+    keep = np.unique(np.concatenate([lows, highs]))
+    return dict(x=x[keep], y=y[keep])
+
+def _frame_fingerprint(df: pd.DataFrame) -> bytes:
+    """Full-content hash of a frame (values, index and column names) for cache keys."""
+    return pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes() + repr(tuple(df.columns)).encode()
+
+@st.cache_resource(show_spinner=False, max_entries=32, hash_funcs={pd.DataFrame: _frame_fingerprint})
+def _health_dashboard_figure(vitals_df: pd.DataFrame, patient_age: int):
+    """Build the vitals dashboard figure; reused across reruns while the vitals are unchanged."""
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
 
     # Create subplots for multiple vitals
     fig = make_subplots(
@@ -267,23 +321,28 @@ def create_health_dashboard(vitals_df: pd.DataFrame, patient_age: int):
 
     # Heart Rate
     fig.add_trace(
-        go.Scatter(x=vitals_df['timestamp'], y=vitals_df['heart_rate'],
+        go.Scattergl(**_downsample(vitals_df['timestamp'], vitals_df['heart_rate']),
                   mode='lines+markers', name='Heart Rate',
                   line=dict(color='#f56565', width=3)),
         row=1, col=1
     )
 
-    # Blood Pressure (split systolic/diastolic)
-    if 'bp' in vitals_df.columns:
-        vitals_df[['systolic', 'diastolic']] = vitals_df['bp'].str.split('/', expand=True).astype(float)
+    # Blood Pressure (stored as separate systolic/diastolic columns; legacy frames carry "120/80")
+    systolic = diastolic = None
+    if 'bp_sys' in vitals_df.columns:
+        systolic, diastolic = vitals_df['bp_sys'], vitals_df['bp_dia']
+    elif 'bp' in vitals_df.columns:
+        bp = vitals_df['bp'].str.extract(r'(\d+)\s*/\s*(\d+)').to_numpy(dtype=np.float32)
+        systolic, diastolic = bp[:, 0], bp[:, 1]
+    if systolic is not None:
         fig.add_trace(
-            go.Scatter(x=vitals_df['timestamp'], y=vitals_df['systolic'],
+            go.Scattergl(**_downsample(vitals_df['timestamp'], systolic),
                       mode='lines+markers', name='Systolic',
                       line=dict(color='#4299e1', width=3)),
             row=1, col=2
         )
         fig.add_trace(
-            go.Scatter(x=vitals_df['timestamp'], y=vitals_df['diastolic'],
+            go.Scattergl(**_downsample(vitals_df['timestamp'], diastolic),
                       mode='lines+markers', name='Diastolic',
                       line=dict(color='#48bb78', width=3)),
             row=1, col=2
@@ -292,17 +351,18 @@ def create_health_dashboard(vitals_df: pd.DataFrame, patient_age: int):
     # Temperature
     if 'temp' in vitals_df.columns:
         fig.add_trace(
-            go.Scatter(x=vitals_df['timestamp'], y=vitals_df['temp'],
+            go.Scattergl(**_downsample(vitals_df['timestamp'], vitals_df['temp']),
                       mode='lines+markers', name='Temperature',
                       line=dict(color='#ed8936', width=3)),
             row=2, col=1
         )
 
     # Summary statistics
-    latest_vitals = vitals_df.iloc[-1]
+    latest_hr = vitals_df['heart_rate'].iat[-1]
+    latest_temp = vitals_df['temp'].iat[-1] if 'temp' in vitals_df.columns else 0
     fig.add_trace(
         go.Bar(x=['Heart Rate', 'Temperature'],
-               y=[latest_vitals['heart_rate'], latest_vitals['temp'] if 'temp' in latest_vitals else 0],
+               y=[latest_hr, latest_temp],
                name='Latest Vitals',
                marker_color=['#f56565', '#ed8936']),
         row=2, col=2
@@ -310,26 +370,82 @@ def create_health_dashboard(vitals_df: pd.DataFrame, patient_age: int):
 
     fig.update_layout(
         height=800,
+        uirevision="health-dashboard",
         title_text="Health Analytics Dashboard",
         showlegend=True,
         plot_bgcolor='rgba(0,0,0,0.02)'
     )
 
-    st.plotly_chart(fig, use_container_width=True)
+    return fig
+
+def create_health_dashboard(vitals_df: pd.DataFrame, patient_age: int):
+    """Create a comprehensive health dashboard with vitals trends."""
+    if vitals_df.empty:
+        st.info("No vitals data available")
+        return
+
+    st.plotly_chart(_health_dashboard_figure(vitals_df, patient_age), use_container_width=True)
+
+SEARCH_MIN_CHARS = 2
+
+@st.cache_data(show_spinner=False)
+def _search_haystack(data: pd.DataFrame, search_columns: List[str]) -> pd.Series:
+    """Lower-cased search columns joined per row with a unit separator, so one scan covers them all."""
+    haystack = None
+    for column in search_columns:
+        values = data[column].astype(str).fillna('').str.lower()
+        haystack = values if haystack is None else haystack + '\x1f' + values
+    return haystack
 
 def smart_search_bar(data: pd.DataFrame, search_columns: List[str], key: str):
     """Create an intelligent search bar with autocomplete."""
     search_term = st.text_input("🔍 Search", key=f"search_{key}", placeholder="Type to search...")
 
-    if search_term:
-        mask = data[search_columns].apply(
-            lambda x: x.astype(str).str.contains(search_term, case=False, na=False)
-        ).any(axis=1)
-        filtered_data = data[mask]
+    # Single keystrokes would match nearly everything, so they don't filter yet
+    query = search_term.lower()
+    if len(query) < SEARCH_MIN_CHARS:
+        return data, ""
+
+    query_key, mask_key, data_key = f"_last_query_{key}", f"_last_mask_{key}", f"_last_data_{key}"
+    last_query = st.session_state.get(query_key)
+    last_mask = st.session_state.get(mask_key)
+    # The saved mask only applies to the same rows in the same order; a reload may change either
+    fingerprint = int(pd.util.hash_pandas_object(data[search_columns], index=True).sum())
+    if st.session_state.get(data_key) != fingerprint:
+        last_mask = None
+
+    if last_mask is not None and query == last_query:
+        mask = last_mask
     else:
-        filtered_data = data
-
-    return filtered_data, search_term
+        haystack = _search_haystack(data, search_columns)
+        if last_mask is not None and query.startswith(last_query):
+            # A longer query can only match a subset of the previous hits
+            haystack = haystack[last_mask]
+        # Literal substring match; the separator keeps matches from spanning two columns
+        mask = haystack.str.contains(query, regex=False, na=False).reindex(data.index, fill_value=False)
+        st.session_state[query_key] = query
+        st.session_state[mask_key] = mask
+        st.session_state[data_key] = fingerprint
+
+    return data[mask], search_term
+
+_NOTIFICATION_TEMPLATES = {
+    "success": """
+            <div class="alert-success">
+                ✅ {message} <span style="float: right; opacity: 0.7;">{time}</span>
+            </div>
+            """,
+    "warning": """
+            <div class="alert-warning">
+                ⚠️ {message} <span style="float: right; opacity: 0.7;">{time}</span>
+            </div>
+            """,
+    "info": """
+            <div style="background: #e3f2fd; border-radius: 8px; padding: 0.75rem; margin-bottom: 0.5rem;">
+                ℹ️ {message} <span style="float: right; opacity: 0.7;">{time}</span>
+            </div>
+            """,
+}
 
 def notification_system():
     """Display real-time notifications and alerts."""
@@ -338,34 +454,21 @@ def notification_system():
 
     # Add some sample notifications
     if not st.session_state.notifications:
+        now = datetime.now()
         st.session_state.notifications = [
-            {"type": "success", "message": "Patient John Doe scheduled for follow-up", "time": datetime.now()},
-            {"type": "warning", "message": "Lab results pending for Jane Smith", "time": datetime.now() - timedelta(hours=2)},
-            {"type": "info", "message": "System backup completed successfully", "time": datetime.now() - timedelta(hours=4)}
+            {"type": "success", "message": "Patient John Doe scheduled for follow-up", "time": now},
+            {"type": "warning", "message": "Lab results pending for Jane Smith", "time": now - timedelta(hours=2)},
+            {"type": "info", "message": "System backup completed successfully", "time": now - timedelta(hours=4)}
         ]
 
-    # Display notifications
-    for notification in st.session_state.notifications[-3:]:  # Show last 3
-        time_str = notification["time"].strftime("%H:%M")
-
-        if notification["type"] == "success":
-            st.markdown(f"""
-            <div class="alert-success">
-                ✅ {notification["message"]} <span style="float: right; opacity: 0.7;">{time_str}</span>
-            </div>
-            """, unsafe_allow_html=True)
-        elif notification["type"] == "warning":
-            st.markdown(f"""
-            <div class="alert-warning">
-                ⚠️ {notification["message"]} <span style="float: right; opacity: 0.7;">{time_str}</span>
-            </div>
-            """, unsafe_allow_html=True)
-        else:
-            st.markdown(f"""
-            <div style="background: #e3f2fd; border-radius: 8px; padding: 0.75rem; margin-bottom: 0.5rem;">
-                ℹ️ {notification["message"]} <span style="float: right; opacity: 0.7;">{time_str}</span>
-            </div>
-            """, unsafe_allow_html=True)
+    # Display the last 3 notifications in one markdown element
+    recent = st.session_state.notifications[-3:]
+    st.markdown("".join(
+        _NOTIFICATION_TEMPLATES.get(notification["type"], _NOTIFICATION_TEMPLATES["info"]).format(
+            message=notification["message"], time=notification["time"].strftime("%H:%M")
+        )
+        for notification in recent
+    ), unsafe_allow_html=True)
 
 def theme_toggle():
     """Add theme toggle button to sidebar."""
@@ -377,26 +480,21 @@ def theme_toggle():
         st.rerun()
 
 def loading_animation(message: str = "Loading..."):
-    """Show modern loading animation."""
+    """Show modern loading animation (the spin keyframes come from set_custom_theme)."""
     st.markdown(f"""
     <div style="text-align: center; padding: 2rem;">
         <div style="display: inline-block; width: 50px; height: 50px; border: 3px solid #f3f3f3;
                     border-top: 3px solid #667eea; border-radius: 50%; animation: spin 1s linear infinite;"></div>
         <p style="margin-top: 1rem; color: #718096;">{message}</p>
     </div>
-    <style>
-    @keyframes spin {{
-        0% {{ transform: rotate(0deg); }}
-        100% {{ transform: rotate(360deg); }}
-    }}
-    </style>
     """, unsafe_allow_html=True)
 
-def progress_bar_with_percentage(current: int, total: int, label: str = "Progress"):
-    """Create a modern progress bar with percentage."""
+@lru_cache(maxsize=256)
+def _progress_bar_html(current: int, total: int, label: str) -> str:
+    """HTML for a progress bar, memoised so unchanged progress skips the rebuild."""
     percentage = (current / total) * 100 if total > 0 else 0
 
-    st.markdown(f"""
+    return f"""
     <div style="margin-bottom: 1rem;">
         <div style="display: flex; justify-content: space-between; margin-bottom: 0.5rem;">
             <span style="font-weight: 600; color: #2d3748;">{label}</span>
@@ -407,4 +505,8 @@ def progress_bar_with_percentage(current: int, total: int, label: str = "Progres
                         height: 100%; width: {percentage}%; transition: width 0.3s ease;"></div>
         </div>
     </div>
-    """, unsafe_allow_html=True)
\ No newline at end of file
+    """
+
+def progress_bar_with_percentage(current: int, total: int, label: str = "Progress"):
+    """Create a modern progress bar with percentage."""
+    st.markdown(_progress_bar_html(current, total, label), unsafe_allow_html=True)
\ No newline at end of file